@@ -0,0 +1,84 @@
+"""
+Lookups and normalisation of the addresses exchanged with PayPal.
+
+Countries are read from a table held by each process, so that turning the
+addresses PayPal sends into Oscar addresses doesn't query the database.  The
+table is loaded on first use and dropped whenever a country is saved or
+deleted in this process.  Other processes reload theirs after
+PAYPAL_COUNTRY_TABLE_TTL seconds.
+"""
+import copy
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from localflavor.us import us_states
+from oscar.core.loading import get_model
+
+_WHITESPACE = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_countries = None
+_loaded_at = None
+
+
+def _normalize_key(value):
+    return _WHITESPACE.sub(' ', value).strip().lower()
+
+
+# US state names, abbreviations and codes, mapped to their 2 letter code
+_US_STATES = {_normalize_key(name): code for name, code in us_states.STATES_NORMALIZED.items()}
+
+
+def _load_countries():
+    Country = get_model('address', 'Country')
+    return {country.iso_3166_1_a2: country for country in Country.objects.all()}
+
+
+def _get_countries():
+    global _countries, _loaded_at
+    ttl = getattr(settings, 'PAYPAL_COUNTRY_TABLE_TTL', 60 * 60)
+    with _lock:
+        if _countries is None or (ttl is not None and time.monotonic() - _loaded_at > ttl):
+            _countries = _load_countries()
+            _loaded_at = time.monotonic()
+        return _countries
+
+
+def clear_countries(**kwargs):
+    """
+    Drop the country table, which is reloaded on next use.
+    """
+    global _countries
+    with _lock:
+        _countries = None
+
+
+post_save.connect(clear_countries, sender='address.Country', dispatch_uid='paypal.addresses')
+post_delete.connect(clear_countries, sender='address.Country', dispatch_uid='paypal.addresses')
+
+
+def get_country(iso_3166_1_a2):
+    """
+    Return the country with the ISO 3166-1 code, raising Country.DoesNotExist
+    if there is none, like Country.objects.get(iso_3166_1_a2=...).
+    """
+    country = _get_countries().get((iso_3166_1_a2 or '').upper())
+    if country is None:
+        Country = get_model('address', 'Country')
+        raise Country.DoesNotExist("No country with code %r" % iso_3166_1_a2)
+    # The table's instances are shared between requests
+    return copy.copy(country)
+
+
+def normalize_state(country_code, state):
+    """
+    Return the state of an address in the form PayPal expects.  US states are
+    turned into their 2 letter code, as PayPal rejects addresses whose state
+    and zipcode don't match (error 10736).
+    """
+    if country_code == 'US' and state:
+        return _US_STATES.get(_normalize_key(state), state)
+    return state
@@ -0,0 +1,188 @@
+"""
+Response time, error rate and volume of the calls made to PayPal, per method
+and time period.
+
+Statistics are aggregated by the database.  Latency percentiles are
+interpolated from a histogram of response times (see BIN_EDGES), which every
+database can count and which can be summed across periods, so they are
+approximate.  For large tables, ``paypal_rollup_response_times`` keeps
+per-hour aggregates in ResponseTimeRollup that can be read instead.
+"""
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Trunc
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views import generic
+
+from paypal.express.models import ExpressTransaction
+from paypal.forms import ResponseTimeForm
+from paypal.models import ResponseTimeRollup
+from paypal.payflow.models import PayflowTransaction
+
+EXPRESS, PAYFLOW = 'express', 'payflow'
+
+HOUR, DAY = 'hour', 'day'
+
+# Upper edges, in milliseconds, of the response time histogram bins.  A last
+# bin holds slower calls.
+BIN_EDGES = (25, 50, 100, 150, 200, 300, 400, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000, 30000)
+
+# Model, method field and failed-call filter of each source
+SOURCES = {
+    EXPRESS: (ExpressTransaction, 'method',
+              ~Q(ack__in=(ExpressTransaction.SUCCESS, ExpressTransaction.SUCCESS_WITH_WARNING))),
+    PAYFLOW: (PayflowTransaction, 'trxtype', ~Q(result__in=PayflowTransaction.APPROVED_RESULTS)),
+}
+
+
+def _aggregate_transactions(source, start, end, period):
+    model, method_field, error_filter = SOURCES[source]
+    queryset = model.objects.filter(date_created__gte=start, date_created__lt=end)
+    bins = {
+        'le_%d' % i: Count('id', filter=Q(response_time__lte=edge))
+        for i, edge in enumerate(BIN_EDGES)
+    }
+    rows = queryset.order_by().values(
+        period_start=Trunc('date_created', period),
+        call_method=F(method_field),
+    ).annotate(
+        count=Count('id'),
+        error_count=Count('id', filter=error_filter),
+        total_response_time=Sum('response_time'),
+        **bins
+    )
+    for row in rows:
+        row['method'] = row.pop('call_method')
+        # Convert the cumulative counts into per-bin counts
+        cumulative = [row.pop('le_%d' % i) for i in range(len(BIN_EDGES))] + [row['count']]
+        row['histogram'] = [cumulative[0]] + [b - a for a, b in zip(cumulative, cumulative[1:])]
+        yield row
+
+
+def _aggregate_rollups(source, start, end, period):
+    rows = {}
+    rollups = ResponseTimeRollup.objects.filter(source=source, period_start__gte=start, period_start__lt=end)
+    for rollup in rollups:
+        period_start = rollup.period_start
+        if period == DAY:
+            if timezone.is_aware(period_start):
+                period_start = timezone.localtime(period_start)
+            period_start = period_start.replace(hour=0)
+        row = rows.setdefault((period_start, rollup.method), {
+            'period_start': period_start, 'method': rollup.method, 'count': 0, 'error_count': 0,
+            'total_response_time': 0, 'histogram': [0] * (len(BIN_EDGES) + 1)})
+        row['count'] += rollup.count
+        row['error_count'] += rollup.error_count
+        row['total_response_time'] += rollup.total_response_time
+        row['histogram'] = [a + b for a, b in zip(row['histogram'], rollup.histogram)]
+    return [rows[key] for key in sorted(rows)]
+
+
+def percentile(histogram, fraction):
+    """
+    Estimate a percentile from histogram counts, interpolating linearly
+    within the bin it falls in.
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    target = fraction * total
+    seen = 0
+    for i, count in enumerate(histogram):
+        if count and seen + count >= target:
+            if i == len(BIN_EDGES):
+                return float(BIN_EDGES[-1])
+            lower = BIN_EDGES[i - 1] if i else 0
+            return lower + (BIN_EDGES[i] - lower) * (target - seen) / count
+        seen += count
+    return float(BIN_EDGES[-1])
+
+
+def get_response_time_stats(source, start, end, period=HOUR, use_rollups=False):
+    """
+    Return a list of dicts with the call volume, error rate, mean and p50,
+    p90 and p99 response times (in milliseconds) of each method for each
+    period between start and end.
+    """
+    if use_rollups:
+        rows = _aggregate_rollups(source, start, end, period)
+    else:
+        rows = _aggregate_transactions(source, start, end, period)
+    stats = []
+    for row in rows:
+        count = row['count']
+        stats.append({
+            'period_start': row['period_start'],
+            'method': row['method'],
+            'count': count,
+            'error_count': row['error_count'],
+            'error_rate': row['error_count'] / count if count else 0,
+            'mean': (row['total_response_time'] or 0) / count if count else None,
+            'p50': percentile(row['histogram'], 0.5),
+            'p90': percentile(row['histogram'], 0.9),
+            'p99': percentile(row['histogram'], 0.99),
+        })
+    return stats
+
+
+def update_rollups(source, since=None, until=None):
+    """
+    Recompute the hourly rollups of a source from ``since`` (by default the
+    last rolled up hour, as it may have been incomplete) to the start of the
+    current hour.  Return the number of rollups written.
+    """
+    until = until or timezone.now().replace(minute=0, second=0, microsecond=0)
+    if since is None:
+        last = ResponseTimeRollup.objects.filter(source=source).order_by('-period_start').first()
+        if last is not None:
+            since = last.period_start
+        else:
+            model = SOURCES[source][0]
+            first = model.objects.order_by('date_created').values_list('date_created', flat=True).first()
+            if first is None:
+                return 0
+            since = first.replace(minute=0, second=0, microsecond=0)
+    count = 0
+    for row in _aggregate_transactions(source, since, until, HOUR):
+        ResponseTimeRollup.objects.update_or_create(
+            source=source, method=row['method'], period_start=row['period_start'],
+            defaults={
+                'count': row['count'],
+                'error_count': row['error_count'],
+                'total_response_time': row['total_response_time'] or 0,
+                'histogram': row['histogram'],
+            })
+        count += 1
+    return count
+
+
+class ResponseTimeView(generic.TemplateView):
+    """
+    Dashboard page of the response time statistics of a source.  With
+    ``?format=json`` the statistics are returned as JSON.
+    """
+    source = None
+    title = None
+    template_name = 'paypal/dashboard/response_times.html'
+
+    def get_stats(self):
+        self.form = ResponseTimeForm(self.request.GET)
+        start, end = self.form.get_range()
+        period = HOUR
+        use_rollups = False
+        if self.form.is_valid():
+            period = self.form.cleaned_data['period'] or HOUR
+            use_rollups = self.form.cleaned_data['rollups']
+        return get_response_time_stats(self.source, start, end, period, use_rollups)
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'stats': self.get_stats()})
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['stats'] = self.get_stats()
+        ctx['form'] = self.form
+        ctx['title'] = self.title
+        return ctx
@@ -0,0 +1,307 @@
+"""
+Persistence of the audit rows (ExpressTransaction, PayflowTransaction) written
+for every gateway call.
+
+By default rows are saved straight away.  With PAYPAL_AUDIT_WRITE_BEHIND
+enabled, they are queued in an in-process buffer instead and written with
+``bulk_create`` once PAYPAL_AUDIT_BATCH_SIZE rows are queued or
+PAYPAL_AUDIT_FLUSH_INTERVAL seconds have passed.  Queued rows are also appended
+to a spool file in PAYPAL_AUDIT_SPOOL_DIR (when set) so that they can be
+replayed with the ``paypal_replay_audit_spool`` command if the process dies
+before flushing.  A row which can't be written is retried on later flushes
+and dropped (and logged) after PAYPAL_AUDIT_MAX_ATTEMPTS attempts, so that it
+doesn't hold back the rows queued after it.
+
+Note that deferred rows have no primary key when they are returned to the
+caller, their ``date_created`` is the time they were flushed and queries don't
+see them until then.  Rows which later calls look up (see the models'
+``is_looked_up_later``) are therefore always saved straight away.
+"""
+import atexit
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import serializers
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+
+from paypal import tracing
+
+logger = logging.getLogger('paypal.audit')
+
+_local = threading.local()
+
+
+def write_behind_enabled():
+    return getattr(settings, 'PAYPAL_AUDIT_WRITE_BEHIND', False) and not getattr(_local, 'immediate', False)
+
+
+@contextmanager
+def immediate():
+    """
+    Save audit rows synchronously within the block, eg when the caller needs
+    the primary key of the returned transaction.
+    """
+    previous = getattr(_local, 'immediate', False)
+    _local.immediate = True
+    try:
+        yield
+    finally:
+        _local.immediate = previous
+
+
+SPOOL_PREFIX, SPOOL_SUFFIX = 'paypal-audit-', '.jsonl'
+
+
+def _serialize(instance):
+    return serializers.serialize('json', [instance])
+
+
+def _deserialize(line):
+    return [obj.object for obj in serializers.deserialize('json', line)]
+
+
+def _group_by_model(instances):
+    by_model = {}
+    for instance in instances:
+        by_model.setdefault(instance.__class__, []).append(instance)
+    return by_model
+
+
+def _bulk_create(instances):
+    # All or nothing, so that rows requeued after a failure are not written
+    # twice
+    with transaction.atomic():
+        for model, model_instances in _group_by_model(instances).items():
+            model.objects.bulk_create(model_instances)
+
+
+def _exclude_saved(instances, batch_size=500):
+    """
+    Return the instances whose audit_id is not in the database yet.
+    """
+    unsaved = []
+    for model, model_instances in _group_by_model(instances).items():
+        saved = set()
+        for start in range(0, len(model_instances), batch_size):
+            audit_ids = [instance.audit_id for instance in model_instances[start:start + batch_size]]
+            saved.update(model.objects.filter(audit_id__in=audit_ids).values_list('audit_id', flat=True))
+        unsaved.extend(instance for instance in model_instances if instance.audit_id not in saved)
+    return unsaved
+
+
+class AuditBuffer:
+
+    def __init__(self):
+        self.pending = []
+        # Failed writes of each queued row, by audit_id
+        self.attempts = {}
+        self.lock = threading.RLock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self._spool_pid = None
+        self._spool_name = None
+
+    def get_spool_path(self):
+        """
+        Return the path of this process's spool file, or None if spooling is
+        disabled.
+
+        The name includes a random part as well as the PID, so that a process
+        reusing the PID of one that crashed never appends to, rewrites or
+        removes the crashed process's spool.
+        """
+        spool_dir = getattr(settings, 'PAYPAL_AUDIT_SPOOL_DIR', None)
+        if not spool_dir:
+            return None
+        pid = os.getpid()
+        if self._spool_pid != pid:
+            # First use, or a child forked from the process that named it
+            self._spool_pid = pid
+            self._spool_name = '%s%s-%s%s' % (SPOOL_PREFIX, pid, uuid.uuid4().hex, SPOOL_SUFFIX)
+        return os.path.join(spool_dir, self._spool_name)
+
+    def add(self, instance):
+        instance.mask_sensitive_data()
+        instance.audit_id = uuid.uuid4()
+        with self.lock:
+            self.pending.append(instance)
+            spool_path = self.get_spool_path()
+            if spool_path:
+                with open(spool_path, 'a') as spool:
+                    spool.write(_serialize(instance) + '\n')
+            self._ensure_flusher()
+            if len(self.pending) >= getattr(settings, 'PAYPAL_AUDIT_BATCH_SIZE', 100):
+                self.wakeup.set()
+
+    def flush(self):
+        """
+        Write all queued rows and return how many were written.
+
+        If the batch can't be written, its rows are written one by one.  Rows
+        which fail because the database is unavailable stay queued (and
+        spooled) for the next flush.  A row which fails on its own is retried
+        on the following flushes and dropped once it failed
+        PAYPAL_AUDIT_MAX_ATTEMPTS times.
+        """
+        with self.lock:
+            instances, self.pending = self.pending, []
+        if not instances:
+            return 0
+        # The database write happens outside the lock so that gateway calls
+        # queueing new rows never wait on it.
+        try:
+            _bulk_create(instances)
+        except Exception:
+            logger.exception("Unable to write %d PayPal audit rows", len(instances))
+            written, requeued = self._write_one_by_one(instances)
+        else:
+            written, requeued = len(instances), []
+        with self.lock:
+            self.pending = requeued + self.pending
+            if len(requeued) < len(instances):
+                self._rewrite_spool()
+        return written
+
+    def _write_one_by_one(self, instances):
+        """
+        Write each row on its own, so that a row which can't be written
+        doesn't hold back the others.  Return the number of rows written and
+        the rows to requeue.
+        """
+        max_attempts = getattr(settings, 'PAYPAL_AUDIT_MAX_ATTEMPTS', 3)
+        written, requeued = 0, []
+        for index, instance in enumerate(instances):
+            try:
+                _bulk_create([instance])
+            except (OperationalError, InterfaceError):
+                # The database is unavailable, which is no fault of the row
+                requeued.extend(instances[index:])
+                break
+            except Exception:
+                attempts = self.attempts.get(instance.audit_id, 0) + 1
+                if attempts < max_attempts:
+                    self.attempts[instance.audit_id] = attempts
+                    requeued.append(instance)
+                else:
+                    self.attempts.pop(instance.audit_id, None)
+                    logger.exception(
+                        "Dropping PayPal audit row %s %s after %d failed attempts",
+                        instance._meta.label, instance.audit_id, attempts)
+            else:
+                self.attempts.pop(instance.audit_id, None)
+                written += 1
+        return written, requeued
+
+    def _rewrite_spool(self):
+        spool_path = self.get_spool_path()
+        if not spool_path:
+            return
+        if not self.pending:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+            return
+        with open(spool_path, 'w') as spool:
+            for instance in self.pending:
+                spool.write(_serialize(instance) + '\n')
+
+    def _ensure_flusher(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name='paypal-audit-flusher', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(getattr(settings, 'PAYPAL_AUDIT_FLUSH_INTERVAL', 1.0))
+            self.wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+buffer = AuditBuffer()
+atexit.register(buffer.flush)
+
+
+@tracing.traced('paypal.audit.save')
+def save(instance):
+    """
+    Save an audit row, either immediately or through the write-behind buffer.
+    """
+    if write_behind_enabled() and not instance.is_looked_up_later:
+        buffer.add(instance)
+    else:
+        instance.save()
+    return instance
+
+
+def flush():
+    return buffer.flush()
+
+
+def _process_is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_orphaned(path):
+    """
+    Whether the process which wrote a spool file is gone.
+    """
+    if path == buffer.get_spool_path():
+        return False
+    # Files are named paypal-audit-<pid>-<random>.jsonl (or
+    # paypal-audit-<pid>.jsonl by earlier versions)
+    name = os.path.basename(path)[len(SPOOL_PREFIX):-len(SPOOL_SUFFIX)]
+    try:
+        pid = int(name.split('-')[0])
+    except ValueError:
+        return False
+    # Another file with this process's PID was left by a process which died
+    # before it was started.  A file whose PID has been reused by another
+    # running process is only replayed once that process exits.
+    return pid == os.getpid() or not _process_is_running(pid)
+
+
+def replay_spool():
+    """
+    Write the rows left in spool files by processes which are no longer
+    running, then remove those files.  Return the number of rows written.
+
+    Rows already in the database (eg because the process died between
+    writing them and rewriting its spool) are skipped.
+    """
+    spool_dir = getattr(settings, 'PAYPAL_AUDIT_SPOOL_DIR', None)
+    if not spool_dir or not os.path.isdir(spool_dir):
+        return 0
+    count = 0
+    for filename in sorted(os.listdir(spool_dir)):
+        if not (filename.startswith(SPOOL_PREFIX) and filename.endswith(SPOOL_SUFFIX)):
+            continue
+        path = os.path.join(spool_dir, filename)
+        if not _is_orphaned(path):
+            continue
+        instances = []
+        with open(path) as spool:
+            for line in spool:
+                if not line.strip():
+                    continue
+                try:
+                    instances.extend(_deserialize(line))
+                except serializers.base.DeserializationError:
+                    # Most likely a line truncated by the crash
+                    logger.warning("Skipping unreadable line in %s", path)
+        instances = _exclude_saved(instances)
+        _bulk_create(instances)
+        os.remove(path)
+        count += len(instances)
+    return count
@@ -1,8 +1,19 @@
+import re
+from decimal import Decimal as D
+from decimal import InvalidOperation
 from urllib.parse import parse_qsl
 
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from paypal.fields import JSONTextField
+
+# Matches repeated response fields such as L_ERRORCODE0 or L_SHIPPINGOPTIONNAME1
+INDEXED_KEY = re.compile(r'^L_([A-Z0-9_]+?)(\d+)$')
+
+# Marks a response which hasn't been parsed yet (raw_response may be None)
+_UNSET = object()
+
 
 class ResponseModel(models.Model):
 
@@ -10,8 +21,17 @@ class ResponseModel(models.Model):
     raw_request = models.TextField(max_length=512)
     raw_response = models.TextField(max_length=512)
 
+    # The parsed response, so that fields can be read or queried without
+    # parsing raw_response.  Null for rows created before it was introduced
+    # and not yet backfilled.
+    response_data = JSONTextField(null=True, blank=True, editable=False)
+
     response_time = models.FloatField(help_text=_("Response time in milliseconds"))
 
+    # Set on rows queued by the audit write-behind buffer, so that replaying a
+    # spool file never inserts a row twice
+    audit_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+
     date_created = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -40,13 +60,64 @@ class ResponseModel(models.Model):
             rows.append('<dt>%s</dt><dd>%s</dd>' % (k, v[0]))
         return '<dl>%s</dl>' % ''.join(rows)
 
+    def _parse_response(self):
+        """
+        Return the response as a dict mapping each key to a list holding its
+        value, read from ``response_data`` or, for rows which predate it,
+        parsed from the raw response.  The result is cached on the instance,
+        keyed on its source so that it is rebuilt if that changes.
+        """
+        source = self.response_data if self.response_data is not None else self.raw_response
+        if getattr(self, '_parsed_source', _UNSET) is not source:
+            if isinstance(source, dict):
+                pairs = source.items()
+            else:
+                pairs = parse_qsl(source)
+            ctx = {}
+            indexed = {}
+            for key, val in pairs:
+                ctx[key] = [val]
+                match = INDEXED_KEY.match(key)
+                if match:
+                    name, index = match.groups()
+                    prefix, __, name = name.rpartition('_')
+                    group = indexed.setdefault(prefix + '_' if prefix else '', {})
+                    group.setdefault(int(index), {})[name] = val
+            self._context = ctx
+            self._indexed = {
+                prefix: [group[index] for index in sorted(group)] for prefix, group in indexed.items()}
+            self._parsed_source = source
+        return self._context
+
     @property
     def context(self):
-        ctx = {}
-        for key, val in parse_qsl(self.raw_response):
-            ctx[key] = [val]
-        return ctx
+        return self._parse_response()
 
     def value(self, key, default=None):
-        ctx = self.context
+        ctx = self._parse_response()
         return ctx[key][0] if key in ctx else default
+
+    def decimal(self, key, default=None):
+        """
+        Return a response value as a Decimal, or the default if it is missing
+        or not a number.
+        """
+        value = self.value(key)
+        if value is None:
+            return default
+        try:
+            return D(value)
+        except InvalidOperation:
+            return default
+
+    def indexed_values(self, prefix=''):
+        """
+        Return the repeated ``L_<prefix><NAME><n>`` response fields as a list
+        of dicts, one per index, mapping NAME to its value.  Fields are grouped
+        by the prefix up to the last underscore of their name, so eg the errors
+        of a failed call (``indexed_values()``) are apart from the basket lines
+        (``indexed_values('PAYMENTREQUEST_0_')``):
+        ``[{'ERRORCODE': '10001', 'LONGMESSAGE': '...'}, ...]``.
+        """
+        self._parse_response()
+        return self._indexed.get(prefix, [])
@@ -0,0 +1,183 @@
+"""
+Bulk capture, void and refund of previously authorised payments.
+
+Operations run on a bounded thread pool, with the calls to each PayPal
+integration rate limited, and results are streamed back as they complete so
+that thousands of references can be processed in constant memory.
+"""
+import csv
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+CAPTURE, VOID, REFUND = 'capture', 'void', 'refund'
+
+# Facade functions used for each integration.  Each one takes the reference
+# given on the command line: a token for Express and Express Checkout, an
+# order number for Payflow.
+OPERATIONS = {
+    'express': {
+        CAPTURE: 'paypal.express.facade.capture_authorization',
+        VOID: 'paypal.express.facade.void_authorization',
+        REFUND: 'paypal.bulk.refund_express_transaction',
+    },
+    'payflow': {
+        CAPTURE: 'paypal.payflow.facade.delayed_capture',
+        VOID: 'paypal.bulk.void_payflow_authorization',
+        REFUND: 'paypal.payflow.facade.credit',
+    },
+    'express_checkout': {
+        CAPTURE: 'paypal.express_checkout.facade.capture_order',
+        VOID: 'paypal.express_checkout.facade.void_authorization',
+        REFUND: 'paypal.express_checkout.facade.refund_order',
+    },
+}
+
+BulkResult = namedtuple('BulkResult', ['reference', 'success', 'result', 'error', 'duration'])
+
+
+def refund_express_transaction(token):
+    """
+    Refund the full amount of an Express transaction.
+    """
+    from paypal.express.facade import refund_transaction
+    from paypal.express.gateway import DO_EXPRESS_CHECKOUT
+    from paypal.express.models import ExpressTransaction
+
+    txn = ExpressTransaction.objects.get(token=token, method=DO_EXPRESS_CHECKOUT)
+    return refund_transaction(token, txn.amount, txn.currency)
+
+
+def void_payflow_authorization(order_number):
+    """
+    Void the authorisation transaction of a Payflow order.
+    """
+    from paypal.payflow import codes, facade, models
+
+    auth_txn = models.PayflowTransaction.objects.get(comment1=order_number, trxtype=codes.AUTHORIZATION)
+    return facade.void(order_number, auth_txn.pnref)
+
+
+def get_operation(integration, operation):
+    try:
+        return import_string(OPERATIONS[integration][operation])
+    except KeyError:
+        raise ImproperlyConfigured(
+            "'%s' is not a valid operation for the '%s' integration" % (operation, integration))
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter allowing at most ``rate`` calls per second.  A rate of
+    ``None`` disables limiting.
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_call = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            call_at = max(now, self.next_call)
+            self.next_call = call_at + self.interval
+        if call_at > now:
+            time.sleep(call_at - now)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(integration, rate=None):
+    """
+    Return the limiter shared by every bulk run against an integration (ie a
+    PayPal host).  Rates default to the PAYPAL_BULK_RATE_LIMITS setting.
+    """
+    if rate is None:
+        rate = getattr(settings, 'PAYPAL_BULK_RATE_LIMITS', {}).get(integration)
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get((integration, rate))
+        if limiter is None:
+            limiter = _rate_limiters[(integration, rate)] = RateLimiter(rate)
+    return limiter
+
+
+def _run_one(fn, reference, rate_limiter):
+    rate_limiter.wait()
+    start_time = time.time()
+    try:
+        result = fn(reference)
+    except Exception as e:
+        return BulkResult(reference, False, None, str(e) or e.__class__.__name__, time.time() - start_time)
+    else:
+        return BulkResult(reference, True, result, None, time.time() - start_time)
+    finally:
+        close_old_connections()
+
+
+def run_bulk_operation(integration, operation, references, max_workers=None, rate=None):
+    """
+    Run an operation for each reference and yield a BulkResult per reference,
+    in completion order.
+
+    At most ``max_workers * 2`` calls are queued at any time so memory use
+    doesn't grow with the number of references.
+    """
+    fn = get_operation(integration, operation)
+    if max_workers is None:
+        max_workers = getattr(settings, 'PAYPAL_BULK_MAX_WORKERS', 8)
+    rate_limiter = get_rate_limiter(integration, rate)
+
+    references = iter(references)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_workers * 2:
+                try:
+                    reference = next(references)
+                except StopIteration:
+                    exhausted = True
+                else:
+                    pending.add(executor.submit(_run_one, fn, reference, rate_limiter))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def write_report(results, fileobj, batch_size=500):
+    """
+    Write results as CSV, flushing every ``batch_size`` rows.  Return the
+    number of successful and failed operations.
+    """
+    writer = csv.writer(fileobj)
+    writer.writerow(['reference', 'success', 'result', 'error', 'duration'])
+    succeeded = failed = 0
+    batch = []
+    for result in results:
+        if result.success:
+            succeeded += 1
+        else:
+            failed += 1
+        batch.append([
+            result.reference, int(result.success), '' if result.result is None else str(result.result),
+            result.error or '', '%.3f' % result.duration])
+        if len(batch) >= batch_size:
+            writer.writerows(batch)
+            fileobj.flush()
+            batch = []
+    writer.writerows(batch)
+    fileobj.flush()
+    return succeeded, failed
@@ -0,0 +1,133 @@
+"""
+Circuit breakers around the PayPal endpoints.
+
+When an endpoint fails or slows down, every checkout would otherwise wait for
+its own call to fail.  Each integration (``'express'``, ``'payflow'`` and
+``'express_checkout'``) has a breaker, whose state is kept in the Django
+cache so that all processes sharing the cache share it:
+
+closed
+    Calls go through.  Calls, failures (connection errors, timeouts and
+    RETRY_STATUSES responses) and slow calls are counted over a window; once
+    enough calls were made and the failure or slow call rate reaches its
+    threshold, the breaker opens.
+open
+    Calls fail straight away with CircuitOpen, for PAYPAL_CIRCUIT_RESET_TIMEOUT
+    seconds.
+half-open
+    Then a few probe calls are let through.  A successful probe closes the
+    breaker, a failed one opens it again.
+
+The counters are updated with the cache's atomic ``add`` and ``incr``, so
+calls made concurrently in other processes are counted too.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+
+from paypal import exceptions
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class CircuitOpen(exceptions.PayPalError):
+    pass
+
+
+def is_enabled():
+    return getattr(settings, 'PAYPAL_CIRCUIT_BREAKER', False)
+
+
+def _get_cache():
+    return caches[getattr(settings, 'PAYPAL_CIRCUIT_CACHE', 'default')]
+
+
+class CircuitBreaker:
+
+    def __init__(self, name):
+        self.name = name
+        self.cache = _get_cache()
+        self.window = getattr(settings, 'PAYPAL_CIRCUIT_WINDOW', 60)
+        self.minimum_calls = getattr(settings, 'PAYPAL_CIRCUIT_MINIMUM_CALLS', 10)
+        self.failure_rate = getattr(settings, 'PAYPAL_CIRCUIT_FAILURE_RATE', 0.5)
+        self.slow_call_duration = getattr(settings, 'PAYPAL_CIRCUIT_SLOW_CALL_DURATION', 10.0)
+        self.slow_call_rate = getattr(settings, 'PAYPAL_CIRCUIT_SLOW_CALL_RATE', 0.5)
+        self.reset_timeout = getattr(settings, 'PAYPAL_CIRCUIT_RESET_TIMEOUT', 30)
+        self.probes = getattr(settings, 'PAYPAL_CIRCUIT_PROBES', 1)
+
+    def _key(self, *parts):
+        return ':'.join(('paypal', 'circuit', self.name) + tuple(str(part) for part in parts))
+
+    def _window_keys(self):
+        window = int(time.time() // self.window)
+        return [self._key(window, counter) for counter in ('calls', 'failures', 'slow')]
+
+    def _incr(self, key, timeout):
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # The key expired in between
+            self.cache.add(key, 1, timeout)
+            return 1
+
+    def get_state(self):
+        opened_at = self.cache.get(self._key('opened'))
+        if opened_at is None:
+            return CLOSED
+        if time.time() - opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    def before_call(self):
+        """
+        Raise CircuitOpen if no call may be made now.  Return whether the call
+        is a probe of a half-open breaker.
+        """
+        state = self.get_state()
+        if state == CLOSED:
+            return False
+        if state == HALF_OPEN:
+            # The probe slots are taken until the probes end, or expire with
+            # the reset timeout if they never do
+            if self._incr(self._key('probes'), self.reset_timeout) <= self.probes:
+                return True
+        raise CircuitOpen(_("PayPal is currently unavailable - please try again later"))
+
+    def record(self, success, duration, probe=False):
+        """
+        Record the outcome of a call which took ``duration`` seconds.
+        """
+        if probe:
+            if success:
+                self.close()
+            else:
+                self.open()
+            return
+        calls_key, failures_key, slow_key = self._window_keys()
+        timeout = self.window * 2
+        calls = self._incr(calls_key, timeout)
+        failures = self._incr(failures_key, timeout) if not success else self.cache.get(failures_key, 0)
+        slow = self._incr(slow_key, timeout) if duration >= self.slow_call_duration else self.cache.get(slow_key, 0)
+        if calls >= self.minimum_calls and (
+                failures / calls >= self.failure_rate or slow / calls >= self.slow_call_rate):
+            self.open()
+
+    def open(self):
+        self.cache.set(self._key('opened'), time.time(), None)
+        self.cache.delete(self._key('probes'))
+
+    def close(self):
+        self.cache.delete_many([self._key('opened'), self._key('probes')] + self._window_keys())
+
+
+def get_breaker(name):
+    """
+    Return the breaker of an integration, or None when the breakers are
+    disabled or ``name`` is None.
+    """
+    if name is None or not is_enabled():
+        return None
+    return CircuitBreaker(name)
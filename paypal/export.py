@@ -0,0 +1,146 @@
+"""
+Streaming export of transactions as CSV or JSON lines.
+
+Rows are read with a server-side cursor where the database supports one and
+written out as they are read, optionally gzipped on the fly, so memory use
+doesn't depend on the number of rows exported.
+"""
+import csv
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from django.views import generic
+
+CSV, JSONL = 'csv', 'jsonl'
+FORMATS = {
+    CSV: 'text/csv',
+    JSONL: 'application/x-ndjson',
+}
+
+# Model, exported fields and search form (the dashboard's) of each integration.
+# The raw request and response are left out.
+EXPORTS = {
+    'express': (
+        'paypal.express.models.ExpressTransaction',
+        ('id', 'date_created', 'method', 'version', 'ack', 'amount', 'currency', 'token', 'transaction_id',
+         'correlation_id', 'error_code', 'error_message', 'response_time'),
+        'paypal.express.dashboard.forms.ExpressTransactionSearchForm',
+    ),
+    'express_checkout': (
+        'paypal.express_checkout.models.ExpressCheckoutTransaction',
+        ('id', 'date_created', 'order_id', 'authorization_id', 'capture_id', 'refund_id', 'payer_id', 'email',
+         'amount', 'currency', 'status', 'intent'),
+        'paypal.express_checkout.dashboard.forms.ExpressCheckoutTransactionSearchForm',
+    ),
+    'payflow': (
+        'paypal.payflow.models.PayflowTransaction',
+        ('id', 'date_created', 'comment1', 'trxtype', 'tender', 'amount', 'pnref', 'ppref', 'result', 'respmsg',
+         'authcode', 'cvv2match', 'avsaddr', 'avszip', 'response_time'),
+        'paypal.payflow.dashboard.forms.PayflowTransactionSearchForm',
+    ),
+}
+
+
+def get_export_rows(integration, filters=None, chunk_size=2000):
+    """
+    Return the exported field names and an iterator over the rows (tuples)
+    of an integration's transactions, filtered with the dashboard search
+    form.  Raise ValidationError if the filters aren't valid.
+    """
+    try:
+        model_path, fields, form_path = EXPORTS[integration]
+    except KeyError:
+        raise ImproperlyConfigured("'%s' is not a valid integration" % integration)
+    queryset = import_string(model_path).objects.order_by('pk')
+    form = import_string(form_path)(filters or {})
+    if not form.is_valid():
+        raise ValidationError(form.errors.as_text())
+    queryset = form.filter_queryset(queryset)
+    return fields, queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """
+    File-like object returning what is written to it, for csv.writer.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(fields, rows, batch_size=500):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow(row))
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def iter_jsonl(fields, rows, batch_size=500):
+    encoder = DjangoJSONEncoder()
+    batch = []
+    for row in rows:
+        batch.append(encoder.encode(dict(zip(fields, row))) + '\n')
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_export(integration, fmt=CSV, filters=None, gzip=False):
+    """
+    Return an iterator over the export file, as str or, when gzipped, bytes.
+    """
+    if fmt not in FORMATS:
+        raise ImproperlyConfigured("'%s' is not a valid export format" % fmt)
+    fields, rows = get_export_rows(integration, filters)
+    chunks = iter_csv(fields, rows) if fmt == CSV else iter_jsonl(fields, rows)
+    if gzip:
+        chunks = iter_gzip(chunks)
+    return chunks
+
+
+class TransactionExportView(generic.View):
+    """
+    Stream an integration's transactions.  Takes the dashboard search filters
+    plus ``format`` (csv or jsonl) and ``gzip`` query parameters.
+    """
+    integration = None
+
+    def get(self, request, *args, **kwargs):
+        fmt = request.GET.get('format', CSV)
+        if fmt not in FORMATS:
+            fmt = CSV
+        gzip = bool(request.GET.get('gzip'))
+        try:
+            chunks = iter_export(self.integration, fmt, request.GET, gzip)
+        except ValidationError as e:
+            return HttpResponseBadRequest(' '.join(e.messages), content_type='text/plain')
+
+        filename = 'paypal-%s-transactions.%s' % (self.integration.replace('_', '-'), fmt)
+        if gzip:
+            filename += '.gz'
+            content_type = 'application/gzip'
+        else:
+            content_type = FORMATS[fmt]
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        return response
@@ -0,0 +1,25 @@
+from django import forms
+from django.utils.translation import gettext_lazy as _
+
+from paypal.express import gateway
+from paypal.express.models import ExpressTransaction
+from paypal.forms import TransactionSearchForm
+
+METHOD_CHOICES = [('', _("All"))] + [(method, method) for method in (
+    gateway.SET_EXPRESS_CHECKOUT, gateway.GET_EXPRESS_CHECKOUT, gateway.DO_EXPRESS_CHECKOUT,
+    gateway.DO_CAPTURE, gateway.DO_VOID, gateway.REFUND_TRANSACTION)]
+
+ACK_CHOICES = [('', _("All"))] + [(ack, ack) for ack in (
+    ExpressTransaction.SUCCESS, ExpressTransaction.SUCCESS_WITH_WARNING, ExpressTransaction.FAILURE)]
+
+
+class ExpressTransactionSearchForm(TransactionSearchForm):
+    method = forms.ChoiceField(label=_("Method"), choices=METHOD_CHOICES, required=False)
+    ack = forms.ChoiceField(label=_("Result"), choices=ACK_CHOICES, required=False)
+    token = forms.CharField(label=_("Token"), required=False)
+
+    lookups = {
+        'method': 'method',
+        'ack': 'ack',
+        'token': 'token',
+    }
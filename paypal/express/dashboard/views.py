@@ -1,13 +1,32 @@
 from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from django.views import generic
 
+from paypal import analytics
+from paypal.export import TransactionExportView as BaseTransactionExportView
 from paypal.express import models
+from paypal.pagination import TransactionListMixin
 
+from .forms import ExpressTransactionSearchForm
 
-class TransactionListView(generic.ListView):
+
+class TransactionListView(TransactionListMixin, generic.ListView):
     model = models.ExpressTransaction
     template_name = 'paypal/express/dashboard/transaction_list.html'
     context_object_name = 'transactions'
+    form_class = ExpressTransactionSearchForm
+    # Columns shown in the list; the raw request and response are not loaded
+    list_fields = ('method', 'ack', 'amount', 'currency', 'token', 'correlation_id', 'error_code',
+                   'error_message', 'date_created')
+
+
+class TransactionExportView(BaseTransactionExportView):
+    integration = 'express'
+
+
+class ResponseTimeView(analytics.ResponseTimeView):
+    source = analytics.EXPRESS
+    title = _("PayPal Express response times")
 
 
 class TransactionDetailView(generic.DetailView):
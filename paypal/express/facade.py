@@ -1,14 +1,19 @@
 """
 Responsible for briding between Oscar and the PayPal gateway
 """
+from decimal import Decimal as D
+
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core import signing
+from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
 from django.urls import reverse
 
+from paypal import idempotency, tracing
 from paypal.express.gateway import (
-    AUTHORIZATION, DO_EXPRESS_CHECKOUT, ORDER, SALE, buyer_pays_on_paypal, do_capture, do_txn, do_void,
-    get_txn, refund_txn, set_txn)
+    API_VERSION, AUTHORIZATION, DO_CAPTURE, DO_EXPRESS_CHECKOUT, DO_VOID, GET_EXPRESS_CHECKOUT, ORDER,
+    REFUND_TRANSACTION, SALE, buyer_pays_on_paypal, do_capture, do_txn, do_void, get_txn, refund_txn, set_txn)
 from paypal.express.models import ExpressTransaction as Transaction
 
 
@@ -20,6 +25,7 @@ def _get_payment_action():
     return action
 
 
+@tracing.traced()
 def get_paypal_url(basket, shipping_methods, user=None, shipping_address=None,
                    shipping_method=None, host=None, scheme=None,
                    paypal_params=None):
@@ -79,6 +85,7 @@ def get_paypal_url(basket, shipping_methods, user=None, shipping_address=None,
                    paypal_params=paypal_params)
 
 
+@tracing.traced()
 def fetch_transaction_details(token):
     """
     Fetch the completed details about the PayPal transaction.
@@ -86,35 +93,117 @@ def fetch_transaction_details(token):
     return get_txn(token)
 
 
-def confirm_transaction(payer_id, token, amount, currency):
+def _get_details_cache():
+    return caches[getattr(settings, 'PAYPAL_TRANSACTION_DETAILS_CACHE', 'default')]
+
+
+def _get_details_key(token, basket_id):
+    return 'paypal:express:details:%s:%s' % (basket_id, token)
+
+
+def _get_details_salt(token, basket_id, payer_id):
+    # Binds the signature to the token, basket and payer, so that an entry
+    # can't be replayed for another one
+    return 'paypal.express.facade:%s:%s:%s' % (basket_id, token, payer_id)
+
+
+def _get_details_ttl():
+    return getattr(settings, 'PAYPAL_TRANSACTION_DETAILS_TTL', 300)
+
+
+def remember_transaction_details(token, basket_id, payer_id, txn):
     """
-    Confirm the payment action.
+    Keep the GetExpressCheckoutDetails transaction fetched for the order
+    preview, so that placing the order needn't fetch it again.
     """
-    return do_txn(payer_id, token, amount, currency,
-                  action=_get_payment_action())
+    data = {
+        'ack': txn.ack,
+        'correlation_id': txn.correlation_id,
+        'amount': str(txn.amount),
+        'currency': txn.currency,
+        'response_data': txn.response_data,
+    }
+    value = signing.dumps(data, salt=_get_details_salt(token, basket_id, payer_id), compress=True)
+    _get_details_cache().set(_get_details_key(token, basket_id), value, _get_details_ttl())
+
+
+def recall_transaction_details(token, basket_id, payer_id):
+    """
+    Return the transaction kept by remember_transaction_details(), or None if
+    there is none or its signature doesn't check out (it was tampered with or
+    the payer differs).  The transaction isn't saved again.
+    """
+    value = _get_details_cache().get(_get_details_key(token, basket_id))
+    if value is None:
+        return None
+    try:
+        data = signing.loads(value, salt=_get_details_salt(token, basket_id, payer_id), max_age=_get_details_ttl())
+    except signing.BadSignature:
+        return None
+    return Transaction(
+        method=GET_EXPRESS_CHECKOUT, version=API_VERSION, token=token, ack=data['ack'],
+        correlation_id=data['correlation_id'], amount=D(data['amount']), currency=data['currency'],
+        raw_request='', raw_response='', response_data=data['response_data'], response_time=0)
+
 
+def _is_successful(txn):
+    return txn.is_successful
 
+
+@tracing.traced()
+def confirm_transaction(payer_id, token, amount, currency, basket_id=None):
+    """
+    Confirm the payment action.  Repeats of a successful confirmation return
+    its transaction without calling PayPal (see paypal.idempotency).
+    """
+    return idempotency.run_once(
+        idempotency.get_key(basket_id, token, DO_EXPRESS_CHECKOUT), _is_successful,
+        do_txn, payer_id, token, amount, currency, action=_get_payment_action())
+
+
+def _get_checkout_transaction(token):
+    """
+    Return the DoExpressCheckoutPayment transaction for a token, loading only
+    the fields needed by follow-up operations.
+    """
+    txn = Transaction.objects.only('amount', 'currency', 'transaction_id').get(
+        token=token, method=DO_EXPRESS_CHECKOUT)
+    if txn.transaction_id is None:
+        # Row which predates the transaction_id column and hasn't been
+        # backfilled
+        txn.transaction_id = txn.value('PAYMENTINFO_0_TRANSACTIONID')
+    return txn
+
+
+@tracing.traced()
 def refund_transaction(token, amount, currency, note=None):
-    txn = Transaction.objects.get(token=token,
-                                  method=DO_EXPRESS_CHECKOUT)
+    """
+    Refund ``amount`` of a payment.  Repeats of a successful refund of the
+    same amount return its transaction without calling PayPal.
+    """
+    txn = _get_checkout_transaction(token)
     is_partial = amount < txn.amount
-    return refund_txn(txn.value('PAYMENTINFO_0_TRANSACTIONID'), is_partial, amount, currency)
+    return idempotency.run_once(
+        idempotency.get_key(None, token, REFUND_TRANSACTION, amount), _is_successful,
+        refund_txn, txn.transaction_id, is_partial, amount, currency)
 
 
+@tracing.traced()
 def capture_authorization(token, note=None):
     """
     Capture a previous authorization.
     """
-    txn = Transaction.objects.get(token=token,
-                                  method=DO_EXPRESS_CHECKOUT)
-    return do_capture(txn.value('PAYMENTINFO_0_TRANSACTIONID'),
-                      txn.amount, txn.currency, note=note)
+    txn = _get_checkout_transaction(token)
+    return idempotency.run_once(
+        idempotency.get_key(None, token, DO_CAPTURE), _is_successful,
+        do_capture, txn.transaction_id, txn.amount, txn.currency, note=note)
 
 
+@tracing.traced()
 def void_authorization(token, note=None):
     """
     Void a previous authorization.
     """
-    txn = Transaction.objects.get(token=token,
-                                  method=DO_EXPRESS_CHECKOUT)
-    return do_void(txn.value('PAYMENTINFO_0_TRANSACTIONID'), note=note)
+    txn = _get_checkout_transaction(token)
+    return idempotency.run_once(
+        idempotency.get_key(None, token, DO_VOID), _is_successful, do_void, txn.transaction_id, note=note)
@@ -1,17 +1,25 @@
+import functools
 import logging
 from decimal import Decimal as D
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.template.defaultfilters import striptags, truncatewords
 from django.utils.http import urlencode
+from django.utils.translation import get_language
 from django.utils.translation import gettext as _
-from localflavor.us import us_states
 
-from paypal import exceptions, gateway
+from paypal import addresses, audit, exceptions, gateway, instrumentation
 
 from . import exceptions as express_exceptions
-from . import models
+from . import models, quotes
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    sync_to_async = None
 
 # PayPal methods
 SET_EXPRESS_CHECKOUT = 'SetExpressCheckout'
@@ -32,19 +40,113 @@ logger = logging.getLogger('paypal.express')
 buyer_pays_on_paypal = lambda: getattr(settings, 'PAYPAL_BUYER_PAYS_ON_PAYPAL', False)
 
 
+# SetExpressCheckout parameters taken from settings, with their defaults.
+# These can be overridden and customised using the paypal_params parameter.
+SETTING_PARAMS = (
+    ('CUSTOMERSERVICENUMBER', 'PAYPAL_CUSTOMER_SERVICES_NUMBER', None),
+    ('SOLUTIONTYPE', 'PAYPAL_SOLUTION_TYPE', None),
+    ('LANDINGPAGE', 'PAYPAL_LANDING_PAGE', None),
+    ('BRANDNAME', 'PAYPAL_BRAND_NAME', None),
+
+    # Display settings
+    ('PAGESTYLE', 'PAYPAL_PAGESTYLE', None),
+    ('HDRIMG', 'PAYPAL_HEADER_IMG', None),
+    ('PAYFLOWCOLOR', 'PAYPAL_PAYFLOW_COLOR', None),
+
+    # Think these settings maybe deprecated in latest version of PayPal's
+    # API
+    ('HDRBACKCOLOR', 'PAYPAL_HEADER_BACK_COLOR', None),
+    ('HDRBORDERCOLOR', 'PAYPAL_HEADER_BORDER_COLOR', None),
+
+    ('LOCALECODE', 'PAYPAL_LOCALE', None),
+
+    ('ALLOWNOTE', 'PAYPAL_ALLOW_NOTE', True),
+    ('CALLBACKTIMEOUT', 'PAYPAL_CALLBACK_TIMEOUT', 3),
+)
+
+VALID_LOCALES = ('AU', 'DE', 'FR', 'GB', 'IT', 'ES', 'JP', 'US')
+
+# Number of product descriptions kept formatted
+DESCRIPTION_CACHE_SIZE = 10000
+
+# The parameters read from settings, built on first use
+_setting_params = None
+
+# Formatted product descriptions, keyed on product, modification time and
+# language (truncation adds a translated ellipsis)
+_descriptions = {}
+
+
 def _format_description(description):
     if description:
         return truncatewords(striptags(description), 12)
     return ''
 
 
+def _get_product_description(product):
+    if not product.description:
+        return ''
+    pk = getattr(product, 'pk', None)
+    if pk is None:
+        return _format_description(product.description)
+    key = (pk, getattr(product, 'date_updated', None), get_language())
+    desc = _descriptions.get(key)
+    if desc is None:
+        desc = _format_description(product.description)
+        if len(_descriptions) >= DESCRIPTION_CACHE_SIZE:
+            _descriptions.clear()
+        _descriptions[key] = desc
+    return desc
+
+
+def _to_param(value):
+    # Boolean values become integers
+    return int(value) if isinstance(value, bool) else value
+
+
+def _get_setting_params():
+    """
+    Return the parameters read from settings, without None values.
+    """
+    global _setting_params
+    if _setting_params is None:
+        params = ((key, getattr(settings, name, default)) for key, name, default in SETTING_PARAMS)
+        _setting_params = {key: _to_param(value) for key, value in params if value is not None}
+    return _setting_params
+
+
+@receiver(setting_changed)
+def _reset_setting_params(setting, **kwargs):
+    # Settings only change under override_settings
+    global _setting_params
+    if setting.startswith('PAYPAL_'):
+        _setting_params = None
+
+
+@functools.lru_cache(maxsize=1024)
+def _get_line_keys(index):
+    """
+    Return the NAME, NUMBER, DESC, AMT, QTY and ITEMCATEGORY keys of an item.
+    """
+    return tuple('L_PAYMENTREQUEST_0_%s%d' % (field, index)
+                 for field in ('NAME', 'NUMBER', 'DESC', 'AMT', 'QTY', 'ITEMCATEGORY'))
+
+
+@functools.lru_cache(maxsize=128)
+def _get_shipping_option_keys(index):
+    """
+    Return the ISDEFAULT, NAME and AMOUNT keys of a shipping option.
+    """
+    return tuple('L_SHIPPINGOPTION%s%d' % (field, index) for field in ('ISDEFAULT', 'NAME', 'AMOUNT'))
+
+
 def _format_currency(amt):
     return amt.quantize(D('0.01'))
 
 
-def _fetch_response(method, extra_params):
+def _get_request(method, extra_params):
     """
-    Fetch the response from PayPal and return a transaction object
+    Return the URL and parameters for a call to PayPal
     """
     # Build parameter string
     params = {
@@ -56,19 +158,25 @@ def _fetch_response(method, extra_params):
     }
     params.update(extra_params)
 
-    if getattr(settings, 'PAYPAL_SANDBOX_MODE', True):
-        url = 'https://api-3t.sandbox.paypal.com/nvp'
-    else:
-        url = 'https://api-3t.paypal.com/nvp'
+    url = getattr(settings, 'PAYPAL_NVP_URL', None)
+    if url is None:
+        if getattr(settings, 'PAYPAL_SANDBOX_MODE', True):
+            url = 'https://api-3t.sandbox.paypal.com/nvp'
+        else:
+            url = 'https://api-3t.paypal.com/nvp'
 
     # Print easy-to-read version of params for debugging
     param_str = "\n".join(["%s: %s" % x for x in sorted(params.items())])
     logger.debug("Making %s request to %s with params:\n%s", method, url,
                  param_str)
+    return url, params
 
-    # Make HTTP request
-    pairs = gateway.post(url, params)
 
+def _record_response(method, params, pairs):
+    """
+    Save the response from PayPal as a transaction object, raising PayPalError
+    if the call was not successful.
+    """
     pairs_str = "\n".join(["%s: %s" % x for x in sorted(pairs.items())
                            if not x[0].startswith('_')])
     logger.debug("Response with params:\n%s", pairs_str)
@@ -81,10 +189,13 @@ def _fetch_response(method, extra_params):
         ack=pairs['ACK'],
         raw_request=pairs['_raw_request'],
         raw_response=pairs['_raw_response'],
+        response_data=gateway.get_response_data(pairs),
         response_time=pairs['_response_time'],
     )
     if txn.is_successful:
         txn.correlation_id = pairs['CORRELATIONID']
+        if method in txn.TRANSACTION_ID_FIELDS:
+            txn.transaction_id = pairs.get(txn.TRANSACTION_ID_FIELDS[method])
         if method == SET_EXPRESS_CHECKOUT:
             txn.amount = params['PAYMENTREQUEST_0_AMT']
             txn.currency = params['PAYMENTREQUEST_0_CURRENCYCODE']
@@ -103,7 +214,7 @@ def _fetch_response(method, extra_params):
             txn.error_code = pairs['L_ERRORCODE0']
         if 'L_LONGMESSAGE0' in pairs:
             txn.error_message = pairs['L_LONGMESSAGE0']
-    txn.save()
+    audit.save(txn)
 
     if not txn.is_successful:
         msg = "Error %s - %s" % (txn.error_code, txn.error_message)
@@ -113,59 +224,84 @@ def _fetch_response(method, extra_params):
     return txn
 
 
-def set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_url=None,  # noqa: C901 too complex
-            action=SALE, user=None, user_address=None, shipping_method=None,
-            shipping_address=None, no_shipping=False, paypal_params=None):
+def _fetch_response(method, extra_params):
     """
-    Register the transaction with PayPal to get a token which we use in the
-    redirect URL.  This is the 'SetExpressCheckout' from their documentation.
+    Fetch the response from PayPal and return a transaction object
+    """
+    url, params = _get_request(method, extra_params)
+    call = instrumentation.start_call('express', method, url)
 
-    There are quite a few options that can be passed to PayPal to configure
-    this request - most are controlled by PAYPAL_* settings.
+    # Make HTTP request
+    try:
+        pairs = gateway.post(url, params, call=call, method=method, integration='express')
+    except Exception as e:
+        call.failed(e)
+        raise
+
+    try:
+        txn = _record_response(method, params, pairs)
+    except exceptions.PayPalError:
+        # PayPal declined the call, which has been recorded
+        call.mark('save')
+        call.finished(False)
+        raise
+    except Exception as e:
+        call.failed(e)
+        raise
+    call.mark('save')
+    call.finished(True)
+    return txn
+
+
+async def _async_fetch_response(method, extra_params):
     """
-    # Default parameters (taken from global settings).  These can be overridden
-    # and customised using the paypal_params parameter.
-    _params = {
-        'CUSTOMERSERVICENUMBER': getattr(
-            settings, 'PAYPAL_CUSTOMER_SERVICES_NUMBER', None),
-        'SOLUTIONTYPE': getattr(settings, 'PAYPAL_SOLUTION_TYPE', None),
-        'LANDINGPAGE': getattr(settings, 'PAYPAL_LANDING_PAGE', None),
-        'BRANDNAME': getattr(settings, 'PAYPAL_BRAND_NAME', None),
-
-        # Display settings
-        'PAGESTYLE': getattr(settings, 'PAYPAL_PAGESTYLE', None),
-        'HDRIMG': getattr(settings, 'PAYPAL_HEADER_IMG', None),
-        'PAYFLOWCOLOR': getattr(settings, 'PAYPAL_PAYFLOW_COLOR', None),
-
-        # Think these settings maybe deprecated in latest version of PayPal's
-        # API
-        'HDRBACKCOLOR': getattr(settings, 'PAYPAL_HEADER_BACK_COLOR', None),
-        'HDRBORDERCOLOR': getattr(
-            settings, 'PAYPAL_HEADER_BORDER_COLOR', None),
-
-        'LOCALECODE': getattr(settings, 'PAYPAL_LOCALE', None),
-
-        'ALLOWNOTE': getattr(settings, 'PAYPAL_ALLOW_NOTE', True),
-        'CALLBACKTIMEOUT': getattr(settings, 'PAYPAL_CALLBACK_TIMEOUT', 3)
-    }
+    Coroutine version of _fetch_response
+    """
+    url, params = _get_request(method, extra_params)
+    call = instrumentation.start_call('express', method, url)
+    try:
+        pairs = await gateway.async_post(url, params, call=call, method=method, integration='express')
+    except Exception as e:
+        call.failed(e)
+        raise
+    try:
+        txn = await sync_to_async(_record_response)(method, params, pairs)
+    except exceptions.PayPalError:
+        # PayPal declined the call, which has been recorded
+        call.mark('save')
+        call.finished(False)
+        raise
+    except Exception as e:
+        call.failed(e)
+        raise
+    call.mark('save')
+    call.finished(True)
+    return txn
+
+
+def _get_set_txn_params(basket, shipping_methods, currency, return_url, cancel_url, update_url=None,  # noqa: C901
+                        action=SALE, user=None, user_address=None, shipping_method=None,
+                        shipping_address=None, no_shipping=False, paypal_params=None):
+    """
+    Build the parameters for a 'SetExpressCheckout' call.
+    """
+    # Default parameters (taken from global settings)
+    params = dict(_get_setting_params())
     confirm_shipping_addr = getattr(settings, 'PAYPAL_CONFIRM_SHIPPING', None)
     if confirm_shipping_addr and not no_shipping:
-        _params['REQCONFIRMSHIPPING'] = 1
+        params['REQCONFIRMSHIPPING'] = 1
     if paypal_params:
-        _params.update(paypal_params)
-
-    locale = _params.get('LOCALECODE', None)
-    if locale:
-        valid_choices = ('AU', 'DE', 'FR', 'GB', 'IT', 'ES', 'JP', 'US')
-        if locale not in valid_choices:
-            raise ImproperlyConfigured(
-                "'%s' is not a valid locale code" % locale)
-
-    # Boolean values become integers
-    _params.update((k, int(v)) for k, v in _params.items() if isinstance(v, bool))
-
-    # Remove None values
-    params = dict((k, v) for k, v in _params.items() if v is not None)
+        for key, value in paypal_params.items():
+            # None values remove the parameter
+            if value is None:
+                params.pop(key, None)
+            else:
+                params[key] = _to_param(value)
+
+    locale = params.get('LOCALECODE', None)
+    if locale and locale not in VALID_LOCALES:
+        raise ImproperlyConfigured(
+            "'%s' is not a valid locale code" % locale)
 
     # PayPal have an upper limit on transactions.  It's in dollars which is a
     # fiddly to work with.  Lazy solution - only check when dollars are used as
@@ -194,20 +330,15 @@ def set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_u
     index = 0
     for index, line in enumerate(basket.all_lines()):
         product = line.product
-        params['L_PAYMENTREQUEST_0_NAME%d' % index] = product.get_title()
-        params['L_PAYMENTREQUEST_0_NUMBER%d' % index] = (product.upc if
-                                                         product.upc else '')
-        desc = ''
-        if product.description:
-            desc = _format_description(product.description)
-        params['L_PAYMENTREQUEST_0_DESC%d' % index] = desc
+        name_key, number_key, desc_key, amt_key, qty_key, category_key = _get_line_keys(index)
+        params[name_key] = product.get_title()
+        params[number_key] = product.upc if product.upc else ''
+        params[desc_key] = _get_product_description(product)
         # Note, we don't include discounts here - they are handled as separate
         # lines - see below
-        params['L_PAYMENTREQUEST_0_AMT%d' % index] = _format_currency(
-            line.unit_price_incl_tax)
-        params['L_PAYMENTREQUEST_0_QTY%d' % index] = line.quantity
-        params['L_PAYMENTREQUEST_0_ITEMCATEGORY%d' % index] = (
-            'Physical' if product.is_shipping_required else 'Digital')
+        params[amt_key] = _format_currency(line.unit_price_incl_tax)
+        params[qty_key] = line.quantity
+        params[category_key] = 'Physical' if product.is_shipping_required else 'Digital'
 
     # If the order has discounts associated with it, the way PayPal suggests
     # using the API is to add a separate item for the discount with the value
@@ -274,7 +405,7 @@ def set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_u
         params['SHIPTOSTREET'] = user_address.line1
         params['SHIPTOSTREET2'] = user_address.line2
         params['SHIPTOCITY'] = user_address.line4
-        params['SHIPTOSTATE'] = user_address.state
+        params['SHIPTOSTATE'] = addresses.normalize_state(user_address.country.iso_3166_1_a2, user_address.state)
         params['SHIPTOZIP'] = user_address.postcode
         params['SHIPTOCOUNTRYCODE'] = user_address.country.iso_3166_1_a2
         params['SHIPTOPHONENUM'] = user_address.phone_number
@@ -298,10 +429,7 @@ def set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_u
         # For US addresses, we need to try and convert the state into 2 letter
         # code - otherwise we can get a 10736 error as the shipping address and
         # zipcode don't match the state. Very silly really.
-        if params['SHIPTOCOUNTRYCODE'] == 'US':
-            key = params['SHIPTOSTATE'].lower().strip()
-            if key in us_states.STATES_NORMALIZED:
-                params['SHIPTOSTATE'] = us_states.STATES_NORMALIZED[key]
+        params['SHIPTOSTATE'] = addresses.normalize_state(params['SHIPTOCOUNTRYCODE'], params['SHIPTOSTATE'])
 
     elif no_shipping:
         params['NOSHIPPING'] = 1
@@ -309,18 +437,22 @@ def set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_u
     # Shipping charges
     params['PAYMENTREQUEST_0_SHIPPINGAMT'] = _format_currency(D('0.00'))
     max_charge = D('0.00')
-    for index, method in enumerate(shipping_methods):
+    shipping_quotes = [quotes.get_quote(method, basket) for method in shipping_methods]
+    for index, (name, description, charge) in enumerate(shipping_quotes):
         is_default = index == 0
-        params['L_SHIPPINGOPTIONISDEFAULT%d' % index] = 'true' if is_default else 'false'
-        charge = method.calculate(basket).incl_tax
+        is_default_key, name_key, amount_key = _get_shipping_option_keys(index)
+        params[is_default_key] = 'true' if is_default else 'false'
 
         if charge > max_charge:
             max_charge = charge
         if is_default:
             params['PAYMENTREQUEST_0_SHIPPINGAMT'] = _format_currency(charge)
             params['PAYMENTREQUEST_0_AMT'] += charge
-        params['L_SHIPPINGOPTIONNAME%d' % index] = str(method.name)
-        params['L_SHIPPINGOPTIONAMOUNT%d' % index] = _format_currency(charge)
+        params[name_key] = name
+        params[amount_key] = _format_currency(charge)
+    if update_url:
+        # Keep the quotes for the Instant Update callback to fall back on
+        quotes.store_basket_quotes(basket.id, shipping_quotes)
 
     # Set shipping charge explicitly if it has been passed
     if shipping_method:
@@ -340,14 +472,17 @@ def set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_u
     # Ensure that the total is formatted correctly.
     params['PAYMENTREQUEST_0_AMT'] = _format_currency(
         params['PAYMENTREQUEST_0_AMT'])
+    return params
 
-    txn = _fetch_response(SET_EXPRESS_CHECKOUT, params)
 
+def _get_checkout_url(txn):
     # Construct return URL
-    if getattr(settings, 'PAYPAL_SANDBOX_MODE', True):
-        url = 'https://www.sandbox.paypal.com/webscr'
-    else:
-        url = 'https://www.paypal.com/webscr'
+    url = getattr(settings, 'PAYPAL_CHECKOUT_URL', None)
+    if url is None:
+        if getattr(settings, 'PAYPAL_SANDBOX_MODE', True):
+            url = 'https://www.sandbox.paypal.com/webscr'
+        else:
+            url = 'https://www.paypal.com/webscr'
 
     params = [
         ('cmd', '_express-checkout'),
@@ -360,6 +495,24 @@ def set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_u
     return '%s?%s' % (url, urlencode(params))
 
 
+def set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_url=None,
+            action=SALE, user=None, user_address=None, shipping_method=None,
+            shipping_address=None, no_shipping=False, paypal_params=None):
+    """
+    Register the transaction with PayPal to get a token which we use in the
+    redirect URL.  This is the 'SetExpressCheckout' from their documentation.
+
+    There are quite a few options that can be passed to PayPal to configure
+    this request - most are controlled by PAYPAL_* settings.
+    """
+    params = _get_set_txn_params(
+        basket, shipping_methods, currency, return_url, cancel_url, update_url=update_url,
+        action=action, user=user, user_address=user_address, shipping_method=shipping_method,
+        shipping_address=shipping_address, no_shipping=no_shipping, paypal_params=paypal_params)
+    txn = _fetch_response(SET_EXPRESS_CHECKOUT, params)
+    return _get_checkout_url(txn)
+
+
 def get_txn(token):
     """
     Fetch details of a transaction from PayPal using the token as
@@ -368,27 +521,25 @@ def get_txn(token):
     return _fetch_response(GET_EXPRESS_CHECKOUT, {'TOKEN': token})
 
 
-def do_txn(payer_id, token, amount, currency, action=SALE):
-    """
-    DoExpressCheckoutPayment
-    """
-    params = {
+def _get_do_txn_params(payer_id, token, amount, currency, action=SALE):
+    return {
         'PAYERID': payer_id,
         'TOKEN': token,
         'PAYMENTREQUEST_0_AMT': amount,
         'PAYMENTREQUEST_0_CURRENCYCODE': currency,
         'PAYMENTREQUEST_0_PAYMENTACTION': action,
     }
-    return _fetch_response(DO_EXPRESS_CHECKOUT, params)
 
 
-def do_capture(txn_id, amount, currency, complete_type='Complete',
-               note=None):
+def do_txn(payer_id, token, amount, currency, action=SALE):
     """
-    Capture payment from a previous transaction
-
-    See https://cms.paypal.com/uk/cgi-bin/?&cmd=_render-content&content_ID=developer/e_howto_api_soap_r_DoCapture
+    DoExpressCheckoutPayment
     """
+    params = _get_do_txn_params(payer_id, token, amount, currency, action)
+    return _fetch_response(DO_EXPRESS_CHECKOUT, params)
+
+
+def _get_do_capture_params(txn_id, amount, currency, complete_type='Complete', note=None):
     params = {
         'AUTHORIZATIONID': txn_id,
         'AMT': amount,
@@ -397,23 +548,38 @@ def do_capture(txn_id, amount, currency, complete_type='Complete',
     }
     if note:
         params['NOTE'] = note
+    return params
+
+
+def do_capture(txn_id, amount, currency, complete_type='Complete',
+               note=None):
+    """
+    Capture payment from a previous transaction
+
+    See https://cms.paypal.com/uk/cgi-bin/?&cmd=_render-content&content_ID=developer/e_howto_api_soap_r_DoCapture
+    """
+    params = _get_do_capture_params(txn_id, amount, currency, complete_type, note)
     return _fetch_response(DO_CAPTURE, params)
 
 
-def do_void(txn_id, note=None):
+def _get_do_void_params(txn_id, note=None):
     params = {
         'AUTHORIZATIONID': txn_id,
     }
     if note:
         params['NOTE'] = note
-    return _fetch_response(DO_VOID, params)
+    return params
+
+
+def do_void(txn_id, note=None):
+    return _fetch_response(DO_VOID, _get_do_void_params(txn_id, note))
 
 
 FULL_REFUND = 'Full'
 PARTIAL_REFUND = 'Partial'
 
 
-def refund_txn(txn_id, is_partial=False, amount=None, currency=None):
+def _get_refund_txn_params(txn_id, is_partial=False, amount=None, currency=None):
     params = {
         'TRANSACTIONID': txn_id,
         'REFUNDTYPE': PARTIAL_REFUND if is_partial else FULL_REFUND,
@@ -421,4 +587,48 @@ def refund_txn(txn_id, is_partial=False, amount=None, currency=None):
     if is_partial:
         params['AMT'] = amount
         params['CURRENCYCODE'] = currency
+    return params
+
+
+def refund_txn(txn_id, is_partial=False, amount=None, currency=None):
+    params = _get_refund_txn_params(txn_id, is_partial, amount, currency)
     return _fetch_response(REFUND_TRANSACTION, params)
+
+
+# Coroutine versions of the calls above, for use under ASGI.  They take the
+# same arguments and return the same transaction objects.
+
+
+async def async_set_txn(basket, shipping_methods, currency, return_url, cancel_url, update_url=None,
+                        action=SALE, user=None, user_address=None, shipping_method=None,
+                        shipping_address=None, no_shipping=False, paypal_params=None):
+    # Building the parameters reads basket lines and shipping charges
+    params = await sync_to_async(_get_set_txn_params)(
+        basket, shipping_methods, currency, return_url, cancel_url, update_url=update_url,
+        action=action, user=user, user_address=user_address, shipping_method=shipping_method,
+        shipping_address=shipping_address, no_shipping=no_shipping, paypal_params=paypal_params)
+    txn = await _async_fetch_response(SET_EXPRESS_CHECKOUT, params)
+    return _get_checkout_url(txn)
+
+
+async def async_get_txn(token):
+    return await _async_fetch_response(GET_EXPRESS_CHECKOUT, {'TOKEN': token})
+
+
+async def async_do_txn(payer_id, token, amount, currency, action=SALE):
+    params = _get_do_txn_params(payer_id, token, amount, currency, action)
+    return await _async_fetch_response(DO_EXPRESS_CHECKOUT, params)
+
+
+async def async_do_capture(txn_id, amount, currency, complete_type='Complete', note=None):
+    params = _get_do_capture_params(txn_id, amount, currency, complete_type, note)
+    return await _async_fetch_response(DO_CAPTURE, params)
+
+
+async def async_do_void(txn_id, note=None):
+    return await _async_fetch_response(DO_VOID, _get_do_void_params(txn_id, note))
+
+
+async def async_refund_txn(txn_id, is_partial=False, amount=None, currency=None):
+    params = _get_refund_txn_params(txn_id, is_partial, amount, currency)
+    return await _async_fetch_response(REFUND_TRANSACTION, params)
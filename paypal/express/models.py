@@ -25,17 +25,41 @@ class ExpressTransaction(base.ResponseModel):
     correlation_id = models.CharField(max_length=32, null=True, blank=True)
     token = models.CharField(max_length=32, null=True, blank=True)
 
+    # The PayPal transaction ID returned by the payment, capture or refund
+    transaction_id = models.CharField(max_length=32, null=True, blank=True)
+
     error_code = models.CharField(max_length=32, null=True, blank=True)
     error_message = models.CharField(max_length=256, null=True, blank=True)
 
+    # Response field holding the transaction ID, for each method returning one
+    TRANSACTION_ID_FIELDS = {
+        'DoExpressCheckoutPayment': 'PAYMENTINFO_0_TRANSACTIONID',
+        'DoCapture': 'TRANSACTIONID',
+        'RefundTransaction': 'REFUNDTRANSACTIONID',
+    }
+
     class Meta:
         ordering = ('-date_created',)
         app_label = 'paypal'
+        indexes = [
+            models.Index(fields=['token', 'method']),
+            models.Index(fields=['transaction_id']),
+            # Dashboard pagination
+            models.Index(fields=['date_created', 'id']),
+        ]
 
     def save(self, *args, **kwargs):
-        self.raw_request = re.sub(r'PWD=\d+&', 'PWD=XXXXXX&', self.raw_request)
+        self.mask_sensitive_data()
         return super(ExpressTransaction, self).save(*args, **kwargs)
 
+    def mask_sensitive_data(self):
+        self.raw_request = re.sub(r'PWD=\d+&', 'PWD=XXXXXX&', self.raw_request)
+
+    @property
+    def is_looked_up_later(self):
+        # Refunds, captures and voids find the payment by token
+        return self.method == 'DoExpressCheckoutPayment'
+
     @property
     def is_successful(self):
         return self.ack in (self.SUCCESS, self.SUCCESS_WITH_WARNING)
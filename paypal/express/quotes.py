@@ -0,0 +1,90 @@
+"""
+Shipping quotes for PayPal's Instant Update callback.
+
+PayPal gives up on the callback after PAYPAL_CALLBACK_TIMEOUT seconds, so the
+quotes given to it are kept in the Django cache:
+
+* SetExpressCheckout stores the quotes it sends for the basket, which don't
+  depend on the address, under a new generation of the basket.
+* The callback stores the quotes it calculates for a destination (country,
+  state and postcode prefix) under the basket's generation.  Repeated
+  callbacks for the same destination are answered from the cache, and a
+  callback running out of time falls back to the basket's quotes.
+
+A new SetExpressCheckout call for the basket starts a new generation, so that
+the quotes of a basket edited in between aren't reused.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def _get_cache():
+    return caches[getattr(settings, 'PAYPAL_SHIPPING_QUOTE_CACHE', 'default')]
+
+
+def _get_ttl():
+    # PayPal tokens expire after three hours
+    return getattr(settings, 'PAYPAL_SHIPPING_QUOTE_TTL', 3 * 60 * 60)
+
+
+def get_budget():
+    """
+    Return the number of seconds the callback may spend calculating quotes
+    before falling back to the basket's quotes.
+    """
+    return getattr(settings, 'PAYPAL_SHIPPING_QUOTE_BUDGET', getattr(settings, 'PAYPAL_CALLBACK_TIMEOUT', 3) / 2)
+
+
+def get_destination(country_code, state='', postcode=''):
+    """
+    Return the destination the quotes of an address are kept for.  Postcodes
+    are cut to their first PAYPAL_SHIPPING_QUOTE_POSTCODE_PREFIX characters
+    (all of them if None).
+    """
+    prefix_length = getattr(settings, 'PAYPAL_SHIPPING_QUOTE_POSTCODE_PREFIX', 3)
+    postcode = ''.join((postcode or '').split()).upper()
+    if prefix_length is not None:
+        postcode = postcode[:prefix_length]
+    return '%s:%s:%s' % ((country_code or '').upper(), (state or '').strip().upper(), postcode)
+
+
+def get_quote(method, basket):
+    """
+    Return the name, description and charge of a shipping method.
+    """
+    return str(method.name), str(method.description), method.calculate(basket).incl_tax
+
+
+def _get_basket_key(basket_id):
+    return 'paypal:express:quotes:%s' % basket_id
+
+
+def _get_destination_key(basket_id, generation, destination):
+    return 'paypal:express:quotes:%s:%s:%s' % (basket_id, generation, destination)
+
+
+def store_basket_quotes(basket_id, quotes):
+    """
+    Keep the quotes sent to PayPal for a basket, starting a new generation.
+    """
+    _get_cache().set(_get_basket_key(basket_id), (uuid.uuid4().hex, quotes), _get_ttl())
+
+
+def get_basket_quotes(basket_id):
+    """
+    Return the generation and the quotes kept for a basket, or None and None.
+    """
+    return _get_cache().get(_get_basket_key(basket_id), (None, None))
+
+
+def store_quotes(basket_id, generation, destination, quotes):
+    _get_cache().set(_get_destination_key(basket_id, generation, destination), quotes, _get_ttl())
+
+
+def get_quotes(basket_id, generation, destination):
+    """
+    Return the quotes kept for a destination, or None.
+    """
+    return _get_cache().get(_get_destination_key(basket_id, generation, destination))
@@ -1,4 +1,5 @@
 import logging
+import time
 from decimal import Decimal as D
 
 from django.conf import settings
@@ -15,11 +16,16 @@ from oscar.apps.shipping.methods import FixedPrice, NoShippingRequired
 from oscar.core.exceptions import ModuleNotFoundError
 from oscar.core.loading import get_class, get_model
 
+from paypal import addresses, tracing
 from paypal.exceptions import PayPalError
+from paypal.express import quotes
 from paypal.express.exceptions import (
     EmptyBasketException, InvalidBasket, MissingShippingAddressException, MissingShippingMethodException)
-from paypal.express.facade import confirm_transaction, fetch_transaction_details, get_paypal_url
+from paypal.express.facade import (
+    confirm_transaction, fetch_transaction_details, get_paypal_url, recall_transaction_details,
+    remember_transaction_details)
 from paypal.express.gateway import buyer_pays_on_paypal
+from paypal.views import CheckoutDeadlineMixin
 
 # Load views dynamically
 PaymentDetailsView = get_class('checkout.views', 'PaymentDetailsView')
@@ -41,7 +47,7 @@ except ModuleNotFoundError:
 logger = logging.getLogger('paypal.express')
 
 
-class RedirectView(CheckoutSessionMixin, RedirectView):
+class RedirectView(CheckoutDeadlineMixin, CheckoutSessionMixin, RedirectView):
     """
     Initiate the transaction with Paypal and redirect the user
     to PayPal's Express Checkout to perform the transaction.
@@ -160,7 +166,7 @@ class CancelResponseView(RedirectView):
 # Upgrading notes: when we drop support for Oscar 0.6, this class can be
 # refactored to pass variables around more explicitly (instead of assigning
 # things to self so they are accessible in a later method).
-class SuccessResponseView(PaymentDetailsView):
+class SuccessResponseView(CheckoutDeadlineMixin, PaymentDetailsView):
     template_name_preview = 'paypal/express/preview.html'
     preview = True
 
@@ -187,6 +193,7 @@ class SuccessResponseView(PaymentDetailsView):
 
         try:
             self.txn = fetch_transaction_details(self.token)
+            self.check_transaction_details()
         except PayPalError as e:
             logger.warning("Unable to fetch transaction details for token %s: %s", self.token, e)
             messages.error(self.request, self.error_message)
@@ -202,12 +209,15 @@ class SuccessResponseView(PaymentDetailsView):
         if buyer_pays_on_paypal():
             return self.submit(**self.build_submission(basket=kwargs['basket']))
 
+        remember_transaction_details(self.token, kwargs['basket'].id, self.payer_id, self.txn)
+
         logger.info(
             "Basket #%s - showing preview with payer ID %s and token %s",
             kwargs['basket'].id, self.payer_id, self.token)
 
         return super(SuccessResponseView, self).get(request, *args, **kwargs)
 
+    @tracing.traced()
     def load_frozen_basket(self, basket_id):
         # Lookup the frozen basket that this txn corresponds to
         try:
@@ -235,7 +245,7 @@ class SuccessResponseView(PaymentDetailsView):
             'payer_id': self.payer_id,
             'token': self.token,
             'paypal_user_email': self.txn.value('EMAIL'),
-            'paypal_amount': D(self.txn.value('AMT')),
+            'paypal_amount': self.txn.amount,
         })
 
         return ctx
@@ -244,8 +254,9 @@ class SuccessResponseView(PaymentDetailsView):
         """
         Place an order.
 
-        We fetch the txn details again and then proceed with oscar's standard
-        payment details view for placing the order.
+        We reuse the txn details fetched for the preview (or fetch them again
+        if they are gone) and then proceed with oscar's standard payment
+        details view for placing the order.
         """
         if buyer_pays_on_paypal():
             return HttpResponseBadRequest()  # we don't expect any user here if we let users buy on PayPal
@@ -258,8 +269,11 @@ class SuccessResponseView(PaymentDetailsView):
             messages.error(self.request, self.error_message)
             return redirect('basket:summary')
 
+        self.txn = recall_transaction_details(self.token, kwargs['basket_id'], self.payer_id)
         try:
-            self.txn = fetch_transaction_details(self.token)
+            if self.txn is None:
+                self.txn = fetch_transaction_details(self.token)
+            self.check_transaction_details()
         except PayPalError:
             # Unable to fetch txn details from PayPal - we have to bail out
             messages.error(self.request, self.error_message)
@@ -274,6 +288,14 @@ class SuccessResponseView(PaymentDetailsView):
         submission = self.build_submission(basket=basket)
         return self.submit(**submission)
 
+    def check_transaction_details(self):
+        """
+        Raise PayPalError if the transaction details lack the shipping charge,
+        which the order's shipping method may be built from.
+        """
+        if self.txn.decimal('PAYMENTREQUEST_0_SHIPPINGAMT') is None:
+            raise PayPalError("No valid shipping charge in the details of token %s" % self.token)
+
     def build_submission(self, **kwargs):
         submission = super(
             SuccessResponseView, self).build_submission(**kwargs)
@@ -293,7 +315,7 @@ class SuccessResponseView(PaymentDetailsView):
         try:
             confirm_txn = confirm_transaction(
                 kwargs['payer_id'], kwargs['token'], kwargs['txn'].amount,
-                kwargs['txn'].currency)
+                kwargs['txn'].currency, basket_id=self.kwargs.get('basket_id'))
         except PayPalError:
             raise UnableToTakePayment()
         if not confirm_txn.is_successful:
@@ -335,7 +357,7 @@ class SuccessResponseView(PaymentDetailsView):
             line4=self.txn.value('PAYMENTREQUEST_0_SHIPTOCITY', default=""),
             state=self.txn.value('PAYMENTREQUEST_0_SHIPTOSTATE', default=""),
             postcode=self.txn.value('PAYMENTREQUEST_0_SHIPTOZIP', default=""),
-            country=Country.objects.get(iso_3166_1_a2=self.txn.value('PAYMENTREQUEST_0_SHIPTOCOUNTRYCODE')),
+            country=addresses.get_country(self.txn.value('PAYMENTREQUEST_0_SHIPTOCOUNTRYCODE')),
             phone_number=self.txn.value('PAYMENTREQUEST_0_SHIPTOPHONENUM', default=""),
         )
 
@@ -347,6 +369,7 @@ class SuccessResponseView(PaymentDetailsView):
             if method.name == name:
                 return method
 
+    @tracing.traced()
     def get_shipping_method(self, basket, shipping_address=None, **kwargs):
         """
         Return the shipping method used
@@ -355,7 +378,7 @@ class SuccessResponseView(PaymentDetailsView):
             return NoShippingRequired()
 
         # Instantiate a new FixedPrice shipping method instance
-        charge_incl_tax = D(self.txn.value('PAYMENTREQUEST_0_SHIPPINGAMT'))
+        charge_incl_tax = self.txn.decimal('PAYMENTREQUEST_0_SHIPPINGAMT')
 
         # Assume no tax for now
         charge_excl_tax = charge_incl_tax
@@ -379,93 +402,92 @@ class SuccessResponseView(PaymentDetailsView):
 
 
 class ShippingOptionsView(View):
+    """
+    Answer PayPal's Instant Update callback with the shipping methods
+    available for the address the buyer picked.
+
+    PayPal gives up after PAYPAL_CALLBACK_TIMEOUT seconds, so quotes are kept
+    per basket and destination (see paypal.express.quotes).  Once calculating
+    them has taken PAYPAL_SHIPPING_QUOTE_BUDGET seconds, the quotes sent by
+    SetExpressCheckout are returned instead.
+    """
 
     def get(self, request, *args, **kwargs):
         """
         We use the shipping address given to use by PayPal to
         determine the available shipping method
         """
-        # Basket ID is passed within the URL path.  We need to do this as some
-        # shipping options depend on the user and basket contents.  PayPal do
-        # pass back details of the basket contents but it would be royal pain to
-        # reconstitute the basket based on those - easier to just to piggy-back
-        # the basket ID in the callback URL.
-        basket = get_object_or_404(Basket, id=kwargs['basket_id'])
-        user = basket.owner
-        if not user:
-            user = AnonymousUser()
-
-        # Create a shipping address instance using the data passed back
-        country_code = self.request.GET.get(
-            'SHIPTOCOUNTRY', None)
-        try:
-            country = Country.objects.get(iso_3166_1_a2=country_code)
-        except Country.DoesNotExist:
-            country = Country()
-
-        shipping_address = ShippingAddress(
-            line1=self.request.GET.get('SHIPTOSTREET', ''),
-            line2=self.request.GET.get('SHIPTOSTREET2', ''),
-            line4=self.request.GET.get('SHIPTOCITY', ''),
-            state=self.request.GET.get('SHIPTOSTATE', ''),
-            postcode=self.request.GET.get('SHIPTOZIP', ''),
-            country=country
-        )
-        methods = Repository().get_shipping_methods(
-            basket=basket, shipping_addr=shipping_address,
-            request=self.request, user=user)
-        return self.render_to_response(methods, basket)
+        return self.render_quotes(self.get_quotes(self.request.GET, kwargs['basket_id']), kwargs['basket_id'])
 
     def post(self, request, *args, **kwargs):
         """
         We use the shipping address given to use by PayPal to
         determine the available shipping method
         """
+        return self.render_quotes(self.get_quotes(self.request.POST, kwargs['basket_id']), kwargs['basket_id'])
+
+    def get_quotes(self, data, basket_id):
+        deadline = time.monotonic() + quotes.get_budget()
+        destination = quotes.get_destination(
+            data.get('SHIPTOCOUNTRY', None), data.get('SHIPTOSTATE', ''), data.get('SHIPTOZIP', ''))
+        generation, basket_quotes = quotes.get_basket_quotes(basket_id)
+        if generation is not None:
+            shipping_quotes = quotes.get_quotes(basket_id, generation, destination)
+            if shipping_quotes is not None:
+                return shipping_quotes
+
         # Basket ID is passed within the URL path.  We need to do this as some
         # shipping options depend on the user and basket contents.  PayPal do
         # pass back details of the basket contents but it would be royal pain to
         # reconstitute the basket based on those - easier to just to piggy-back
         # the basket ID in the callback URL.
-        basket = get_object_or_404(Basket, id=kwargs['basket_id'])
+        basket = get_object_or_404(Basket, id=basket_id)
         user = basket.owner
         if not user:
             user = AnonymousUser()
 
         # Create a shipping address instance using the data passed back
-        country_code = self.request.POST.get(
-            'SHIPTOCOUNTRY', None)
         try:
-            country = Country.objects.get(iso_3166_1_a2=country_code)
+            country = addresses.get_country(data.get('SHIPTOCOUNTRY', None))
         except Country.DoesNotExist:
             country = Country()
 
         shipping_address = ShippingAddress(
-            line1=self.request.POST.get('SHIPTOSTREET', ''),
-            line2=self.request.POST.get('SHIPTOSTREET2', ''),
-            line4=self.request.POST.get('SHIPTOCITY', ''),
-            state=self.request.POST.get('SHIPTOSTATE', ''),
-            postcode=self.request.POST.get('SHIPTOZIP', ''),
+            line1=data.get('SHIPTOSTREET', ''),
+            line2=data.get('SHIPTOSTREET2', ''),
+            line4=data.get('SHIPTOCITY', ''),
+            state=data.get('SHIPTOSTATE', ''),
+            postcode=data.get('SHIPTOZIP', ''),
             country=country
         )
         methods = Repository().get_shipping_methods(
             basket=basket, shipping_addr=shipping_address,
             request=self.request, user=user)
-        return self.render_to_response(methods, basket)
+
+        shipping_quotes = []
+        for method in methods:
+            if basket_quotes is not None and time.monotonic() > deadline:
+                logger.warning("Basket #%s - out of time calculating postage costs, "
+                               "returning those sent to PayPal", basket_id)
+                return basket_quotes
+            shipping_quotes.append(quotes.get_quote(method, basket))
+        if generation is not None:
+            quotes.store_quotes(basket_id, generation, destination, shipping_quotes)
+        return shipping_quotes
 
     def render_to_response(self, methods, basket):
+        return self.render_quotes([quotes.get_quote(method, basket) for method in methods], basket.id)
+
+    def render_quotes(self, shipping_quotes, basket_id):
         pairs = [
             ('METHOD', 'CallbackResponse'),
             ('CALLBACKVERSION', '61.0'),
             ('CURRENCYCODE', self.request.POST.get('CURRENCYCODE', 'GBP')),
         ]
-        if methods:
-            for index, method in enumerate(methods):
-                charge = method.calculate(basket).incl_tax
-
-                pairs.append(('L_SHIPPINGOPTIONNAME%d' % index,
-                              str(method.name)))
-                pairs.append(('L_SHIPPINGOPTIONLABEL%d' % index,
-                              str(method.description)))
+        if shipping_quotes:
+            for index, (name, description, charge) in enumerate(shipping_quotes):
+                pairs.append(('L_SHIPPINGOPTIONNAME%d' % index, name))
+                pairs.append(('L_SHIPPINGOPTIONLABEL%d' % index, description))
                 pairs.append(('L_SHIPPINGOPTIONAMOUNT%d' % index, charge))
                 # For now, we assume tax and insurance to be zero
                 pairs.append(('L_TAXAMT%d' % index, D('0.00')))
@@ -479,5 +501,5 @@ class ShippingOptionsView(View):
             pairs.append(('NO_SHIPPING_OPTION_DETAILS', 1))
 
         payload = urlencode(pairs)
-        logger.debug("Basket #%s - returning postage costs payload = '%s'", basket.id, payload)
+        logger.debug("Basket #%s - returning postage costs payload = '%s'", basket_id, payload)
         return HttpResponse(payload)
@@ -17,6 +17,8 @@ class ExpressCheckoutDashboardApplication(OscarDashboardConfig):
         urlpatterns = [
             path('transactions/', views.TransactionListView.as_view(),
                  name='paypal-transaction-list'),
+            path('transactions/export/', views.TransactionExportView.as_view(),
+                 name='paypal-transaction-export'),
             path('transactions/<int:pk>/', views.TransactionDetailView.as_view(),
                  name='paypal-transaction-detail'),
         ]
@@ -0,0 +1,19 @@
+from django import forms
+from django.utils.translation import gettext_lazy as _
+
+from paypal.express_checkout.models import ExpressCheckoutTransaction
+from paypal.forms import TransactionSearchForm
+
+STATUS_CHOICES = [('', _("All"))] + [(status, status) for status in (
+    ExpressCheckoutTransaction.CREATED, ExpressCheckoutTransaction.SAVED, ExpressCheckoutTransaction.APPROVED,
+    ExpressCheckoutTransaction.VOIDED, ExpressCheckoutTransaction.COMPLETED)]
+
+
+class ExpressCheckoutTransactionSearchForm(TransactionSearchForm):
+    status = forms.ChoiceField(label=_("Status"), choices=STATUS_CHOICES, required=False)
+    order_id = forms.CharField(label=_("Order ID"), required=False)
+
+    lookups = {
+        'status': 'status',
+        'order_id': 'order_id',
+    }
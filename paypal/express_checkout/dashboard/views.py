@@ -1,12 +1,24 @@
 from django.views import generic
 
+from paypal.export import TransactionExportView as BaseTransactionExportView
 from paypal.express_checkout import models
+from paypal.pagination import TransactionListMixin
 
+from .forms import ExpressCheckoutTransactionSearchForm
 
-class TransactionListView(generic.ListView):
+
+class TransactionListView(TransactionListMixin, generic.ListView):
     model = models.ExpressCheckoutTransaction
     template_name = 'paypal/express_checkout/dashboard/transaction_list.html'
     context_object_name = 'transactions'
+    form_class = ExpressCheckoutTransactionSearchForm
+    # Columns shown in the list; the address is not loaded
+    list_fields = ('order_id', 'capture_id', 'refund_id', 'authorization_id', 'amount', 'currency', 'status',
+                   'intent', 'date_created')
+
+
+class TransactionExportView(BaseTransactionExportView):
+    integration = 'express_checkout'
 
 
 class TransactionDetailView(generic.DetailView):
@@ -1,14 +1,47 @@
 import json
+import threading
 
 from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import request_finished, request_started
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
-from paypal.express_checkout.gateway import PaymentProcessor, buyer_pays_on_paypal
+from paypal import tracing
+from paypal.express_checkout.gateway import buyer_pays_on_paypal, get_async_payment_processor, get_payment_processor
 from paypal.express_checkout.models import ExpressCheckoutTransaction as Transaction
 
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    sync_to_async = None
+
+# Transactions loaded during the current request, by order ID, so that eg
+# fetch_transaction_details and capture_order don't each query the same row.
+# Only used between the request_started and request_finished signals.
+_identity_map = threading.local()
+
+
+@receiver(request_started)
+def _start_identity_map(**kwargs):
+    _identity_map.transactions = {}
+
+
+@receiver(request_finished)
+def _clear_identity_map(**kwargs):
+    _identity_map.transactions = None
+
+
+def _get_transaction(token):
+    transactions = getattr(_identity_map, 'transactions', None)
+    if transactions is None:
+        return Transaction.objects.get(order_id=token)
+    if token not in transactions:
+        transactions[token] = Transaction.objects.get(order_id=token)
+    return transactions[token]
+
 
 def get_intent():
     intent = getattr(settings, 'PAYPAL_ORDER_INTENT', Transaction.CAPTURE)
@@ -18,16 +51,8 @@ def get_intent():
     return intent
 
 
-def get_paypal_url(basket, user=None, shipping_address=None, shipping_method=None, host=None):
-    """
-    Return the URL for a PayPal Express transaction.
-
-    This involves registering the txn with PayPal to get a one-time
-    URL.  If a shipping method and shipping address are passed, then these are
-    given to PayPal directly - this is used within when using PayPal as a
-    payment method.
-    """
-
+def _get_create_order_kwargs(
+        basket, user=None, shipping_address=None, shipping_method=None, host=None, attempt=None):
     if basket.currency:
         currency = basket.currency
     else:
@@ -60,88 +85,188 @@ def get_paypal_url(basket, user=None, shipping_address=None, shipping_method=Non
         shipping_charge = shipping_method.calculate(basket).incl_tax
         order_total += shipping_charge
 
-    intent = get_intent()
-
-    result = PaymentProcessor().create_order(
-        basket=basket,
-        currency=currency,
-        return_url=return_url,
-        cancel_url=cancel_url,
-        order_total=order_total,
-        address=address,
-        shipping_charge=shipping_charge,
-        intent=intent,
-    )
-
-    Transaction.objects.create(
-        order_id=result.id,
-        amount=order_total,
-        currency=currency,
-        status=result.status,
-        intent=intent,
-    )
+    return {
+        'basket': basket,
+        'currency': currency,
+        'return_url': return_url,
+        'cancel_url': cancel_url,
+        'order_total': order_total,
+        'address': address,
+        'shipping_charge': shipping_charge,
+        'intent': get_intent(),
+        'attempt': attempt,
+    }
+
+
+def _record_created_order(result, order_kwargs):
+    # A repeated request (eg a double click) gets the order created by the
+    # first one
+    transaction, __ = Transaction.objects.update_or_create(order_id=result.id, defaults={
+        'amount': order_kwargs['order_total'],
+        'currency': order_kwargs['currency'],
+        'status': result.status,
+        'intent': order_kwargs['intent'],
+    })
+    transactions = getattr(_identity_map, 'transactions', None)
+    if transactions is not None:
+        transactions[transaction.order_id] = transaction
 
     for link in result.links:
         if link.rel == 'approve':
             return link.href
 
 
+@tracing.traced()
+def get_paypal_url(basket, user=None, shipping_address=None, shipping_method=None, host=None, attempt=None):
+    """
+    Return the URL for a PayPal Express transaction.
+
+    This involves registering the txn with PayPal to get a one-time
+    URL.  If a shipping method and shipping address are passed, then these are
+    given to PayPal directly - this is used within when using PayPal as a
+    payment method.  ``attempt`` identifies the checkout attempt (see
+    PaymentProcessor.get_create_order_request).
+    """
+    order_kwargs = _get_create_order_kwargs(basket, user, shipping_address, shipping_method, host, attempt)
+    result = get_payment_processor().create_order(**order_kwargs)
+    return _record_created_order(result, order_kwargs)
+
+
+def _record_order_details(transaction, result):
+    transaction.payer_id = result.payer.payer_id
+    transaction.email = result.payer.email_address
+    transaction.address_full_name = result.purchase_units[0].shipping.name.full_name
+    transaction.address = json.dumps(result.purchase_units[0].shipping.address.dict())
+    transaction.save()
+
+
+def _record_authorization(transaction, result):
+    transaction.authorization_id = result.purchase_units[0].payments.authorizations[0].id
+    transaction.save()
+
+
+@tracing.traced()
 def fetch_transaction_details(token):
     """
     Fetch the details about the PayPal transaction.
     """
 
-    transaction = Transaction.objects.get(order_id=token)
+    transaction = _get_transaction(token)
 
     if not transaction.payer_id:
-        result = PaymentProcessor().get_order(token)
-        transaction.payer_id = result.payer.payer_id
-        transaction.email = result.payer.email_address
-        transaction.address_full_name = result.purchase_units[0].shipping.name.full_name
-        transaction.address = json.dumps(result.purchase_units[0].shipping.address.dict())
-        transaction.save()
+        result = get_payment_processor().get_order(token)
+        _record_order_details(transaction, result)
 
     if transaction.is_authorization:
-        result = PaymentProcessor().authorize_order(transaction.order_id)
-        transaction.authorization_id = result.purchase_units[0].payments.authorizations[0].id
-        transaction.save()
+        result = get_payment_processor().authorize_order(transaction.order_id)
+        _record_authorization(transaction, result)
 
     return transaction
 
 
-def capture_order(token):
-    transaction = Transaction.objects.get(order_id=token)
+def _get_capture_token(transaction):
     if transaction.is_authorization:
-        capture_token = transaction.authorization_id
-    else:
-        capture_token = transaction.order_id
+        return transaction.authorization_id
+    return transaction.order_id
 
-    result = PaymentProcessor().capture_order(capture_token, transaction.intent)
+
+def _record_capture(transaction, result):
     transaction.capture_id = result.purchase_units[0].payments.captures[0].id
     transaction.status = result.status
     transaction.save()
-    return transaction
 
 
-def refund_order(token):
-    transaction = Transaction.objects.get(order_id=token)
+@tracing.traced()
+def capture_order(token):
+    transaction = _get_transaction(token)
+    result = get_payment_processor().capture_order(_get_capture_token(transaction), transaction.intent)
+    _record_capture(transaction, result)
+    return transaction
 
-    result = PaymentProcessor().refund_order(transaction.capture_id, transaction.amount, transaction.currency)
 
+def _record_refund(transaction, result):
     transaction.refund_id = result.id
     transaction.save()
+
+
+@tracing.traced()
+def refund_order(token):
+    transaction = _get_transaction(token)
+
+    result = get_payment_processor().refund_order(transaction.capture_id, transaction.amount, transaction.currency)
+
+    _record_refund(transaction, result)
     return transaction
 
 
+def _record_void(transaction):
+    transaction.status = Transaction.VOIDED
+    transaction.save()
+
+
+@tracing.traced()
 def void_authorization(token):
     """
     Void a previous authorization.
     """
 
-    transaction = Transaction.objects.get(order_id=token)
+    transaction = _get_transaction(token)
 
-    PaymentProcessor().void_authorized_order(transaction.authorization_id)
+    get_payment_processor().void_authorized_order(transaction.authorization_id)
 
-    transaction.status = Transaction.VOIDED
-    transaction.save()
+    _record_void(transaction)
+    return transaction
+
+
+# Coroutine versions of the functions above, for use under ASGI.  Database
+# access runs in a worker thread via asgiref's sync_to_async.
+
+
+@tracing.traced()
+async def async_get_paypal_url(
+        basket, user=None, shipping_address=None, shipping_method=None, host=None, attempt=None):
+    order_kwargs = await sync_to_async(_get_create_order_kwargs)(
+        basket, user, shipping_address, shipping_method, host, attempt)
+    result = await get_async_payment_processor().create_order(**order_kwargs)
+    return await sync_to_async(_record_created_order)(result, order_kwargs)
+
+
+@tracing.traced()
+async def async_fetch_transaction_details(token):
+    transaction = await sync_to_async(_get_transaction)(token)
+
+    if not transaction.payer_id:
+        result = await get_async_payment_processor().get_order(token)
+        await sync_to_async(_record_order_details)(transaction, result)
+
+    if transaction.is_authorization:
+        result = await get_async_payment_processor().authorize_order(transaction.order_id)
+        await sync_to_async(_record_authorization)(transaction, result)
+
+    return transaction
+
+
+@tracing.traced()
+async def async_capture_order(token):
+    transaction = await sync_to_async(_get_transaction)(token)
+    result = await get_async_payment_processor().capture_order(
+        _get_capture_token(transaction), transaction.intent)
+    await sync_to_async(_record_capture)(transaction, result)
+    return transaction
+
+
+@tracing.traced()
+async def async_refund_order(token):
+    transaction = await sync_to_async(_get_transaction)(token)
+    result = await get_async_payment_processor().refund_order(
+        transaction.capture_id, transaction.amount, transaction.currency)
+    await sync_to_async(_record_refund)(transaction, result)
+    return transaction
+
+
+@tracing.traced()
+async def async_void_authorization(token):
+    transaction = await sync_to_async(_get_transaction)(token)
+    await get_async_payment_processor().void_authorized_order(transaction.authorization_id)
+    await sync_to_async(_record_void)(transaction)
     return transaction
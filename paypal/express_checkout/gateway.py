@@ -1,14 +1,30 @@
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+import time
+import weakref
 from decimal import Decimal as D
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.template.defaultfilters import striptags, truncatechars
 from django.utils.translation import gettext_lazy as _
-from paypalcheckoutsdk.core import LiveEnvironment, PayPalHttpClient, SandboxEnvironment
+from paypalcheckoutsdk.core import (
+    AccessToken, AccessTokenRequest, LiveEnvironment, PayPalEnvironment, PayPalHttpClient, RefreshTokenRequest,
+    SandboxEnvironment)
 from paypalcheckoutsdk.orders import (
     OrdersAuthorizeRequest, OrdersCaptureRequest, OrdersCreateRequest, OrdersGetRequest)
 from paypalcheckoutsdk.payments import AuthorizationsCaptureRequest, AuthorizationsVoidRequest, CapturesRefundRequest
 
+from paypal import addresses, gateway, idempotency, instrumentation
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    sync_to_async = None
+
 INTENT_AUTHORIZE = 'AUTHORIZE'
 INTENT_CAPTURE = 'CAPTURE'
 
@@ -43,8 +59,198 @@ def get_landing_page():
     return landing_page
 
 
+class PayPalClient(PayPalHttpClient):
+    """
+    PayPal SDK client which sends requests through the shared connection pool
+    (with the timeouts and retries of paypal.gateway.send) and keeps its OAuth
+    access token until shortly before it expires.
+
+    The token is refreshed by a single thread at a time - concurrent callers
+    wait for that refresh instead of each requesting a new token.
+    """
+
+    def __init__(self, environment, refresh_token=None):
+        super().__init__(environment, refresh_token=refresh_token)
+        self._token_lock = threading.Lock()
+
+    def __call__(self, request):
+        if 'Authorization' not in request.headers and not isinstance(
+                request, (AccessTokenRequest, RefreshTokenRequest)):
+            request.headers['Authorization'] = self.get_access_token().authorization_string()
+        super().__call__(request)
+
+    def _has_valid_access_token(self):
+        token = self._access_token
+        if token is None:
+            return False
+        margin = getattr(settings, 'PAYPAL_ACCESS_TOKEN_EXPIRY_MARGIN', 60)
+        return token.created_at + token.expires_in - margin > time.time()
+
+    def get_access_token(self):
+        if not self._has_valid_access_token():
+            with self._token_lock:
+                # Another thread may have refreshed the token while we waited
+                if not self._has_valid_access_token():
+                    result = self.execute(AccessTokenRequest(self.environment, self._refresh_token)).result
+                    self._access_token = AccessToken(
+                        access_token=result.access_token,
+                        expires_in=result.expires_in,
+                        token_type=result.token_type,
+                    )
+        return self._access_token
+
+    def prepare_request(self, request):
+        """
+        Return a copy of the request with headers injected, and its encoded
+        body.
+        """
+        request = copy.deepcopy(request)
+        if not hasattr(request, 'headers'):
+            request.headers = {}
+
+        for injector in self._injectors:
+            injector(request)
+
+        formatted_headers = self.format_headers(request.headers)
+        if 'user-agent' not in formatted_headers:
+            request.headers['user-agent'] = self.get_user_agent()
+
+        data = None
+        if getattr(request, 'body', None) is not None:
+            raw_headers = request.headers
+            request.headers = formatted_headers
+            data = self.encoder.serialize_request(request)
+            request.headers = self.map_headers(raw_headers, formatted_headers)
+        return request, data
+
+    def execute(self, request):
+        request, data = self.prepare_request(request)
+        url = self.environment.base_url + request.path
+        method = type(request).__name__
+        call = instrumentation.start_call('express_checkout', method, url)
+        try:
+            response = gateway.send(method, lambda timeout: gateway.get_session().request(
+                method=request.verb,
+                url=url,
+                headers=request.headers,
+                data=data,
+                timeout=timeout,
+            ), 'express_checkout')
+            call.response(response, instrumentation.body_size(data))
+            result = self.parse_response(response)
+        except Exception as e:
+            call.failed(e)
+            raise
+        call.mark('parse')
+        call.finished(True)
+        return result
+
+
+class AsyncPayPalClient(PayPalClient):
+    """
+    Asyncio flavour of PayPalClient, built on the shared httpx client of the
+    running event loop.
+    """
+
+    def __init__(self, environment, refresh_token=None):
+        super().__init__(environment, refresh_token=refresh_token)
+        # The client is shared by the whole process but asyncio locks are
+        # bound to the event loop they are first used in, so each loop gets
+        # its own
+        self._async_token_locks = weakref.WeakKeyDictionary()
+
+    def _get_async_token_lock(self):
+        loop = asyncio.get_event_loop()
+        with self._token_lock:
+            lock = self._async_token_locks.get(loop)
+            if lock is None:
+                lock = self._async_token_locks[loop] = asyncio.Lock()
+        return lock
+
+    async def get_access_token(self):
+        if not self._has_valid_access_token():
+            async with self._get_async_token_lock():
+                # Another coroutine may have refreshed the token while we waited
+                if not self._has_valid_access_token():
+                    result = (await self.execute(AccessTokenRequest(self.environment, self._refresh_token))).result
+                    self._access_token = AccessToken(
+                        access_token=result.access_token,
+                        expires_in=result.expires_in,
+                        token_type=result.token_type,
+                    )
+        return self._access_token
+
+    async def execute(self, request):
+        if not isinstance(request, (AccessTokenRequest, RefreshTokenRequest)):
+            request = copy.deepcopy(request)
+            if not hasattr(request, 'headers'):
+                request.headers = {}
+            if 'Authorization' not in request.headers:
+                request.headers['Authorization'] = (await self.get_access_token()).authorization_string()
+        request, data = self.prepare_request(request)
+        url = self.environment.base_url + request.path
+        method = type(request).__name__
+        call = instrumentation.start_call('express_checkout', method, url)
+        try:
+            response = await gateway.async_send(method, lambda timeout: gateway.get_async_client().request(
+                method=request.verb,
+                url=url,
+                headers=request.headers,
+                content=data,
+                timeout=timeout,
+            ), 'express_checkout')
+            call.response(response, instrumentation.body_size(data))
+            result = self.parse_response(response)
+        except Exception as e:
+            call.failed(e)
+            raise
+        call.mark('parse')
+        call.finished(True)
+        return result
+
+
+_processors = {}
+_processors_lock = threading.Lock()
+
+
+def _get_processor(processor_class):
+    key = (
+        processor_class,
+        settings.PAYPAL_CLIENT_ID,
+        settings.PAYPAL_CLIENT_SECRET,
+        getattr(settings, 'PAYPAL_SANDBOX_MODE', True),
+        getattr(settings, 'PAYPAL_API_URL', None),
+    )
+    processor = _processors.get(key)
+    if processor is None:
+        with _processors_lock:
+            processor = _processors.get(key)
+            if processor is None:
+                processor = _processors[key] = processor_class()
+    return processor
+
+
+def get_payment_processor():
+    """
+    Return the process-wide PaymentProcessor for the configured credentials.
+
+    Sharing the processor means its client, and therefore its access token, is
+    reused across requests.
+    """
+    return _get_processor(PaymentProcessor)
+
+
+def get_async_payment_processor():
+    """
+    Return the process-wide AsyncPaymentProcessor for the configured
+    credentials.
+    """
+    return _get_processor(AsyncPaymentProcessor)
+
+
 class PaymentProcessor:
     client = None
+    client_class = PayPalClient
 
     def __init__(self):
         credentials = {
@@ -52,12 +258,15 @@ class PaymentProcessor:
             'client_secret': settings.PAYPAL_CLIENT_SECRET,
         }
 
-        if getattr(settings, 'PAYPAL_SANDBOX_MODE', True):
+        api_url = getattr(settings, 'PAYPAL_API_URL', None)
+        if api_url is not None:
+            environment = PayPalEnvironment(apiUrl=api_url, webUrl=api_url, **credentials)
+        elif getattr(settings, 'PAYPAL_SANDBOX_MODE', True):
             environment = SandboxEnvironment(**credentials)
         else:
             environment = LiveEnvironment(**credentials)
 
-        self.client = PayPalHttpClient(environment)
+        self.client = self.client_class(environment)
 
     def build_order_create_request_body(
             self, basket, currency, return_url, cancel_url, order_total,
@@ -122,7 +331,7 @@ class PaymentProcessor:
                     'address_line_1': address.line1,
                     'address_line_2': address.line2,
                     'admin_area_2': address.line4,
-                    'admin_area_1': address.state,
+                    'admin_area_1': addresses.normalize_state(address.country.iso_3166_1_a2, address.state),
                     'postal_code': address.postcode,
                     'country_code': address.country.iso_3166_1_a2
                 }
@@ -143,13 +352,34 @@ class PaymentProcessor:
             }
         }
 
+    def set_request_id(self, request, basket_id, token, amount=None):
+        """
+        Send the idempotency key of the request as its PayPal-Request-Id, so
+        that PayPal answers a repeat with the result of the first request.
+        """
+        request.headers['PayPal-Request-Id'] = idempotency.get_key(
+            basket_id, token, type(request).__name__, amount)
+
+    def get_create_order_request(self, request_body, preferred_response='minimal', basket_id=None, attempt=None):
+        """
+        Return the request creating an order.  ``attempt`` identifies the
+        checkout attempt: a new attempt for the same basket, eg after the buyer
+        cancelled on PayPal, gets a new order.
+        """
+        request = OrdersCreateRequest()
+        request.prefer(f'return={preferred_response}')
+        request.request_body(request_body)
+        # There is no token yet: orders for the same basket are told apart by
+        # their contents, so that an edited basket gets a new order
+        digest = hashlib.sha1(json.dumps(request_body, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        self.set_request_id(request, basket_id, digest if attempt is None else f'{attempt}:{digest}')
+        return request
+
     def create_order(
             self, basket, currency, return_url, cancel_url, order_total,
-            address=None, shipping_charge=None, intent=None, preferred_response='minimal',
+            address=None, shipping_charge=None, intent=None, preferred_response='minimal', attempt=None,
     ):
-        request = OrdersCreateRequest()
-        request.prefer(f'return={preferred_response}')
-        request.request_body(self.build_order_create_request_body(
+        request = self.get_create_order_request(self.build_order_create_request_body(
             basket=basket,
             currency=currency,
             return_url=return_url,
@@ -158,7 +388,7 @@ class PaymentProcessor:
             intent=intent,
             address=address,
             shipping_charge=shipping_charge,
-        ))
+        ), preferred_response, basket.id, attempt)
         response = self.client.execute(request)
         return response.result
 
@@ -170,11 +400,15 @@ class PaymentProcessor:
     def get_authorize_request_body(self):
         return {}
 
-    def authorize_order(self, order_id):
+    def get_authorize_order_request(self, order_id):
         request = OrdersAuthorizeRequest(order_id)
         request.prefer("return=representation")  # TODO: probably here we can use default `prefer`?
         request.request_body(self.get_authorize_request_body())
-        response = self.client.execute(request)
+        self.set_request_id(request, None, order_id)
+        return request
+
+    def authorize_order(self, order_id):
+        response = self.client.execute(self.get_authorize_order_request(order_id))
         return response.result
 
     def void_authorized_order(self, authorization_id):
@@ -182,16 +416,75 @@ class PaymentProcessor:
         response = self.client.execute(request)
         return response.result
 
-    def refund_order(self, capture_id, amount, currency, preferred_response='minimal'):
+    def get_refund_order_request(self, capture_id, amount, currency, preferred_response='minimal'):
         request = CapturesRefundRequest(capture_id)
         request.prefer(f'return={preferred_response}')
         request.request_body(self.build_refund_order_request_body(amount, currency))
+        self.set_request_id(request, None, capture_id, amount)
+        return request
+
+    def refund_order(self, capture_id, amount, currency, preferred_response='minimal'):
+        request = self.get_refund_order_request(capture_id, amount, currency, preferred_response)
         response = self.client.execute(request)
         return response.result
 
-    def capture_order(self, token, intent, preferred_response='minimal'):
+    def get_capture_order_request(self, token, intent, preferred_response='minimal'):
         capture_request = INTENT_REQUEST_MAPPING[intent]
         request = capture_request(token)
         request.prefer(f'return={preferred_response}')
-        response = self.client.execute(request)
+        self.set_request_id(request, None, token)
+        return request
+
+    def capture_order(self, token, intent, preferred_response='minimal'):
+        response = self.client.execute(self.get_capture_order_request(token, intent, preferred_response))
+        return response.result
+
+
+class AsyncPaymentProcessor(PaymentProcessor):
+    """
+    Coroutine equivalents of the PaymentProcessor methods, for use under ASGI.
+
+    Building the order body reads the basket lines, so that part runs in a
+    worker thread.  Requires the optional ``httpx`` and ``asgiref``
+    dependencies.
+    """
+    client_class = AsyncPayPalClient
+
+    async def create_order(
+            self, basket, currency, return_url, cancel_url, order_total,
+            address=None, shipping_charge=None, intent=None, preferred_response='minimal', attempt=None,
+    ):
+        request_body = await sync_to_async(self.build_order_create_request_body)(
+            basket=basket,
+            currency=currency,
+            return_url=return_url,
+            cancel_url=cancel_url,
+            order_total=order_total,
+            intent=intent,
+            address=address,
+            shipping_charge=shipping_charge,
+        )
+        request = self.get_create_order_request(request_body, preferred_response, basket.id, attempt)
+        response = await self.client.execute(request)
+        return response.result
+
+    async def get_order(self, token):
+        response = await self.client.execute(OrdersGetRequest(token))
+        return response.result
+
+    async def authorize_order(self, order_id):
+        response = await self.client.execute(self.get_authorize_order_request(order_id))
+        return response.result
+
+    async def void_authorized_order(self, authorization_id):
+        response = await self.client.execute(AuthorizationsVoidRequest(authorization_id))
+        return response.result
+
+    async def refund_order(self, capture_id, amount, currency, preferred_response='minimal'):
+        request = self.get_refund_order_request(capture_id, amount, currency, preferred_response)
+        response = await self.client.execute(request)
+        return response.result
+
+    async def capture_order(self, token, intent, preferred_response='minimal'):
+        response = await self.client.execute(self.get_capture_order_request(token, intent, preferred_response))
         return response.result
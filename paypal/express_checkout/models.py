@@ -8,7 +8,7 @@ class ExpressCheckoutTransaction(models.Model):
     """
 
     # ID of PayPal's order instance
-    order_id = models.CharField(max_length=255)
+    order_id = models.CharField(max_length=255, unique=True)
     authorization_id = models.CharField(max_length=255, null=True, blank=True)
     capture_id = models.CharField(max_length=255, null=True, blank=True)
     refund_id = models.CharField(max_length=255, null=True, blank=True)
@@ -33,6 +33,13 @@ class ExpressCheckoutTransaction(models.Model):
     class Meta:
         ordering = ('-date_created',)
         app_label = 'paypal'
+        indexes = [
+            models.Index(fields=['capture_id']),
+            models.Index(fields=['authorization_id']),
+            models.Index(fields=['status', 'date_created']),
+            # Dashboard pagination
+            models.Index(fields=['date_created', 'id']),
+        ]
 
     def __str__(self):
         if self.intent:
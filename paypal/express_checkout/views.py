@@ -1,5 +1,6 @@
 import json
 import logging
+import uuid
 
 from django.conf import settings
 from django.contrib import messages
@@ -13,10 +14,13 @@ from oscar.apps.shipping.methods import NoShippingRequired
 from oscar.core.loading import get_class, get_model
 from paypalhttp.http_error import HttpError
 
+from paypal import addresses, tracing
+from paypal.exceptions import PayPalError
 from paypal.express.exceptions import (
     EmptyBasketException, InvalidBasket, MissingShippingAddressException, MissingShippingMethodException)
 from paypal.express_checkout.facade import capture_order, fetch_transaction_details, get_paypal_url
 from paypal.express_checkout.gateway import buyer_pays_on_paypal
+from paypal.views import CheckoutDeadlineMixin
 
 # Load views dynamically
 PaymentDetailsView = get_class('checkout.views', 'PaymentDetailsView')
@@ -33,8 +37,12 @@ Applicator = get_class('offer.applicator', 'Applicator')
 
 logger = logging.getLogger('paypal.express')
 
+# Session key of the current checkout attempt, which sets the idempotency key
+# of the orders created for it
+ATTEMPT_SESSION_KEY = 'paypal_express_checkout_attempt'
 
-class PaypalRedirectView(CheckoutSessionMixin, RedirectView):
+
+class PaypalRedirectView(CheckoutDeadlineMixin, CheckoutSessionMixin, RedirectView):
     """
     Initiate the transaction with Paypal and redirect the user
     to PayPal's Express Checkout to perform the transaction.
@@ -50,8 +58,8 @@ class PaypalRedirectView(CheckoutSessionMixin, RedirectView):
         try:
             basket = self.build_submission()['basket']
             url = self._get_redirect_url(basket, **kwargs)
-        except HttpError as e:
-            messages.error(self.request, e.message)
+        except (HttpError, PayPalError) as e:
+            messages.error(self.request, e.message if isinstance(e, HttpError) else str(e))
             if self.as_payment_method:
                 url = reverse('checkout:payment-details')
             else:
@@ -109,8 +117,21 @@ class PaypalRedirectView(CheckoutSessionMixin, RedirectView):
         if user.is_authenticated:
             params['user'] = user
 
+        params['attempt'] = self.get_checkout_attempt()
+
         return get_paypal_url(**params)
 
+    def get_checkout_attempt(self):
+        """
+        Return the ID of the current checkout attempt, which lasts until the
+        buyer cancels on PayPal.  Redirecting again within an attempt (eg
+        after a double click) returns the order already created.
+        """
+        session = self.request.session
+        if ATTEMPT_SESSION_KEY not in session:
+            session[ATTEMPT_SESSION_KEY] = uuid.uuid4().hex
+        return session[ATTEMPT_SESSION_KEY]
+
 
 class CancelResponseView(RedirectView):
     permanent = False
@@ -118,6 +139,8 @@ class CancelResponseView(RedirectView):
     def get(self, request, *args, **kwargs):
         basket = get_object_or_404(Basket, id=kwargs['basket_id'], status=Basket.FROZEN)
         basket.thaw()
+        # Checking out again is a new attempt, which needs a new order
+        request.session.pop(ATTEMPT_SESSION_KEY, None)
         logger.info(
             'Payment cancelled (token %s) - basket #%s thawed',
             request.GET.get('token', '<no token>'), basket.id,
@@ -129,7 +152,7 @@ class CancelResponseView(RedirectView):
         return reverse('basket:summary')
 
 
-class SuccessResponseView(PaymentDetailsView):
+class SuccessResponseView(CheckoutDeadlineMixin, PaymentDetailsView):
 
     template_name_preview = 'paypal/express/preview.html'
     preview = True
@@ -167,6 +190,11 @@ class SuccessResponseView(PaymentDetailsView):
             message = _('A problem occurred communicating with PayPal - please try again later')
             messages.error(self.request, message)
             return redirect('basket:summary')
+        except PayPalError as e:
+            logger.warning('Unable to fetch transaction details for token %s: %s', self.token, e)
+            message = _('A problem occurred communicating with PayPal - please try again later')
+            messages.error(self.request, message)
+            return redirect('basket:summary')
 
         # Reload frozen basket which is specified in the URL
         kwargs['basket'] = self.load_frozen_basket(kwargs['basket_id'])
@@ -185,6 +213,7 @@ class SuccessResponseView(PaymentDetailsView):
 
         return super().get(request, *args, **kwargs)
 
+    @tracing.traced()
     def load_frozen_basket(self, basket_id):
         # Lookup the frozen basket that this txn corresponds to
         try:
@@ -241,6 +270,10 @@ class SuccessResponseView(PaymentDetailsView):
             # Unable to fetch txn details from PayPal - we have to bail out
             messages.error(request, self.error_msg)
             return redirect('basket:summary')
+        except PayPalError as e:
+            logger.warning('Unable to fetch transaction details for token %s: %s', self.token, e)
+            messages.error(request, self.error_msg)
+            return redirect('basket:summary')
 
         # Reload frozen basket which is specified in the URL
         basket = self.load_frozen_basket(kwargs['basket_id'])
@@ -313,9 +346,10 @@ class SuccessResponseView(PaymentDetailsView):
             line4=address['admin_area_2'],
             state=address.get('admin_area_1', ''),
             postcode=address['postal_code'],
-            country=Country.objects.get(iso_3166_1_a2=address['country_code']),
+            country=addresses.get_country(address['country_code']),
         )
 
+    @tracing.traced()
     def get_shipping_method(self, basket, shipping_address=None, **kwargs):
         """
         Return the shipping method used
@@ -0,0 +1,32 @@
+import json
+
+from django.db import models
+
+
+class JSONTextField(models.TextField):
+    """
+    Stores a JSON document, as ``jsonb`` on PostgreSQL and as text elsewhere
+    (Django 2.2 has no portable JSONField).  Values are read back as Python
+    objects.
+    """
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'jsonb'
+        return super().db_type(connection)
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return json.dumps(value)
+
+    def value_to_string(self, obj):
+        return self.get_prep_value(self.value_from_object(obj))
@@ -0,0 +1,65 @@
+import datetime
+
+from django import forms
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+def _start_of_day(date):
+    value = datetime.datetime.combine(date, datetime.time.min)
+    if settings.USE_TZ:
+        value = timezone.make_aware(value)
+    return value
+
+
+class TransactionSearchForm(forms.Form):
+    """
+    Base filters for the transaction dashboards.  Subclasses add their own
+    fields and list them in ``lookups``, mapping a field name to the queryset
+    lookup it filters on.
+    """
+    date_from = forms.DateField(label=_("Date from"), required=False)
+    date_to = forms.DateField(label=_("Date to"), required=False)
+    amount_min = forms.DecimalField(label=_("Amount from"), required=False)
+    amount_max = forms.DecimalField(label=_("Amount to"), required=False)
+
+    lookups = {}
+
+    def filter_queryset(self, queryset):
+        data = self.cleaned_data
+        # Dates are compared as datetime ranges so that an index on
+        # date_created can be used
+        filters = {}
+        if data.get('date_from'):
+            filters['date_created__gte'] = _start_of_day(data['date_from'])
+        if data.get('date_to'):
+            filters['date_created__lt'] = _start_of_day(data['date_to'] + datetime.timedelta(days=1))
+        if data.get('amount_min') is not None:
+            filters['amount__gte'] = data['amount_min']
+        if data.get('amount_max') is not None:
+            filters['amount__lte'] = data['amount_max']
+        for name, lookup in self.lookups.items():
+            if data.get(name):
+                filters[lookup] = data[name]
+        return queryset.filter(**filters)
+
+
+class ResponseTimeForm(forms.Form):
+    date_from = forms.DateField(label=_("Date from"), required=False)
+    date_to = forms.DateField(label=_("Date to"), required=False)
+    period = forms.ChoiceField(label=_("Period"), required=False, choices=(('hour', _("Hour")), ('day', _("Day"))))
+    rollups = forms.BooleanField(label=_("Use rollups"), required=False)
+
+    def get_range(self):
+        """
+        Return the start and end datetimes selected, by default the last day.
+        """
+        data = self.cleaned_data if self.is_valid() else {}
+        end = timezone.now()
+        if data.get('date_to'):
+            end = _start_of_day(data['date_to'] + datetime.timedelta(days=1))
+        start = end - datetime.timedelta(days=1)
+        if data.get('date_from'):
+            start = _start_of_day(data['date_from'])
+        return start, end
@@ -1,40 +1,408 @@
+import asyncio
+import random
+import threading
 import time
+import weakref
 from urllib.parse import parse_qsl
 
 import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.utils.http import urlencode
+from django.utils.translation import gettext_lazy as _
+from requests.adapters import HTTPAdapter
 
-from paypal import exceptions
+from paypal import circuit, exceptions, instrumentation
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
-def post(url, params, encode=True):
+_session = None
+_session_lock = threading.Lock()
+
+# Async clients are bound to the event loop they were created in
+_async_clients = weakref.WeakKeyDictionary()
+
+# Default connect and read timeouts, in seconds
+DEFAULT_TIMEOUT = (5.0, 30.0)
+
+# Calls which change nothing at PayPal, so can be retried safely.  Methods are
+# named as in the instrumentation: NVP methods and Orders v2 request classes.
+IDEMPOTENT_METHODS = frozenset(['GetExpressCheckoutDetails', 'OrdersGetRequest'])
+
+# Statuses worth retrying an idempotent call on
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+_deadlines = threading.local()
+
+
+def _build_session():
+    """
+    Build a session whose connection pools are sized from the PAYPAL_HTTP_*
+    settings.  Per-host sizes can be set with PAYPAL_HTTP_HOST_POOL_MAXSIZE,
+    a dict mapping URL prefixes (eg 'https://api-3t.paypal.com') to a size.
+    """
+    session = requests.Session()
+    pool_maxsize = getattr(settings, 'PAYPAL_HTTP_POOL_MAXSIZE', 10)
+    pool_block = getattr(settings, 'PAYPAL_HTTP_POOL_BLOCK', False)
+    session.mount('https://', HTTPAdapter(pool_maxsize=pool_maxsize, pool_block=pool_block))
+    session.mount('http://', HTTPAdapter(pool_maxsize=pool_maxsize, pool_block=pool_block))
+    host_sizes = getattr(settings, 'PAYPAL_HTTP_HOST_POOL_MAXSIZE', {})
+    for prefix, maxsize in host_sizes.items():
+        session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=maxsize, pool_block=pool_block))
+    return session
+
+
+def get_session():
+    """
+    Return the process-wide session used to talk to PayPal.
+
+    The session keeps connections alive between calls so that consecutive
+    requests to the same PayPal host skip the TCP and TLS handshakes.  The
+    underlying urllib3 pools are thread-safe, so the same session is shared by
+    all threads.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def reset_session():
+    """
+    Close the shared session.  A new one is built on the next request.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_async_client():
+    """
+    Return the httpx client shared by all coroutines of the running event loop.
+
+    Requires the optional ``httpx`` dependency.
+    """
+    if httpx is None:
+        raise ImproperlyConfigured("httpx must be installed to use the async PayPal gateways")
+    loop = asyncio.get_event_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        limits = httpx.Limits(
+            max_connections=getattr(settings, 'PAYPAL_HTTP_ASYNC_MAX_CONNECTIONS', 100),
+            max_keepalive_connections=getattr(settings, 'PAYPAL_HTTP_POOL_MAXSIZE', 10),
+        )
+        client = _async_clients[loop] = httpx.AsyncClient(limits=limits)
+    return client
+
+
+def reset_async_clients():
+    """
+    Close the async clients of all event loops.  New ones are built on the
+    next request.
+    """
+    for loop, client in list(_async_clients.items()):
+        # The connections of a closed loop's client went with its transports
+        if not loop.is_closed():
+            # aclose() must run in the client's own loop, which may be running
+            # in another thread
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            else:
+                loop.run_until_complete(client.aclose())
+    _async_clients.clear()
+
+
+@receiver(setting_changed)
+def _reset_session_on_setting_change(setting, **kwargs):
+    if setting.startswith('PAYPAL_HTTP_'):
+        reset_session()
+        reset_async_clients()
+
+
+def get_pool_stats():
+    """
+    Return connection pool statistics for each host contacted so far.
+
+    A 'miss' is a request that had to open a new connection, a 'hit' is one
+    that reused a kept-alive connection.  Counters live on the pools, so they
+    are reset when the session is.
+    """
+    stats = {}
+    if _session is None:
+        return stats
+    for adapter in set(_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = '%s://%s:%s' % (pool.scheme, pool.host, pool.port)
+            host_stats = stats.setdefault(host, {'requests': 0, 'hits': 0, 'misses': 0})
+            host_stats['requests'] += pool.num_requests
+            host_stats['misses'] += pool.num_connections
+            host_stats['hits'] += max(pool.num_requests - pool.num_connections, 0)
+    return stats
+
+
+class DeadlineExceeded(exceptions.PayPalError):
+    pass
+
+
+class ConnectionFailed(exceptions.PayPalError):
+    """
+    Raised when PayPal couldn't be reached or didn't answer in time, once
+    any retries are exhausted.  The original error is the ``__cause__``.
+    """
+
+    def __init__(self, message=_("Unable to communicate with PayPal - please try again later")):
+        super().__init__(message)
+
+
+class deadline:
+    """
+    Context manager limiting the time all calls to PayPal made within it may
+    take, eg the calls of one checkout request.  Timeouts are shortened to
+    the time left, retries stop when it would run out and calls made after
+    it has run out raise DeadlineExceeded.  A ``seconds`` of None sets no
+    limit, and a nested deadline can't extend the enclosing one.
+
+    The deadline applies to the current thread.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __enter__(self):
+        self._previous = getattr(_deadlines, 'expiry', None)
+        if self.seconds is not None:
+            expiry = time.monotonic() + self.seconds
+            if self._previous is None or expiry < self._previous:
+                _deadlines.expiry = expiry
+        return self
+
+    def __exit__(self, *exc_info):
+        _deadlines.expiry = self._previous
+
+
+def get_time_left():
+    """
+    Return the number of seconds left before the current deadline, or None
+    when there is none.
+    """
+    expiry = getattr(_deadlines, 'expiry', None)
+    if expiry is None:
+        return None
+    return expiry - time.monotonic()
+
+
+def get_timeout(method=None):
+    """
+    Return the (connect, read) timeouts of a call to ``method``, from
+    PAYPAL_HTTP_TIMEOUTS (a dict mapping methods to timeouts) or else
+    PAYPAL_HTTP_TIMEOUT.  Either can give a single number for both.  The
+    timeouts are shortened to the time left before the deadline.
+    """
+    timeout = getattr(settings, 'PAYPAL_HTTP_TIMEOUTS', {}).get(method)
+    if timeout is None:
+        timeout = getattr(settings, 'PAYPAL_HTTP_TIMEOUT', DEFAULT_TIMEOUT)
+    if not isinstance(timeout, (tuple, list)):
+        timeout = (timeout, timeout)
+    connect, read = timeout
+    time_left = get_time_left()
+    if time_left is not None:
+        if time_left <= 0:
+            raise DeadlineExceeded(_("PayPal is taking too long to respond - please try again later"))
+        connect, read = min(connect, time_left), min(read, time_left)
+    return connect, read
+
+
+def get_retries(method=None):
+    """
+    Return how many times a failed call to ``method`` may be retried:
+    PAYPAL_HTTP_RETRIES for idempotent methods, none for the others.
+    """
+    if method not in IDEMPOTENT_METHODS:
+        return 0
+    return getattr(settings, 'PAYPAL_HTTP_RETRIES', 2)
+
+
+def get_backoff(attempt):
+    """
+    Return the number of seconds to wait before retry number ``attempt``
+    (from 0): a random duration up to an exponentially growing bound, so
+    that clients failing together don't retry together.
+    """
+    base = getattr(settings, 'PAYPAL_HTTP_RETRY_BACKOFF', 0.1)
+    cap = getattr(settings, 'PAYPAL_HTTP_RETRY_BACKOFF_MAX', 2.0)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _get_retry_delay(attempt, retries):
+    """
+    Return the number of seconds to wait before retrying a failed call, or
+    None if it shouldn't be.
+    """
+    if attempt >= retries:
+        return None
+    delay = get_backoff(attempt)
+    time_left = get_time_left()
+    if time_left is not None and delay >= time_left:
+        return None
+    return delay
+
+
+def _record_attempt(breaker, success, start, probe):
+    if breaker is not None:
+        breaker.record(success, time.monotonic() - start, probe)
+
+
+def send(method, request, integration=None):
+    """
+    Make a request with ``request(timeout)``, which returns a requests
+    response, and return the response.  Idempotent methods are retried on
+    connection errors, timeouts and RETRY_STATUSES.
+
+    When circuit breakers are enabled, each attempt goes through the breaker
+    of ``integration`` (see paypal.circuit).
+    """
+    breaker = circuit.get_breaker(integration)
+    retries = get_retries(method)
+    attempt = 0
+    while True:
+        timeout = get_timeout(method)
+        probe = breaker is not None and breaker.before_call()
+        start = time.monotonic()
+        try:
+            response = request(timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _record_attempt(breaker, False, start, probe)
+            delay = _get_retry_delay(attempt, retries)
+            if delay is None:
+                raise ConnectionFailed() from e
+        else:
+            _record_attempt(breaker, response.status_code not in RETRY_STATUSES, start, probe)
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            delay = _get_retry_delay(attempt, retries)
+            if delay is None:
+                return response
+        time.sleep(delay)
+        attempt += 1
+
+
+async def async_send(method, request, integration=None):
+    """
+    Coroutine version of send(), for ``request(timeout)`` coroutines
+    returning httpx responses.
+    """
+    breaker = circuit.get_breaker(integration)
+    retries = get_retries(method)
+    attempt = 0
+    while True:
+        connect, read = get_timeout(method)
+        probe = breaker is not None and breaker.before_call()
+        start = time.monotonic()
+        try:
+            response = await request(httpx.Timeout(read, connect=connect))
+        except httpx.TransportError as e:
+            _record_attempt(breaker, False, start, probe)
+            delay = _get_retry_delay(attempt, retries)
+            if delay is None:
+                raise ConnectionFailed() from e
+        else:
+            _record_attempt(breaker, response.status_code not in RETRY_STATUSES, start, probe)
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            delay = _get_retry_delay(attempt, retries)
+            if delay is None:
+                return response
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def _parse_response(payload, text, start_time):
+    # Convert response into a simple key-value format
+    pairs = {}
+    for key, value in parse_qsl(text):
+        pairs[key] = value
+
+    # Add audit information
+    pairs['_raw_request'] = payload
+    pairs['_raw_response'] = text
+    pairs['_response_time'] = (time.time() - start_time) * 1000.0
+
+    return pairs
+
+
+def get_response_data(pairs):
+    """
+    Return the response key-value pairs without the audit information.
+    """
+    return {key: value for key, value in pairs.items() if not key.startswith('_')}
+
+
+def post(url, params, encode=True, call=None, method=None, integration=None):
     """
     Make a POST request to the URL using the key-value pairs.  Return
     a set of key-value pairs.
 
     :url: URL to post to
     :params: Dict of parameters to include in post payload
+    :call: Recorder of the call's timings (see paypal.instrumentation)
+    :method: NVP method or Payflow transaction type, which sets the timeouts
+             and whether the call is retried (see send())
+    :integration: 'express' or 'payflow', whose circuit breaker the call
+                  goes through
     """
+    call = call or instrumentation.NULL_CALL
     if encode:
         payload = urlencode(params)
     else:
         payload = params
 
     start_time = time.time()
-    response = requests.post(
+    response = send(method, lambda timeout: get_session().post(
         url, payload,
-        headers={'content-type': 'text/namevalue; charset=utf-8'})
+        headers={'content-type': 'text/namevalue; charset=utf-8'},
+        timeout=timeout), integration)
+    call.response(response, instrumentation.body_size(payload))
     if response.status_code != requests.codes.ok:
         raise exceptions.PayPalError("Unable to communicate with PayPal")
 
-    # Convert response into a simple key-value format
-    pairs = {}
-    for key, value in parse_qsl(response.text):
-        pairs[key] = value
+    pairs = _parse_response(payload, response.text, start_time)
+    call.mark('parse')
+    return pairs
 
-    # Add audit information
-    pairs['_raw_request'] = payload
-    pairs['_raw_response'] = response.text
-    pairs['_response_time'] = (time.time() - start_time) * 1000.0
 
+async def async_post(url, params, encode=True, call=None, method=None, integration=None):
+    """
+    Coroutine version of post(), returning the same key-value pairs and audit
+    information.
+    """
+    call = call or instrumentation.NULL_CALL
+    if encode:
+        payload = urlencode(params)
+    else:
+        payload = params
+
+    start_time = time.time()
+    response = await async_send(method, lambda timeout: get_async_client().post(
+        url, content=payload,
+        headers={'content-type': 'text/namevalue; charset=utf-8'},
+        timeout=timeout), integration)
+    call.response(response, instrumentation.body_size(payload))
+    if response.status_code != requests.codes.ok:
+        raise exceptions.PayPalError("Unable to communicate with PayPal")
+
+    pairs = _parse_response(payload, response.text, start_time)
+    call.mark('parse')
     return pairs
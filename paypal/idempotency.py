@@ -0,0 +1,75 @@
+"""
+Duplicate suppression for calls which move money.
+
+A retried POST or a double-clicked "Place order" button can make the same
+payment call twice.  Each such call gets an idempotency key derived from the
+basket, the PayPal token and the operation, so that repeats get the same key:
+
+* Orders v2 requests send it as the ``PayPal-Request-Id`` header, and PayPal
+  answers a repeat with the result of the first request.
+* NVP and Payflow calls, which have no such header, go through run_once():
+  the result of the first successful call is kept in the Django cache and
+  returned for repeats without calling PayPal again.
+"""
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+
+from paypal import exceptions
+
+logger = logging.getLogger('paypal.idempotency')
+
+# Namespace of the keys, which are UUIDs as PayPal expects
+NAMESPACE = uuid.UUID('5b1f3c8e-6d57-4d4b-9a8e-3f0f8d6b2c71')
+
+
+class OperationInProgress(exceptions.PayPalError):
+    pass
+
+
+def get_key(basket_id, token, operation, amount=None):
+    """
+    Return the idempotency key of ``operation`` on the basket and token, any
+    of which can be None when unknown.  An amount is part of the key of
+    operations which could legitimately be repeated for another amount.
+    """
+    name = ':'.join(str(part) for part in (basket_id, token, operation, amount))
+    return str(uuid.uuid5(NAMESPACE, name))
+
+
+def _get_cache():
+    return caches[getattr(settings, 'PAYPAL_IDEMPOTENCY_CACHE', 'default')]
+
+
+def run_once(key, is_successful, func, *args, **kwargs):
+    """
+    Call ``func`` unless a call with the same key succeeded already, in which
+    case return the result of that call.  ``is_successful`` tells whether a
+    result is to be kept: failed calls may be retried.
+
+    While a call is in progress, another one with the same key raises
+    OperationInProgress.
+    """
+    cache = _get_cache()
+    result_key = 'paypal:idempotency:%s' % key
+    lock_key = result_key + ':lock'
+    result = cache.get(result_key)
+    if result is not None:
+        return result
+    if not cache.add(lock_key, True, getattr(settings, 'PAYPAL_IDEMPOTENCY_LOCK_TIMEOUT', 60)):
+        raise OperationInProgress(_("This payment is already being processed"))
+    try:
+        result = func(*args, **kwargs)
+        if is_successful(result):
+            try:
+                cache.set(result_key, result, getattr(settings, 'PAYPAL_IDEMPOTENCY_TTL', 24 * 60 * 60))
+            except Exception:
+                # The call went through: failing to keep its result mustn't
+                # fail it
+                logger.exception("Unable to store the result of operation %s", key)
+    finally:
+        cache.delete(lock_key)
+    return result
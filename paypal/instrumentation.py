@@ -0,0 +1,139 @@
+"""
+Instrumentation of the calls made to PayPal.
+
+Every call sends ``paypal.signals.gateway_request_started`` before the request
+is made, then ``gateway_response_received`` once the response has been parsed
+and recorded, or ``gateway_request_failed`` if an exception was raised.  The
+``timings`` argument is a dict of phase durations in milliseconds:
+
+``server``
+    From sending the request to receiving the response headers.  This
+    includes opening a connection (DNS, TCP and TLS) when no kept-alive one
+    could be reused, as neither requests nor httpx report those separately.
+``http``
+    The whole HTTP exchange, including reading the response body.
+``parse``
+    Decoding the response.
+``save``
+    Recording the transaction in the database (NVP and Payflow only).
+``total``
+    The whole call.
+
+Each call is also traced when OpenTelemetry is installed (see paypal.tracing),
+with PayPal's debug ID (the ``Paypal-Debug-Id`` response header, to quote to
+PayPal support) as the ``paypal.debug_id`` attribute.
+
+When no receiver is connected to any of the signals and tracing is disabled,
+calls get a shared no-op recorder and no clock is read.
+"""
+import time
+from urllib.parse import urlsplit
+
+from paypal import signals, tracing
+
+
+class GatewayCall:
+    """
+    Timings and statistics of one call, sending the signals and ending its
+    span.
+    """
+
+    def __init__(self, integration, method, url):
+        self.integration = integration
+        self.method = method
+        self.host = urlsplit(url).netloc
+        self.status = None
+        self.request_bytes = None
+        self.response_bytes = None
+        self.timings = {}
+        self.start = self._last = time.perf_counter()
+        self._span = tracing.start_client_span(
+            'paypal.%s %s' % (integration, method),
+            **{'paypal.integration': integration, 'paypal.method': method, 'net.peer.name': self.host})
+        signals.gateway_request_started.send(sender=integration, method=method, host=self.host)
+
+    def mark(self, phase):
+        """
+        Record the time since the previous phase ended as the duration of
+        ``phase``.
+        """
+        now = time.perf_counter()
+        self.timings[phase] = (now - self._last) * 1000.0
+        self._last = now
+
+    def response(self, response, request_bytes):
+        """
+        Record a requests or httpx response.
+        """
+        self.mark('http')
+        self.status = response.status_code
+        self.request_bytes = request_bytes
+        self.response_bytes = len(response.content)
+        self.timings['server'] = response.elapsed.total_seconds() * 1000.0
+        if self._span is not None:
+            self._span.set_attribute('http.status_code', self.status)
+            self._span.set_attribute('paypal.debug_id', response.headers.get('Paypal-Debug-Id'))
+
+    def _finish(self):
+        self.timings['total'] = (time.perf_counter() - self.start) * 1000.0
+
+    def finished(self, success):
+        self._finish()
+        if self._span is not None:
+            self._span.set_attribute('paypal.success', success)
+            self._span.end()
+        signals.gateway_response_received.send(
+            sender=self.integration, method=self.method, host=self.host, status=self.status, success=success,
+            request_bytes=self.request_bytes, response_bytes=self.response_bytes, timings=self.timings)
+
+    def failed(self, exception):
+        self._finish()
+        if self._span is not None:
+            self._span.end(exception)
+        signals.gateway_request_failed.send(
+            sender=self.integration, method=self.method, host=self.host, status=self.status,
+            exception=exception, timings=self.timings)
+
+
+class _NullCall:
+
+    def mark(self, phase):
+        pass
+
+    def response(self, response, request_bytes):
+        pass
+
+    def finished(self, success):
+        pass
+
+    def failed(self, exception):
+        pass
+
+
+NULL_CALL = _NullCall()
+
+
+def body_size(body):
+    """
+    Return the size in bytes of a request body, encoding text as UTF-8.
+    """
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return len(body)
+
+
+def has_listeners():
+    return (signals.gateway_request_started.has_listeners()
+            or signals.gateway_response_received.has_listeners()
+            or signals.gateway_request_failed.has_listeners())
+
+
+def start_call(integration, method, url):
+    """
+    Return the recorder of a call about to be made to ``url``.
+    """
+    if not has_listeners() and not tracing.enabled():
+        return NULL_CALL
+    return GatewayCall(integration, method, url)
@@ -0,0 +1,233 @@
+"""
+Load test of the checkout flows, to measure how many checkouts per second a
+worker sustains.
+
+Virtual users, each in a thread of its own with its own session, check out
+over and over through the project's URLs.  Requests are made in-process with
+Django's test client, and PayPal is replaced with the stub server (see
+paypal.stub).  Each checkout goes through these steps:
+
+``basket``
+    Add a product to the basket.
+``redirect``
+    The redirect view, which starts the PayPal transaction.
+``paypal``
+    Approval on the (stub) PayPal site, which redirects back to the site.
+``preview``
+    The success response view, showing the order preview (or placing the
+    order when PAYPAL_BUYER_PAYS_ON_PAYPAL is set).
+``place_order``
+    Placing the order.
+
+The wall time, database queries and errors of every step are recorded.  A
+step which fails ends its checkout.
+"""
+import math
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, resolve, reverse
+from oscar.core.loading import get_class, get_model
+
+Basket = get_model('basket', 'Basket')
+CheckoutSessionData = get_class('checkout.utils', 'CheckoutSessionData')
+Repository = get_class('shipping.repository', 'Repository')
+
+EXPRESS, EXPRESS_CHECKOUT = 'express', 'express_checkout'
+
+# URL names of the redirect and place order views of each flow
+FLOWS = {
+    EXPRESS: ('paypal-redirect', 'paypal-place-order'),
+    EXPRESS_CHECKOUT: ('express-checkout-redirect', 'express-checkout-place-order'),
+}
+
+STEPS = ('basket', 'redirect', 'paypal', 'preview', 'place_order')
+
+
+class StepFailed(Exception):
+    pass
+
+
+def percentile(values, fraction):
+    """
+    Return the nearest-rank percentile of a sorted list of values.
+    """
+    if not values:
+        return None
+    return values[max(int(math.ceil(fraction * len(values))), 1) - 1]
+
+
+class StepStats:
+
+    def __init__(self):
+        self.durations = []
+        self.queries = []
+        self.errors = 0
+
+    def add(self, duration, queries, failed):
+        self.durations.append(duration)
+        self.queries.append(queries)
+        if failed:
+            self.errors += 1
+
+    def summary(self, elapsed):
+        """
+        Return the statistics of the step: durations are in milliseconds and
+        throughput is in requests per second.
+        """
+        durations = sorted(self.durations)
+        count = len(durations)
+        return {
+            'count': count,
+            'errors': self.errors,
+            'error_rate': self.errors / count if count else 0.0,
+            'throughput': count / elapsed if elapsed else 0.0,
+            'mean': sum(durations) / count * 1000.0 if count else None,
+            'p50': _ms(percentile(durations, 0.5)),
+            'p90': _ms(percentile(durations, 0.9)),
+            'p99': _ms(percentile(durations, 0.99)),
+            'max': _ms(durations[-1] if durations else None),
+            'queries_mean': sum(self.queries) / count if count else None,
+            'queries_max': max(self.queries) if count else None,
+        }
+
+
+def _ms(seconds):
+    return seconds * 1000.0 if seconds is not None else None
+
+
+def _check_status(response, status):
+    if response.status_code != status:
+        raise StepFailed("Expected a %s response, got %s" % (status, response.status_code))
+
+
+class LoadTest:
+    """
+    Run ``checkouts`` checkouts of ``product`` with each of ``users`` virtual
+    users, through the URLs of ``flow`` (EXPRESS or EXPRESS_CHECKOUT).  The
+    gateways must be pointed at the stub server listening on ``stub_url``.
+    """
+
+    def __init__(self, flow, product, stub_url, users=1, checkouts=1, shipping_method_code=None):
+        redirect_name, self.place_order_name = FLOWS[flow]
+        try:
+            self.redirect_url = reverse(redirect_name)
+        except NoReverseMatch:
+            raise ValueError("The '%s' URLs are not included in the project's URLconf" % flow)
+        self.flow = flow
+        self.basket_url = reverse('basket:add', kwargs={'pk': product.pk})
+        self.stub_netloc = urlsplit(stub_url).netloc
+        self.users = users
+        self.checkouts = checkouts
+        # The Express Checkout views read the shipping method from the session,
+        # where the shipping method page would have stored it
+        if flow == EXPRESS_CHECKOUT and shipping_method_code is None:
+            shipping_method_code = Repository().get_available_shipping_methods(Basket())[0].code
+        self.shipping_method_code = shipping_method_code
+        self.stats = {step: StepStats() for step in STEPS}
+        self.completed = 0
+        self.elapsed = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        threads = [threading.Thread(target=self._run_user, name='paypal-load-user-%d' % index)
+                   for index in range(self.users)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+        return self.get_results()
+
+    def get_results(self):
+        return {
+            'flow': self.flow,
+            'users': self.users,
+            'checkouts': self.users * self.checkouts,
+            'completed': self.completed,
+            'elapsed': self.elapsed,
+            'throughput': self.completed / self.elapsed if self.elapsed else 0.0,
+            'steps': {step: stats.summary(self.elapsed) for step, stats in self.stats.items()},
+        }
+
+    def _run_user(self):
+        session = requests.Session()
+        try:
+            for __ in range(self.checkouts):
+                try:
+                    self._checkout(Client(), session)
+                except StepFailed:
+                    continue
+                with self._lock:
+                    self.completed += 1
+        finally:
+            session.close()
+            connection.close()
+
+    def _step(self, name, func, *args):
+        start = time.perf_counter()
+        error = None
+        with CaptureQueriesContext(connection) as queries:
+            try:
+                result = func(*args)
+            except Exception as e:
+                error = e
+        with self._lock:
+            self.stats[name].add(time.perf_counter() - start, len(queries), error is not None)
+        if error is not None:
+            raise StepFailed(name) from error
+        return result
+
+    def _checkout(self, client, session):
+        self._step('basket', self._add_to_basket, client)
+        paypal_url = self._step('redirect', self._redirect, client)
+        return_url = self._step('paypal', self._approve, session, paypal_url)
+        query = dict(parse_qsl(return_url.query))
+        if self._step('preview', self._preview, client, return_url):
+            basket_id = resolve(return_url.path).kwargs['basket_id']
+            self._step('place_order', self._place_order, client, basket_id, query)
+
+    def _add_to_basket(self, client):
+        _check_status(client.post(self.basket_url, {'quantity': 1}), 302)
+        if self.shipping_method_code is not None:
+            session = client.session
+            session[CheckoutSessionData.SESSION_KEY] = {'shipping': {'method_code': self.shipping_method_code}}
+            session.save()
+
+    def _redirect(self, client):
+        response = client.get(self.redirect_url)
+        _check_status(response, 302)
+        if urlsplit(response['Location']).netloc != self.stub_netloc:
+            # Sent back to the basket, with an error message
+            raise StepFailed("Redirected to %s" % response['Location'])
+        return response['Location']
+
+    def _approve(self, session, url):
+        response = session.get(url, allow_redirects=False)
+        _check_status(response, 302)
+        return urlsplit(response.headers['Location'])
+
+    def _preview(self, client, return_url):
+        """
+        Return whether the order is still to be placed.
+        """
+        response = client.get('%s?%s' % (return_url.path, return_url.query))
+        if response.status_code == 302 and urlsplit(response['Location']).path == reverse('checkout:thank-you'):
+            # The buyer paid on PayPal
+            return False
+        _check_status(response, 200)
+        return True
+
+    def _place_order(self, client, basket_id, query):
+        response = client.post(
+            reverse(self.place_order_name, kwargs={'basket_id': basket_id}),
+            {'action': 'place_order', 'payer_id': query['PayerID'], 'token': query['token']})
+        _check_status(response, 302)
+        if urlsplit(response['Location']).path != reverse('checkout:thank-you'):
+            raise StepFailed("Redirected to %s" % response['Location'])
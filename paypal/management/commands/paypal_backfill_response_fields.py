@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from paypal.express.models import ExpressTransaction
+from paypal.payflow.models import PayflowTransaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in the fields derived from the raw PayPal response for "
+        "transactions recorded before those fields were introduced.  Rows are "
+        "processed in primary key order, one batch per query.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows updated per query")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (ExpressTransaction, PayflowTransaction):
+            count = self.backfill(
+                model.objects.filter(response_data__isnull=True),
+                self.set_response_data, ['response_data'], batch_size)
+            self.stdout.write("Updated response data of %d %s rows" % (count, model.__name__))
+
+        queryset = ExpressTransaction.objects.filter(
+            transaction_id__isnull=True,
+            method__in=ExpressTransaction.TRANSACTION_ID_FIELDS,
+            ack__in=(ExpressTransaction.SUCCESS, ExpressTransaction.SUCCESS_WITH_WARNING))
+        count = self.backfill(queryset, self.set_transaction_id, ['transaction_id'], batch_size, load=['method'])
+        self.stdout.write("Updated transaction ID of %d ExpressTransaction rows" % count)
+
+    def backfill(self, queryset, update, fields, batch_size, load=()):
+        count = 0
+        last_pk = 0
+        queryset = queryset.order_by('pk').only('pk', 'raw_response', *fields, *load)
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return count
+            for txn in batch:
+                update(txn)
+            queryset.model.objects.bulk_update(batch, fields)
+            count += len(batch)
+            last_pk = batch[-1].pk
+
+    def set_response_data(self, txn):
+        txn.response_data = {key: values[0] for key, values in txn.context.items()}
+
+    def set_transaction_id(self, txn):
+        txn.transaction_id = txn.value(txn.TRANSACTION_ID_FIELDS[txn.method])
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from paypal import bulk
+
+
+class Command(BaseCommand):
+    help = (
+        "Capture, void or refund payments in bulk.  References (tokens for "
+        "Express and Express Checkout, order numbers for Payflow) are read one "
+        "per line from a file or stdin, and a CSV report is written.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('integration', choices=sorted(bulk.OPERATIONS))
+        parser.add_argument('operation', choices=[bulk.CAPTURE, bulk.VOID, bulk.REFUND])
+        parser.add_argument('--input', default='-', help="File of references, one per line ('-' for stdin)")
+        parser.add_argument('--report', default='-', help="File to write the CSV report to ('-' for stdout)")
+        parser.add_argument('--workers', type=int, default=None, help="Number of concurrent PayPal calls")
+        parser.add_argument('--rate', type=float, default=None, help="Maximum PayPal calls per second")
+        parser.add_argument('--batch-size', type=int, default=500, help="Report rows written per flush")
+
+    def handle(self, *args, **options):
+        input_file = sys.stdin if options['input'] == '-' else open(options['input'])
+        report_file = self.stdout if options['report'] == '-' else open(options['report'], 'w', newline='')
+        try:
+            references = (line.strip() for line in input_file if line.strip())
+            results = bulk.run_bulk_operation(
+                options['integration'], options['operation'], references,
+                max_workers=options['workers'], rate=options['rate'])
+            succeeded, failed = bulk.write_report(results, report_file, options['batch_size'])
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+            if report_file is not self.stdout:
+                report_file.close()
+
+        self.stderr.write("%d succeeded, %d failed" % (succeeded, failed))
+        if failed:
+            raise CommandError("%d operations failed" % failed)
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from paypal import export
+
+
+class Command(BaseCommand):
+    help = (
+        "Export transactions as CSV or JSON lines.  Filters are the fields of "
+        "the dashboard search form, eg --filter date_from=2020-01-01.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('integration', choices=sorted(export.EXPORTS))
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default=export.CSV)
+        parser.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE',
+                            help="Search filter, can be repeated")
+        parser.add_argument('--gzip', action='store_true', help="Compress the output")
+        parser.add_argument('--output', default='-', help="File to write to ('-' for stdout)")
+
+    def handle(self, *args, **options):
+        try:
+            filters = dict(item.split('=', 1) for item in options['filter'])
+        except ValueError:
+            raise CommandError("Filters must be given as NAME=VALUE")
+        try:
+            chunks = export.iter_export(options['integration'], options['format'], filters, options['gzip'])
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+
+        if options['output'] == '-':
+            output = sys.stdout.buffer if options['gzip'] else sys.stdout
+        elif options['gzip']:
+            output = open(options['output'], 'wb')
+        else:
+            output = open(options['output'], 'w', newline='')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output'] != '-':
+                output.close()
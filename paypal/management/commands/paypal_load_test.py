@@ -0,0 +1,108 @@
+import json
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from oscar.core.loading import get_model
+
+from paypal import gateway, loadtest, stub
+
+Product = get_model('catalogue', 'Product')
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test a checkout flow: concurrent virtual users check out over "
+        "and over through the site's URLs, against a stub of PayPal, and the "
+        "response times, queries and errors of each step are reported.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--flow', choices=sorted(loadtest.FLOWS), default=loadtest.EXPRESS, help="Checkout flow to test")
+        parser.add_argument('--users', type=int, default=4, help="Number of concurrent virtual users")
+        parser.add_argument('--checkouts', type=int, default=10, help="Number of checkouts per user")
+        parser.add_argument('--product', type=int, help="ID of the product to buy (default: the first in stock)")
+        parser.add_argument(
+            '--shipping-method', help="Code of the shipping method of the Express Checkout flow "
+                                      "(default: the first available)")
+        parser.add_argument(
+            '--stub-url', help="URL of a running stub server (see paypal_stub_server).  By default a stub "
+                               "server is started with the --latency and error rate options.")
+        parser.add_argument(
+            '--latency', action='append', metavar='[API=]DISTRIBUTION',
+            help="Response time distribution of the stub in milliseconds, eg normal:120,30, for all APIs "
+                 "or one of %s.  Can be repeated." % ', '.join(stub.APIS))
+        parser.add_argument(
+            '--error-rate', type=float, default=0.0, help="Fraction of stub requests answered with an API error")
+        parser.add_argument(
+            '--http-error-rate', type=float, default=0.0,
+            help="Fraction of stub requests answered with an HTTP 503")
+        parser.add_argument('--seed', type=int, help="Random seed of the stub, for reproducible runs")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['checkouts'] < 1:
+            raise CommandError("There must be at least one user and one checkout")
+        product = self.get_product(options['product'])
+
+        server = None
+        stub_url = options['stub_url']
+        if stub_url is None:
+            try:
+                server = stub.create_server(
+                    '127.0.0.1:0', options['latency'], options['error_rate'], options['http_error_rate'],
+                    options['seed'])
+            except (OSError, ValueError) as e:
+                raise CommandError(e)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            stub_url = server.url
+
+        # The test client's requests are made to the 'testserver' host
+        overrides = override_settings(
+            ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver'], **stub.get_settings(stub_url))
+        overrides.enable()
+        try:
+            gateway.reset_session()
+            try:
+                test = loadtest.LoadTest(
+                    options['flow'], product, stub_url, options['users'], options['checkouts'],
+                    options['shipping_method'])
+            except ValueError as e:
+                raise CommandError(e)
+            results = test.run()
+        finally:
+            overrides.disable()
+            gateway.reset_session()
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.write_report(results)
+
+    def get_product(self, pk):
+        products = Product.objects.filter(stockrecords__num_in_stock__gt=0)
+        if pk is not None:
+            products = products.filter(pk=pk)
+        product = products.order_by('pk').first()
+        if product is None:
+            raise CommandError("There is no product in stock to buy")
+        return product
+
+    def write_report(self, results):
+        self.stdout.write(
+            "%(completed)d of %(checkouts)d %(flow)s checkouts completed by %(users)d users "
+            "in %(elapsed).2fs: %(throughput).2f checkouts/s" % results)
+        columns = ('count', 'errors', 'error_rate', 'throughput', 'mean', 'p50', 'p90', 'p99', 'max',
+                   'queries_mean', 'queries_max')
+        self.stdout.write('%-12s' % 'step' + ''.join('%13s' % column for column in columns))
+        for step in loadtest.STEPS:
+            summary = results['steps'][step]
+            self.stdout.write('%-12s' % step + ''.join(
+                '%13s' % ('-' if summary[column] is None else
+                          '%.2f' % summary[column] if isinstance(summary[column], float) else summary[column])
+                for column in columns))
+        self.stdout.write("Durations are in milliseconds, throughput in requests per second")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from paypal import audit
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the PayPal audit rows left in PAYPAL_AUDIT_SPOOL_DIR by "
+        "processes that exited before flushing their write-behind buffer.")
+
+    def handle(self, *args, **options):
+        count = audit.replay_spool()
+        self.stdout.write("Replayed %d audit rows" % count)
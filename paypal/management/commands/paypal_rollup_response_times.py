@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from paypal import analytics
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the hourly response time rollups read by the response time "
+        "dashboards, from the last rolled up hour to the current one.  Meant "
+        "to be run periodically, eg hourly from cron.")
+
+    def handle(self, *args, **options):
+        for source in sorted(analytics.SOURCES):
+            count = analytics.update_rollups(source)
+            self.stdout.write("Updated %d %s rollups" % (count, source))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from paypal import stub
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a stub of the PayPal NVP, Payflow Pro and Orders v2 endpoints, "
+        "for load testing.  Prints the settings pointing the gateways at it.")
+
+    def add_arguments(self, parser):
+        stub.add_arguments(parser)
+
+    def handle(self, *args, **options):
+        try:
+            server = stub.create_server(
+                options['addrport'], options['latency'], options['error_rate'], options['http_error_rate'],
+                options['seed'], verbose=options['verbosity'] > 1)
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        self.stdout.write("Stub PayPal server listening on %s.  Settings:" % server.url)
+        for name, value in server.get_settings().items():
+            self.stdout.write("%s = %r" % (name, value))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
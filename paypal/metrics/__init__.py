@@ -0,0 +1,5 @@
+"""
+Adapters exporting the gateway call signals (see paypal.instrumentation) to
+monitoring systems.  Each module has a ``connect()`` function to call once,
+eg from an AppConfig.ready() method.
+"""
@@ -0,0 +1,92 @@
+"""
+Prometheus metrics of the calls made to PayPal.  Requires the optional
+``prometheus_client`` dependency.
+
+Metrics are labelled with the integration, method and host:
+
+``paypal_gateway_request_duration_seconds``
+    Histogram of call durations, with an extra ``phase`` label (see
+    paypal.instrumentation for the phases).
+``paypal_gateway_requests_total``
+    Counter of calls, with an ``outcome`` label: ``success``, ``declined``
+    (PayPal answered with an error) or ``error`` (no valid response).
+``paypal_gateway_response_bytes_total``
+    Counter of response body sizes.
+"""
+import threading
+import weakref
+
+from django.core.exceptions import ImproperlyConfigured
+
+from paypal import signals
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+LABELS = ('integration', 'method', 'host')
+
+# Metrics of each registry they were created in
+_metrics = weakref.WeakKeyDictionary()
+_metrics_lock = threading.Lock()
+
+# Registry of the connected receivers
+_registry = None
+
+
+def get_metrics(registry=None):
+    """
+    Return the (duration, requests, response bytes) metrics of ``registry``
+    (by default the global one), creating them on the first call.
+    """
+    if prometheus_client is None:
+        raise ImproperlyConfigured("prometheus_client must be installed to export PayPal metrics to Prometheus")
+    if registry is None:
+        registry = prometheus_client.REGISTRY
+    with _metrics_lock:
+        metrics = _metrics.get(registry)
+        if metrics is None:
+            metrics = _metrics[registry] = (
+                prometheus_client.Histogram(
+                    'paypal_gateway_request_duration_seconds', "Duration of the calls made to PayPal",
+                    LABELS + ('phase',), registry=registry),
+                prometheus_client.Counter(
+                    'paypal_gateway_requests_total', "Calls made to PayPal", LABELS + ('outcome',),
+                    registry=registry),
+                prometheus_client.Counter(
+                    'paypal_gateway_response_bytes_total', "Size of the responses received from PayPal", LABELS,
+                    registry=registry),
+            )
+    return metrics
+
+
+def _response_received(sender, method, host, success, response_bytes, timings, **kwargs):
+    duration, requests, response_size = get_metrics(_registry)
+    for phase, value in timings.items():
+        duration.labels(sender, method, host, phase).observe(value / 1000.0)
+    requests.labels(sender, method, host, 'success' if success else 'declined').inc()
+    if response_bytes:
+        response_size.labels(sender, method, host).inc(response_bytes)
+
+
+def _request_failed(sender, method, host, timings, **kwargs):
+    duration, requests, response_size = get_metrics(_registry)
+    duration.labels(sender, method, host, 'total').observe(timings['total'] / 1000.0)
+    requests.labels(sender, method, host, 'error').inc()
+
+
+def connect(registry=None):
+    """
+    Start recording the metrics in ``registry`` (by default the global one).
+    """
+    global _registry
+    get_metrics(registry)
+    _registry = registry
+    signals.gateway_response_received.connect(_response_received, dispatch_uid='paypal.metrics.prometheus')
+    signals.gateway_request_failed.connect(_request_failed, dispatch_uid='paypal.metrics.prometheus')
+
+
+def disconnect():
+    signals.gateway_response_received.disconnect(dispatch_uid='paypal.metrics.prometheus')
+    signals.gateway_request_failed.disconnect(dispatch_uid='paypal.metrics.prometheus')
@@ -0,0 +1,73 @@
+"""
+StatsD metrics of the calls made to PayPal.  Requires the optional ``statsd``
+dependency unless a client is passed to connect().
+
+For each call, with ``<name>`` being ``<integration>.<method>``:
+
+* a timer ``<name>.<phase>`` per phase (see paypal.instrumentation)
+* a counter ``<name>.success``, ``<name>.declined`` (PayPal answered with an
+  error) or ``<name>.error`` (no valid response)
+
+Names are prefixed with ``PAYPAL_STATSD_PREFIX`` (by default 'paypal').
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from paypal import signals
+
+try:
+    import statsd
+except ImportError:
+    statsd = None
+
+_client = None
+
+
+def get_client():
+    """
+    Return the client built from the PAYPAL_STATSD_* settings.
+    """
+    global _client
+    if _client is None:
+        if statsd is None:
+            raise ImproperlyConfigured("statsd must be installed to export PayPal metrics to StatsD")
+        _client = statsd.StatsClient(
+            getattr(settings, 'PAYPAL_STATSD_HOST', 'localhost'),
+            getattr(settings, 'PAYPAL_STATSD_PORT', 8125),
+            prefix=getattr(settings, 'PAYPAL_STATSD_PREFIX', 'paypal'))
+    return _client
+
+
+def _response_received(sender, method, success, timings, **kwargs):
+    client = get_client()
+    name = '%s.%s' % (sender, method)
+    for phase, value in timings.items():
+        client.timing('%s.%s' % (name, phase), value)
+    client.incr('%s.%s' % (name, 'success' if success else 'declined'))
+
+
+def _request_failed(sender, method, timings, **kwargs):
+    client = get_client()
+    name = '%s.%s' % (sender, method)
+    client.timing('%s.total' % name, timings['total'])
+    client.incr('%s.error' % name)
+
+
+def connect(client=None):
+    """
+    Start sending the metrics, with ``client`` (any object with the
+    ``timing`` and ``incr`` methods of statsd.StatsClient) or one built from
+    the settings.
+    """
+    global _client
+    if client is not None:
+        _client = client
+    else:
+        get_client()
+    signals.gateway_response_received.connect(_response_received, dispatch_uid='paypal.metrics.statsd')
+    signals.gateway_request_failed.connect(_request_failed, dispatch_uid='paypal.metrics.statsd')
+
+
+def disconnect():
+    signals.gateway_response_received.disconnect(dispatch_uid='paypal.metrics.statsd')
+    signals.gateway_request_failed.disconnect(dispatch_uid='paypal.metrics.statsd')
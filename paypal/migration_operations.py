@@ -0,0 +1,57 @@
+"""
+Migration operations which build indexes without locking the table against
+writes on PostgreSQL.  They behave like the standard operations on other
+databases.
+
+Migrations using them must set ``atomic = False`` as PostgreSQL can't build
+indexes concurrently inside a transaction.
+"""
+from django.db import migrations
+
+
+def _is_postgresql(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not _is_postgresql(schema_editor):
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            sql = str(self.index.create_sql(model, schema_editor))
+            schema_editor.execute(sql.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if not _is_postgresql(schema_editor):
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS %s' % schema_editor.quote_name(self.index.name))
+
+    def describe(self):
+        return super().describe() + ' concurrently'
+
+
+class AlterFieldUniqueConcurrently(migrations.AlterField):
+    """
+    Make a field unique.  On PostgreSQL the unique index is built concurrently
+    and then attached to the table as its unique constraint.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not _is_postgresql(schema_editor):
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            table = model._meta.db_table
+            column = model._meta.get_field(self.name).column
+            name = schema_editor._create_index_name(table, [column], suffix='_uniq')
+            schema_editor.execute('CREATE UNIQUE INDEX CONCURRENTLY %s ON %s (%s)' % (
+                schema_editor.quote_name(name), schema_editor.quote_name(table), schema_editor.quote_name(column)))
+            schema_editor.execute('ALTER TABLE %s ADD CONSTRAINT %s UNIQUE USING INDEX %s' % (
+                schema_editor.quote_name(table), schema_editor.quote_name(name), schema_editor.quote_name(name)))
+
+    def describe(self):
+        return super().describe() + ' (unique, concurrently)'
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:45
+
+from django.db import migrations
+import paypal.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal', '0003_expresscheckouttransaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expresstransaction',
+            name='response_data',
+            field=paypal.fields.JSONTextField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='payflowtransaction',
+            name='response_data',
+            field=paypal.fields.JSONTextField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal', '0004_response_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expresstransaction',
+            name='transaction_id',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='expresstransaction',
+            index=models.Index(fields=['token', 'method'], name='paypal_expr_token_dde22d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expresstransaction',
+            index=models.Index(fields=['transaction_id'], name='paypal_expr_transac_77a0b5_idx'),
+        ),
+    ]
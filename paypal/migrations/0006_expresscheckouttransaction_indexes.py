@@ -0,0 +1,35 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:49
+
+from django.db import migrations, models
+
+from paypal.migration_operations import AddIndexConcurrently, AlterFieldUniqueConcurrently
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently on PostgreSQL, which can't be done in
+    # a transaction.  order_id must not contain duplicates.
+    atomic = False
+
+    dependencies = [
+        ('paypal', '0005_expresstransaction_transaction_id'),
+    ]
+
+    operations = [
+        AlterFieldUniqueConcurrently(
+            model_name='expresscheckouttransaction',
+            name='order_id',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        AddIndexConcurrently(
+            model_name='expresscheckouttransaction',
+            index=models.Index(fields=['capture_id'], name='paypal_expr_capture_465b5a_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='expresscheckouttransaction',
+            index=models.Index(fields=['authorization_id'], name='paypal_expr_authori_fa2ea1_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='expresscheckouttransaction',
+            index=models.Index(fields=['status', 'date_created'], name='paypal_expr_status_bb6193_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:52
+
+from django.db import migrations, models
+
+from paypal.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently on PostgreSQL
+    atomic = False
+
+    dependencies = [
+        ('paypal', '0006_expresscheckouttransaction_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='expresscheckouttransaction',
+            index=models.Index(fields=['date_created', 'id'], name='paypal_expr_date_cr_31c631_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='expresstransaction',
+            index=models.Index(fields=['date_created', 'id'], name='paypal_expr_date_cr_0d700c_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='payflowtransaction',
+            index=models.Index(fields=['date_created', 'id'], name='paypal_payf_date_cr_e008e9_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:57
+
+from django.db import migrations, models
+import paypal.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal', '0007_dashboard_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseTimeRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=16)),
+                ('method', models.CharField(max_length=32)),
+                ('period_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('total_response_time', models.FloatField(default=0, help_text='Sum of response times in milliseconds')),
+                ('histogram', paypal.fields.JSONTextField(default=list)),
+            ],
+            options={
+                'ordering': ('period_start', 'method'),
+                'unique_together': {('source', 'method', 'period_start')},
+            },
+        ),
+    ]
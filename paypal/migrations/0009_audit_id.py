@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paypal', '0008_responsetimerollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expresstransaction',
+            name='audit_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='payflowtransaction',
+            name='audit_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
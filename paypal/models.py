@@ -1,3 +1,27 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
 from paypal.express.models import *  # noqa F403
 from paypal.express_checkout.models import *  # noqa F403
+from paypal.fields import JSONTextField
 from paypal.payflow.models import *  # noqa F403
+
+
+class ResponseTimeRollup(models.Model):
+    """
+    Statistics of the calls made with a method during an hour.
+    """
+    source = models.CharField(max_length=16)
+    method = models.CharField(max_length=32)
+    period_start = models.DateTimeField()
+
+    count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    total_response_time = models.FloatField(default=0, help_text=_("Sum of response times in milliseconds"))
+    # Number of calls in each bin of paypal.analytics.BIN_EDGES, plus the overflow bin
+    histogram = JSONTextField(default=list)
+
+    class Meta:
+        app_label = 'paypal'
+        ordering = ('period_start', 'method')
+        unique_together = ('source', 'method', 'period_start')
@@ -0,0 +1,104 @@
+"""
+Keyset pagination and search for the transaction dashboards.
+
+Pages are selected with a cursor on (date_created, id) rather than an offset,
+so showing a page costs an index range scan however deep into the table it is,
+and no COUNT(*) of the whole table is needed.
+"""
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(obj):
+    return '%s,%s' % (obj.date_created.isoformat(), obj.pk)
+
+
+def decode_cursor(cursor):
+    """
+    Return the (date_created, pk) of a cursor, or None if it isn't valid.
+    """
+    try:
+        date_created, pk = cursor.split(',')
+        date_created, pk = parse_datetime(date_created), int(pk)
+    except (AttributeError, ValueError):
+        return None
+    if date_created is None:
+        return None
+    return date_created, pk
+
+
+class KeysetPaginationMixin:
+    """
+    List view mixin paginating the queryset newest first.  The context has
+    ``next_url`` and ``previous_url`` (or None), which keep any other query
+    parameters such as search filters.
+    """
+
+    def get_page_size(self):
+        return getattr(settings, 'PAYPAL_DASHBOARD_PAGE_SIZE', 50)
+
+    def paginate_keyset(self, queryset):
+        page_size = self.get_page_size()
+        after = decode_cursor(self.request.GET.get('after'))
+        before = decode_cursor(self.request.GET.get('before'))
+
+        if before is not None:
+            date_created, pk = before
+            queryset = queryset.filter(
+                Q(date_created__gt=date_created) | Q(date_created=date_created, pk__gt=pk))
+            rows = list(queryset.order_by('date_created', 'pk')[:page_size + 1])
+            has_previous, has_next = len(rows) > page_size, True
+            rows = rows[:page_size][::-1]
+        else:
+            if after is not None:
+                date_created, pk = after
+                queryset = queryset.filter(
+                    Q(date_created__lt=date_created) | Q(date_created=date_created, pk__lt=pk))
+            rows = list(queryset.order_by('-date_created', '-pk')[:page_size + 1])
+            has_previous, has_next = after is not None, len(rows) > page_size
+            rows = rows[:page_size]
+
+        next_url = previous_url = None
+        if rows and has_next:
+            next_url = self._get_page_url(after=encode_cursor(rows[-1]))
+        if rows and has_previous:
+            previous_url = self._get_page_url(before=encode_cursor(rows[0]))
+        return rows, next_url, previous_url
+
+    def _get_page_url(self, **cursor):
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params.update(cursor)
+        return '?%s' % params.urlencode()
+
+    def get_context_data(self, **kwargs):
+        queryset = kwargs.pop('object_list', self.object_list)
+        rows, next_url, previous_url = self.paginate_keyset(queryset)
+        ctx = super().get_context_data(object_list=rows, **kwargs)
+        ctx['next_url'] = next_url
+        ctx['previous_url'] = previous_url
+        return ctx
+
+
+class TransactionListMixin(KeysetPaginationMixin):
+    """
+    Transaction dashboard list view mixin loading only ``list_fields`` and
+    filtering with ``form_class``, a TransactionSearchForm.  The form is in
+    the context as ``form``.
+    """
+    form_class = None
+    list_fields = ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset().only(*self.list_fields)
+        self.form = self.form_class(self.request.GET)
+        if self.form.is_valid():
+            queryset = self.form.filter_queryset(queryset)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['form'] = self.form
+        return ctx
@@ -15,11 +15,17 @@ class PayFlowDashboardApplication(OscarDashboardConfig):
         from . import views
         self.list_view = views.TransactionListView
         self.detail_view = views.TransactionDetailView
+        self.export_view = views.TransactionExportView
+        self.response_time_view = views.ResponseTimeView
 
     def get_urls(self):
         urlpatterns = [
             path('transactions/', self.list_view.as_view(),
                  name='paypal-payflow-list'),
+            path('transactions/export/', self.export_view.as_view(),
+                 name='paypal-payflow-export'),
+            path('response-times/', self.response_time_view.as_view(),
+                 name='paypal-payflow-response-times'),
             path('transactions/<int:pk>/', self.detail_view.as_view(),
                  name='paypal-payflow-detail'),
         ]
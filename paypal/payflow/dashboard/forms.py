@@ -0,0 +1,19 @@
+from django import forms
+from django.utils.translation import gettext_lazy as _
+
+from paypal.forms import TransactionSearchForm
+from paypal.payflow import codes
+
+TRXTYPE_CHOICES = [('', _("All"))] + sorted(codes.trxtype_map.items())
+
+
+class PayflowTransactionSearchForm(TransactionSearchForm):
+    trxtype = forms.ChoiceField(label=_("Transaction type"), choices=TRXTYPE_CHOICES, required=False)
+    result = forms.CharField(label=_("Response code"), required=False)
+    order_number = forms.CharField(label=_("Order number"), required=False)
+
+    lookups = {
+        'trxtype': 'trxtype',
+        'result': 'result',
+        'order_number': 'comment1',
+    }
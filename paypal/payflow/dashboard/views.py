@@ -3,15 +3,34 @@ from django.conf import settings
 from django.contrib import messages
 from django.shortcuts import redirect
 from django.utils.translation import gettext as _
+from django.utils.translation import gettext_lazy
 from django.views import generic
 
+from paypal import analytics, audit
+from paypal.export import TransactionExportView as BaseTransactionExportView
+from paypal.pagination import TransactionListMixin
 from paypal.payflow import facade, models
 
+from .forms import PayflowTransactionSearchForm
 
-class TransactionListView(generic.ListView):
+
+class TransactionListView(TransactionListMixin, generic.ListView):
     model = models.PayflowTransaction
     template_name = 'paypal/payflow/transaction_list.html'
     context_object_name = 'transactions'
+    form_class = PayflowTransactionSearchForm
+    # Columns shown in the list; the raw request and response are not loaded
+    list_fields = ('comment1', 'trxtype', 'amount', 'pnref', 'ppref', 'result', 'respmsg', 'response_time',
+                   'date_created')
+
+
+class TransactionExportView(BaseTransactionExportView):
+    integration = 'payflow'
+
+
+class ResponseTimeView(analytics.ResponseTimeView):
+    source = analytics.PAYFLOW
+    title = gettext_lazy("PayPal Payflow response times")
 
 
 class TransactionDetailView(generic.DetailView):
@@ -42,7 +61,9 @@ class TransactionDetailView(generic.DetailView):
 
     def capture(self, orig_txn):
         try:
-            txn = facade.delayed_capture(orig_txn.comment1)
+            # The new transaction's id is needed for the redirect
+            with audit.immediate():
+                txn = facade.delayed_capture(orig_txn.comment1)
         except Exception as e:
             messages.error(
                 self.request, _("Unable to settle transaction - %s") % e)
@@ -54,7 +75,8 @@ class TransactionDetailView(generic.DetailView):
 
     def credit(self, orig_txn):
         try:
-            txn = facade.credit(orig_txn.comment1)
+            with audit.immediate():
+                txn = facade.credit(orig_txn.comment1)
         except Exception as e:
             messages.error(self.request, _("Unable to credit transaction - %s") % e)
             return redirect('payflow_dashboard:paypal-payflow-detail', pk=orig_txn.id)
@@ -64,7 +86,8 @@ class TransactionDetailView(generic.DetailView):
 
     def void(self, orig_txn):
         try:
-            txn = facade.void(orig_txn.comment1, orig_txn.pnref)
+            with audit.immediate():
+                txn = facade.void(orig_txn.comment1, orig_txn.pnref)
         except Exception as e:
             messages.error(self.request, _("Unable to void transaction - %s") % e)
             return redirect('payflow_dashboard:paypal-payflow-detail', pk=orig_txn.id)
@@ -3,9 +3,11 @@ Bridging module between Oscar and the gateway module (which is Oscar agnostic)
 """
 from oscar.apps.payment import exceptions
 
+from paypal import idempotency, tracing
 from paypal.payflow import codes, gateway, models
 
 
+@tracing.traced()
 def authorize(order_number, amt, bankcard, billing_address=None):
     """
     Make an *authorisation* request
@@ -27,9 +29,10 @@ def authorize(order_number, amt, bankcard, billing_address=None):
                       come from the `cleaned_data` of a billing address form).
     """
     return _submit_payment_details(
-        gateway.authorize, order_number, amt, bankcard, billing_address)
+        gateway.authorize, codes.AUTHORIZATION, order_number, amt, bankcard, billing_address)
 
 
+@tracing.traced()
 def sale(order_number, amt, bankcard, billing_address=None):
     """
     Make a *sale* request
@@ -48,12 +51,16 @@ def sale(order_number, amt, bankcard, billing_address=None):
     :billing_address: A dict of billing address information (which can come from
                       the `cleaned_data` of a billing address form.
     """
-    return _submit_payment_details(gateway.sale, order_number, amt, bankcard,
+    return _submit_payment_details(gateway.sale, codes.SALE, order_number, amt, bankcard,
                                    billing_address)
 
 
+def _is_approved(txn):
+    return txn.is_approved
+
+
 def _submit_payment_details(
-        gateway_fn, order_number, amt, bankcard, billing_address=None):
+        gateway_fn, trxtype, order_number, amt, bankcard, billing_address=None):
     # Remap address fields if set.
     address_fields = {}
     if billing_address:
@@ -66,7 +73,9 @@ def _submit_payment_details(
             'zip': billing_address['postcode'].strip(' ')
         })
 
-    txn = gateway_fn(
+    txn = idempotency.run_once(
+        idempotency.get_key(order_number, None, trxtype, amt), _is_approved,
+        gateway_fn,
         order_number,
         card_number=bankcard.number,
         cvv=bankcard.cvv,
@@ -78,6 +87,7 @@ def _submit_payment_details(
     return txn
 
 
+@tracing.traced()
 def delayed_capture(order_number, pnref=None, amt=None):
     """
     Capture funds that have been previously authorized.
@@ -107,12 +117,15 @@ def delayed_capture(order_number, pnref=None, amt=None):
                 "No authorization transaction found with PNREF=%s" % pnref)
         pnref = auth_txn
 
-    txn = gateway.delayed_capture(order_number, pnref, amt)
+    txn = idempotency.run_once(
+        idempotency.get_key(order_number, pnref, codes.DELAYED_CAPTURE, amt), _is_approved,
+        gateway.delayed_capture, order_number, pnref, amt)
     if not txn.is_approved:
         raise exceptions.UnableToTakePayment(txn.respmsg)
     return txn
 
 
+@tracing.traced()
 def referenced_sale(order_number, pnref, amt):
     """
     Capture funds using the bank/address details of a previous transaction
@@ -133,13 +146,15 @@ def referenced_sale(order_number, pnref, amt):
     :pnref: PNREF of a previous transaction to use.
     :amt: The amount to settle for.
     """
-    txn = gateway.reference_transaction(
-        order_number, pnref, amt)
+    txn = idempotency.run_once(
+        idempotency.get_key(order_number, pnref, codes.SALE, amt), _is_approved,
+        gateway.reference_transaction, order_number, pnref, amt)
     if not txn.is_approved:
         raise exceptions.UnableToTakePayment(txn.respmsg)
     return txn
 
 
+@tracing.traced()
 def void(order_number, pnref):
     """
     Void an authorisation transaction to prevent it from being settled
@@ -147,12 +162,14 @@ def void(order_number, pnref):
     :order_number: Order number
     :pnref: The PNREF of the transaction to void.
     """
-    txn = gateway.void(order_number, pnref)
+    txn = idempotency.run_once(
+        idempotency.get_key(order_number, pnref, codes.VOID), _is_approved, gateway.void, order_number, pnref)
     if not txn.is_approved:
         raise exceptions.PaymentError(txn.respmsg)
     return txn
 
 
+@tracing.traced()
 def credit(order_number, pnref=None, amt=None):
     """
     Return funds that have been previously settled.
@@ -175,7 +192,9 @@ def credit(order_number, pnref=None, amt=None):
                 "No authorization transaction found with PNREF=%s" % pnref)
         pnref = auth_txn
 
-    txn = gateway.credit(order_number, pnref, amt)
+    txn = idempotency.run_once(
+        idempotency.get_key(order_number, pnref, codes.CREDIT, amt), _is_approved,
+        gateway.credit, order_number, pnref, amt)
     if not txn.is_approved:
         raise exceptions.PaymentError(txn.respmsg)
     return txn
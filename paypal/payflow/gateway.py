@@ -7,9 +7,14 @@ import logging
 from django.conf import settings
 from django.core import exceptions
 
-from paypal import gateway
+from paypal import audit, gateway, instrumentation
 from paypal.payflow import codes, models
 
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    sync_to_async = None
+
 logger = logging.getLogger('paypal.payflow')
 
 
@@ -38,10 +43,7 @@ def sale(order_number, card_number, cvv, expiry_date, amt, **kwargs):
                                    amt, **kwargs)
 
 
-def _submit_payment_details(trxtype, order_number, card_number, cvv, expiry_date, amt, **kwargs):
-    """
-    Submit payment details to PayPal.
-    """
+def _get_payment_details_params(trxtype, order_number, card_number, cvv, expiry_date, amt, **kwargs):
     params = {
         'TRXTYPE': trxtype,
         'TENDER': codes.BANKCARD,
@@ -76,15 +78,18 @@ def _submit_payment_details(trxtype, order_number, card_number, cvv, expiry_date
             value = kwargs.get(key)
             if value:
                 params.update({'{}'.format(name): value})
-    return _transaction(params)
+    return params
 
 
-def delayed_capture(order_number, pnref, amt=None):
+def _submit_payment_details(trxtype, order_number, card_number, cvv, expiry_date, amt, **kwargs):
     """
-    Perform a DELAYED CAPTURE transaction.
-
-    This captures money that was previously authorised.
+    Submit payment details to PayPal.
     """
+    return _transaction(_get_payment_details_params(
+        trxtype, order_number, card_number, cvv, expiry_date, amt, **kwargs))
+
+
+def _get_delayed_capture_params(order_number, pnref, amt=None):
     params = {
         'COMMENT1': order_number,
         'TRXTYPE': codes.DELAYED_CAPTURE,
@@ -92,16 +97,20 @@ def delayed_capture(order_number, pnref, amt=None):
     }
     if amt:
         params['AMT'] = amt
-    return _transaction(params)
+    return params
 
 
-def reference_transaction(order_number, pnref, amt):
+def delayed_capture(order_number, pnref, amt=None):
     """
-    Capture money using the card/address details of a previous transaction
+    Perform a DELAYED CAPTURE transaction.
 
-    * The PNREF of the original txn is valid for 12 months
+    This captures money that was previously authorised.
     """
-    params = {
+    return _transaction(_get_delayed_capture_params(order_number, pnref, amt))
+
+
+def _get_reference_transaction_params(order_number, pnref, amt):
+    return {
         'COMMENT1': order_number,
         # Use SALE as we are effectively authorising and settling a new
         # transaction
@@ -110,13 +119,18 @@ def reference_transaction(order_number, pnref, amt):
         'ORIGID': pnref,
         'AMT': amt,
     }
-    return _transaction(params)
 
 
-def credit(order_number, pnref, amt=None):
+def reference_transaction(order_number, pnref, amt):
     """
-    Refund money back to a bankcard.
+    Capture money using the card/address details of a previous transaction
+
+    * The PNREF of the original txn is valid for 12 months
     """
+    return _transaction(_get_reference_transaction_params(order_number, pnref, amt))
+
+
+def _get_credit_params(order_number, pnref, amt=None):
     params = {
         'COMMENT1': order_number,
         'TRXTYPE': codes.CREDIT,
@@ -124,27 +138,35 @@ def credit(order_number, pnref, amt=None):
     }
     if amt:
         params['AMT'] = amt
-    return _transaction(params)
+    return params
 
 
-def void(order_number, pnref):
+def credit(order_number, pnref, amt=None):
     """
-    Prevent a transaction from being settled
+    Refund money back to a bankcard.
     """
-    params = {
+    return _transaction(_get_credit_params(order_number, pnref, amt))
+
+
+def _get_void_params(order_number, pnref):
+    return {
         'COMMENT1': order_number,
         'TRXTYPE': codes.VOID,
         'ORIGID': pnref
     }
-    return _transaction(params)
 
 
-def _transaction(extra_params):
+def void(order_number, pnref):
     """
-    Perform a transaction with PayPal.
+    Prevent a transaction from being settled
+    """
+    return _transaction(_get_void_params(order_number, pnref))
 
-    :extra_params: Additional parameters to include in the payload other than
-    the user credentials.
+
+def _get_transaction_request(extra_params):
+    """
+    Validate the parameters of a transaction and return the URL and full
+    parameters to send to PayPal.
     """
     if 'TRXTYPE' not in extra_params:
         raise RuntimeError("All transactions must specify a 'TRXTYPE' parameter")
@@ -190,25 +212,29 @@ def _transaction(extra_params):
                                          'PAYPAL_PAYFLOW_CURRENCY', 'USD')
         params['AMT'] = "%.2f" % params['AMT']
 
-    if getattr(settings, 'PAYPAL_PAYFLOW_PRODUCTION_MODE', False):
-        url = 'https://payflowpro.paypal.com'
-    else:
-        url = 'https://pilot-payflowpro.paypal.com'
+    url = getattr(settings, 'PAYPAL_PAYFLOW_URL', None)
+    if url is None:
+        if getattr(settings, 'PAYPAL_PAYFLOW_PRODUCTION_MODE', False):
+            url = 'https://payflowpro.paypal.com'
+        else:
+            url = 'https://pilot-payflowpro.paypal.com'
 
     logger.info("Performing %s transaction (trxtype=%s)",
                 codes.trxtype_map[trxtype], trxtype)
-    pairs = gateway.post(
-        url,
-        '&'.join(['{}={}'.format(n, v) for n, v in params.items()]),
-        encode=False
-    )
+    return url, params
+
 
+def _get_payload(params):
+    return '&'.join(['{}={}'.format(n, v) for n, v in params.items()])
+
+
+def _record_transaction(params, pairs):
     # Beware - this log information will contain the Payflow credentials
     # only use it in development, not production.
     logger.debug("Raw request: %s", pairs['_raw_request'])
     logger.debug("Raw response: %s", pairs['_raw_response'])
 
-    return models.PayflowTransaction.objects.create(
+    return audit.save(models.PayflowTransaction(
         comment1=params['COMMENT1'],
         trxtype=params['TRXTYPE'],
         tender=params.get('TENDER', None),
@@ -223,5 +249,80 @@ def _transaction(extra_params):
         authcode=pairs.get('AUTHCODE', None),
         raw_request=pairs['_raw_request'],
         raw_response=pairs['_raw_response'],
+        response_data=gateway.get_response_data(pairs),
         response_time=pairs['_response_time']
-    )
+    ))
+
+
+def _transaction(extra_params):
+    """
+    Perform a transaction with PayPal.
+
+    :extra_params: Additional parameters to include in the payload other than
+    the user credentials.
+    """
+    url, params = _get_transaction_request(extra_params)
+    call = instrumentation.start_call('payflow', params['TRXTYPE'], url)
+    try:
+        pairs = gateway.post(
+            url, _get_payload(params), encode=False, call=call, method=params['TRXTYPE'], integration='payflow')
+    except Exception as e:
+        call.failed(e)
+        raise
+    try:
+        txn = _record_transaction(params, pairs)
+    except Exception as e:
+        call.failed(e)
+        raise
+    call.mark('save')
+    call.finished(txn.is_approved)
+    return txn
+
+
+# Coroutine versions of the transactions above, for use under ASGI.  They take
+# the same arguments and return the same transaction objects.
+
+
+async def _async_transaction(extra_params):
+    url, params = _get_transaction_request(extra_params)
+    call = instrumentation.start_call('payflow', params['TRXTYPE'], url)
+    try:
+        pairs = await gateway.async_post(
+            url, _get_payload(params), encode=False, call=call, method=params['TRXTYPE'], integration='payflow')
+    except Exception as e:
+        call.failed(e)
+        raise
+    try:
+        txn = await sync_to_async(_record_transaction)(params, pairs)
+    except Exception as e:
+        call.failed(e)
+        raise
+    call.mark('save')
+    call.finished(txn.is_approved)
+    return txn
+
+
+async def async_authorize(order_number, card_number, cvv, expiry_date, amt, **kwargs):
+    return await _async_transaction(_get_payment_details_params(
+        codes.AUTHORIZATION, order_number, card_number, cvv, expiry_date, amt, **kwargs))
+
+
+async def async_sale(order_number, card_number, cvv, expiry_date, amt, **kwargs):
+    return await _async_transaction(_get_payment_details_params(
+        codes.SALE, order_number, card_number, cvv, expiry_date, amt, **kwargs))
+
+
+async def async_delayed_capture(order_number, pnref, amt=None):
+    return await _async_transaction(_get_delayed_capture_params(order_number, pnref, amt))
+
+
+async def async_reference_transaction(order_number, pnref, amt):
+    return await _async_transaction(_get_reference_transaction_params(order_number, pnref, amt))
+
+
+async def async_credit(order_number, pnref, amt=None):
+    return await _async_transaction(_get_credit_params(order_number, pnref, amt))
+
+
+async def async_void(order_number, pnref):
+    return await _async_transaction(_get_void_params(order_number, pnref))
@@ -11,6 +11,10 @@ from paypal.payflow import codes
 
 @python_2_unicode_compatible
 class PayflowTransaction(base.ResponseModel):
+    # RESULT values of approved transactions (126 is approved but flagged for
+    # review by the fraud filters)
+    APPROVED_RESULTS = ('0', '126')
+
     # This is the linking parameter between the merchant and PayPal.  It is
     # normally set to the order number
     comment1 = models.CharField(_("Comment 1"), max_length=128, db_index=True)
@@ -41,12 +45,19 @@ class PayflowTransaction(base.ResponseModel):
     class Meta:
         ordering = ('-date_created',)
         app_label = 'paypal'
+        indexes = [
+            # Dashboard pagination
+            models.Index(fields=['date_created', 'id']),
+        ]
 
     def save(self, *args, **kwargs):
+        self.mask_sensitive_data()
+        return super(PayflowTransaction, self).save(*args, **kwargs)
+
+    def mask_sensitive_data(self):
         self.raw_request = re.sub(r'PWD=.+?&', 'PWD=XXXXXX&', self.raw_request)
         self.raw_request = re.sub(r'ACCT=\d+(\d{4})&', 'ACCT=XXXXXXXXXXXX\1&', self.raw_request)
         self.raw_request = re.sub(r'CVV2=\d+&', 'CVV2=XXX&', self.raw_request)
-        return super(PayflowTransaction, self).save(*args, **kwargs)
 
     def get_trxtype_display(self):
         return gettext(codes.trxtype_map.get(self.trxtype, self.trxtype))
@@ -56,9 +67,14 @@ class PayflowTransaction(base.ResponseModel):
         return gettext(codes.tender_map.get(self.tender, ''))
     get_tender_display.short_description = _("Tender")
 
+    @property
+    def is_looked_up_later(self):
+        # Captures and credits find the original transaction by order number
+        return self.trxtype in (codes.AUTHORIZATION, codes.SALE)
+
     @property
     def is_approved(self):
-        return self.result in ('0', '126')
+        return self.result in self.APPROVED_RESULTS
 
     def is_address_verified(self):
         return self.avsaddr == 'Y' and self.avzip == 'Y'
@@ -0,0 +1,13 @@
+from django.dispatch import Signal
+
+# Signals sent around every call made to PayPal.  The sender is the name of the
+# integration ('express', 'payflow' or 'express_checkout'), method the NVP
+# METHOD, Payflow TRXTYPE or Orders v2 request class name.  See
+# paypal.instrumentation for the timings.
+
+gateway_request_started = Signal(providing_args=['method', 'host'])
+
+gateway_response_received = Signal(providing_args=[
+    'method', 'host', 'status', 'success', 'request_bytes', 'response_bytes', 'timings'])
+
+gateway_request_failed = Signal(providing_args=['method', 'host', 'status', 'exception', 'timings'])
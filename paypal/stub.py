@@ -0,0 +1,759 @@
+"""
+Stand-in for the PayPal endpoints, for load testing checkout without the
+sandbox.
+
+The server speaks:
+
+* the NVP API used by paypal.express (``POST /nvp``) and its checkout page
+  (``GET /webscr``);
+* the Payflow Pro API used by paypal.payflow (``POST /payflow``);
+* the OAuth and Orders v2 APIs used by paypal.express_checkout (``/v1`` and
+  ``/v2``) and its approval page (``GET /checkoutnow``).
+
+Tokens, transactions and orders go through the same lifecycle as on PayPal:
+eg a token has to be approved on the checkout page, which redirects straight
+back to the return URL, before it can be paid, and a Payflow authorisation can
+only be captured once.  State is kept in memory.
+
+Responses can be delayed according to a latency distribution per API, and a
+fraction of them can be replaced with errors.  The module has no Django
+dependency; run it with the ``paypal_stub_server`` management command or with
+``python -m paypal.stub``.
+"""
+import argparse
+import datetime
+import json
+import random
+import re
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+NVP, PAYFLOW, ORDERS = 'nvp', 'payflow', 'orders'
+APIS = (NVP, PAYFLOW, ORDERS)
+
+DEFAULT_ADDRESS = '127.0.0.1:8765'
+
+# Shipping address returned when the merchant didn't send one
+DEFAULT_SHIPPING_ADDRESS = {
+    'name': 'Sam Buyer',
+    'line1': '1 Main Terrace',
+    'city': 'Wolverhampton',
+    'state': 'West Midlands',
+    'postcode': 'W12 4LQ',
+    'country': 'GB',
+}
+
+
+class Latency:
+    """
+    Response time distribution, in milliseconds, parsed from a spec such as
+    ``fixed:50``, ``uniform:20,200``, ``normal:120,30``, ``lognormal:4.5,0.5``
+    (of the natural log of the time) or ``exponential:100`` (mean).
+    """
+    DISTRIBUTIONS = {
+        'fixed': (1, lambda rng, value: value),
+        'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+        'normal': (2, lambda rng, mean, stddev: rng.gauss(mean, stddev)),
+        'lognormal': (2, lambda rng, mu, sigma: rng.lognormvariate(mu, sigma)),
+        'exponential': (1, lambda rng, mean: rng.expovariate(1.0 / mean) if mean else 0),
+    }
+
+    def __init__(self, spec='fixed:0'):
+        name, _, args = spec.partition(':')
+        if name not in self.DISTRIBUTIONS:
+            raise ValueError("'%s' is not a latency distribution (choose from %s)" % (
+                name, ', '.join(sorted(self.DISTRIBUTIONS))))
+        nargs, self._sample = self.DISTRIBUTIONS[name]
+        try:
+            self.args = [float(arg) for arg in args.split(',')] if args else []
+        except ValueError:
+            raise ValueError("'%s' is not a valid latency" % spec)
+        if len(self.args) != nargs:
+            raise ValueError("The %s latency distribution takes %d parameter(s)" % (name, nargs))
+        self.spec = spec
+
+    def sample(self, rng):
+        """
+        Return a delay in seconds.
+        """
+        return max(self._sample(rng, *self.args), 0) / 1000.0
+
+    def __repr__(self):
+        return '<Latency %s>' % self.spec
+
+
+def parse_latencies(specs):
+    """
+    Return the latency of each API from a list of specs, either applying to
+    all APIs (``normal:120,30``) or to one (``payflow=fixed:300``).
+    """
+    latencies = dict.fromkeys(APIS, Latency())
+    for spec in specs or ():
+        api, sep, distribution = spec.rpartition('=')
+        if not sep:
+            latencies = dict.fromkeys(APIS, Latency(distribution))
+        elif api in APIS:
+            latencies[api] = Latency(distribution)
+        else:
+            raise ValueError("'%s' is not an API (choose from %s)" % (api, ', '.join(APIS)))
+    return latencies
+
+
+class ProtocolError(Exception):
+    """
+    A request PayPal would reject, with its error code and message.
+    """
+
+    def __init__(self, code, message, status=422):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+class StubState:
+    """
+    The tokens, transactions and orders created so far.
+    """
+
+    def __init__(self, rng, rng_lock):
+        self.rng = rng
+        self.rng_lock = rng_lock
+        self.lock = threading.Lock()
+        self.checkouts = {}
+        self.nvp_transactions = {}
+        self.payflow_transactions = {}
+        self.access_tokens = set()
+        self.orders = {}
+        self.authorizations = {}
+        self.captures = {}
+
+    def new_id(self, length=17, prefix=''):
+        with self.rng_lock:
+            return prefix + ''.join(self.rng.choice(string.ascii_uppercase + string.digits) for _ in range(length))
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    Multi-threaded stub server.  ``error_rate`` is the fraction of requests
+    answered with an API error (a failed ACK, a declined Payflow result or an
+    Orders 500), ``http_error_rate`` the fraction answered with an HTTP 503.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, latencies=None, error_rate=0.0, http_error_rate=0.0, seed=None, verbose=False):
+        super().__init__(address, StubRequestHandler)
+        self.latencies = latencies or parse_latencies(None)
+        self.error_rate = error_rate
+        self.http_error_rate = http_error_rate
+        self.verbose = verbose
+        self.rng = random.Random(seed)
+        # The handler threads share the generator
+        self.rng_lock = threading.Lock()
+        self.state = StubState(self.rng, self.rng_lock)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def get_settings(self):
+        """
+        Return the Django settings pointing the gateways at this server.
+        """
+        return get_settings(self.url)
+
+
+def get_settings(url):
+    """
+    Return the Django settings pointing the gateways at the stub server
+    listening on ``url``, eg 'http://127.0.0.1:8765'.
+    """
+    url = url.rstrip('/')
+    return {
+        'PAYPAL_NVP_URL': url + '/nvp',
+        'PAYPAL_CHECKOUT_URL': url + '/webscr',
+        'PAYPAL_PAYFLOW_URL': url + '/payflow',
+        'PAYPAL_API_URL': url,
+    }
+
+
+def _timestamp():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _add_query(url, **params):
+    return '%s%s%s' % (url, '&' if urlsplit(url).query else '?', urlencode(params))
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    ORDERS_ROUTES = (
+        ('POST', re.compile(r'^/v2/checkout/orders$'), 'create_order'),
+        ('GET', re.compile(r'^/v2/checkout/orders/(?P<id>[^/]+)$'), 'get_order'),
+        ('POST', re.compile(r'^/v2/checkout/orders/(?P<id>[^/]+)/authorize$'), 'authorize_order'),
+        ('POST', re.compile(r'^/v2/checkout/orders/(?P<id>[^/]+)/capture$'), 'capture_order'),
+        ('POST', re.compile(r'^/v2/payments/authorizations/(?P<id>[^/]+)/capture$'), 'capture_authorization'),
+        ('POST', re.compile(r'^/v2/payments/authorizations/(?P<id>[^/]+)/void$'), 'void_authorization'),
+        ('POST', re.compile(r'^/v2/payments/captures/(?P<id>[^/]+)/refund$'), 'refund_capture'),
+    )
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length).decode('utf-8') if length else ''
+
+    def _send(self, status, body=b'', content_type='text/plain', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Paypal-Debug-Id', self.state.new_id(13).lower())
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _redirect(self, url):
+        self._send(302, headers={'Location': url})
+
+    def _delay(self, api):
+        """
+        Wait as long as the API's latency, then return what should go wrong:
+        None, 'http' or 'api'.
+        """
+        with self.server.rng_lock:
+            delay = self.server.latencies[api].sample(self.server.rng)
+            roll = self.server.rng.random()
+        if delay:
+            time.sleep(delay)
+        if roll < self.server.http_error_rate:
+            return 'http'
+        if roll < self.server.http_error_rate + self.server.error_rate:
+            return 'api'
+        return None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        if url.path == '/webscr':
+            self.approve_checkout(query.get('token'))
+        elif url.path == '/checkoutnow':
+            self.approve_order(query.get('token'))
+        elif url.path.startswith('/v2/'):
+            self.handle_orders('GET', url.path)
+        else:
+            self._send(404, 'Not found')
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if path == '/nvp':
+            self.handle_nvp()
+        elif path == '/payflow':
+            self.handle_payflow()
+        elif path == '/v1/oauth2/token':
+            self.handle_oauth()
+        elif path.startswith('/v2/'):
+            self.handle_orders('POST', path)
+        else:
+            self._send(404, 'Not found')
+
+    # NVP (Express Checkout)
+
+    def handle_nvp(self):
+        params = dict(parse_qsl(self._read_body()))
+        failure = self._delay(NVP)
+        if failure == 'http':
+            return self._send(503, 'Service unavailable')
+        response = {
+            'TIMESTAMP': _timestamp(),
+            'CORRELATIONID': self.state.new_id(13).lower(),
+            'VERSION': params.get('VERSION', ''),
+            'BUILD': '2649250',
+        }
+        try:
+            if failure == 'api':
+                raise ProtocolError('10001', 'Internal Error')
+            handler = getattr(self, 'nvp_%s' % params.get('METHOD'), None)
+            if handler is None:
+                raise ProtocolError('81002', 'Method Specified is not Supported')
+            with self.state.lock:
+                response.update(handler(params))
+            response['ACK'] = 'Success'
+        except ProtocolError as e:
+            response.update({
+                'ACK': 'Failure',
+                'L_ERRORCODE0': e.code,
+                'L_SHORTMESSAGE0': e.message,
+                'L_LONGMESSAGE0': e.message,
+                'L_SEVERITYCODE0': 'Error',
+            })
+        self._send(200, urlencode(response), 'text/plain; charset=utf-8')
+
+    def _get_checkout(self, token):
+        checkout = self.state.checkouts.get(token)
+        if checkout is None:
+            raise ProtocolError('10410', 'Invalid token')
+        return checkout
+
+    def _get_nvp_transaction(self, transaction_id):
+        transaction = self.state.nvp_transactions.get(transaction_id)
+        if transaction is None:
+            raise ProtocolError('10609', 'Transaction id is invalid')
+        return transaction
+
+    def nvp_SetExpressCheckout(self, params):
+        token = self.state.new_id(17, 'EC-')
+        shipping_amount = params.get('PAYMENTREQUEST_0_SHIPPINGAMT', '0.00')
+        shipping_option = None
+        i = 0
+        while 'L_SHIPPINGOPTIONNAME%d' % i in params:
+            if params.get('L_SHIPPINGOPTIONISDEFAULT%d' % i) == 'true' or shipping_option is None:
+                shipping_option = params['L_SHIPPINGOPTIONNAME%d' % i]
+                shipping_amount = params.get('L_SHIPPINGOPTIONAMOUNT%d' % i, shipping_amount)
+            i += 1
+        self.state.checkouts[token] = {
+            'params': params,
+            'status': 'PaymentActionNotInitiated',
+            'payer_id': None,
+            'shipping_amount': shipping_amount,
+            'shipping_option': shipping_option,
+        }
+        return {'TOKEN': token}
+
+    def _send_page_error(self, failure):
+        if failure == 'http':
+            return self._send(503, 'Service unavailable')
+        return self._send(500, 'Internal error')
+
+    def approve_checkout(self, token):
+        failure = self._delay(NVP)
+        if failure is not None:
+            return self._send_page_error(failure)
+        with self.state.lock:
+            checkout = self.state.checkouts.get(token)
+            if checkout is None:
+                return self._send(404, 'Unknown token')
+            if checkout['payer_id'] is None:
+                checkout['payer_id'] = self.state.new_id(13)
+        self._redirect(_add_query(checkout['params']['RETURNURL'], token=token, PayerID=checkout['payer_id']))
+
+    def nvp_GetExpressCheckoutDetails(self, params):
+        token = params.get('TOKEN')
+        checkout = self._get_checkout(token)
+        request = checkout['params']
+        response = {
+            'TOKEN': token,
+            'CHECKOUTSTATUS': checkout['status'],
+            'EMAIL': 'buyer@example.com',
+            'PAYERSTATUS': 'verified',
+            'FIRSTNAME': 'Sam',
+            'LASTNAME': 'Buyer',
+            'COUNTRYCODE': DEFAULT_SHIPPING_ADDRESS['country'],
+            'CURRENCYCODE': request.get('PAYMENTREQUEST_0_CURRENCYCODE', 'GBP'),
+            'AMT': request.get('PAYMENTREQUEST_0_AMT', '0.00'),
+            'SHIPPINGAMT': checkout['shipping_amount'],
+            'PAYMENTREQUEST_0_CURRENCYCODE': request.get('PAYMENTREQUEST_0_CURRENCYCODE', 'GBP'),
+            'PAYMENTREQUEST_0_AMT': request.get('PAYMENTREQUEST_0_AMT', '0.00'),
+            'PAYMENTREQUEST_0_ITEMAMT': request.get('PAYMENTREQUEST_0_ITEMAMT', '0.00'),
+            'PAYMENTREQUEST_0_SHIPPINGAMT': checkout['shipping_amount'],
+        }
+        if checkout['payer_id']:
+            response['PAYERID'] = checkout['payer_id']
+        if checkout['shipping_option']:
+            response['SHIPPINGOPTIONNAME'] = checkout['shipping_option']
+        if request.get('NOSHIPPING') != '1':
+            address = DEFAULT_SHIPPING_ADDRESS
+            for key, default in (('SHIPTONAME', address['name']), ('SHIPTOSTREET', address['line1']),
+                                 ('SHIPTOCITY', address['city']), ('SHIPTOSTATE', address['state']),
+                                 ('SHIPTOZIP', address['postcode']), ('SHIPTOCOUNTRYCODE', address['country'])):
+                response['PAYMENTREQUEST_0_%s' % key] = request.get('PAYMENTREQUEST_0_%s' % key, default)
+        return response
+
+    def nvp_DoExpressCheckoutPayment(self, params):
+        token = params.get('TOKEN')
+        checkout = self._get_checkout(token)
+        if checkout['payer_id'] is None or params.get('PAYERID') != checkout['payer_id']:
+            raise ProtocolError('10419', 'Express Checkout PayerID is missing or does not match')
+        if checkout['status'] == 'PaymentActionCompleted':
+            raise ProtocolError('10415', 'A successful transaction has already been completed for this token')
+        checkout['status'] = 'PaymentActionCompleted'
+        action = params.get('PAYMENTREQUEST_0_PAYMENTACTION', 'Sale')
+        transaction_id = self.state.new_id(17)
+        amount = params.get('PAYMENTREQUEST_0_AMT')
+        currency = params.get('PAYMENTREQUEST_0_CURRENCYCODE')
+        self.state.nvp_transactions[transaction_id] = {
+            'action': action, 'amount': amount, 'currency': currency,
+            'status': 'Completed' if action == 'Sale' else 'Pending',
+        }
+        response = {
+            'TOKEN': token,
+            'PAYMENTINFO_0_TRANSACTIONID': transaction_id,
+            'PAYMENTINFO_0_TRANSACTIONTYPE': 'expresscheckout',
+            'PAYMENTINFO_0_PAYMENTTYPE': 'instant',
+            'PAYMENTINFO_0_ORDERTIME': _timestamp(),
+            'PAYMENTINFO_0_AMT': amount,
+            'PAYMENTINFO_0_CURRENCYCODE': currency,
+            'PAYMENTINFO_0_PAYMENTSTATUS': self.state.nvp_transactions[transaction_id]['status'],
+            'PAYMENTINFO_0_ACK': 'Success',
+        }
+        if action != 'Sale':
+            response['PAYMENTINFO_0_PENDINGREASON'] = action.lower()
+        return response
+
+    def nvp_DoCapture(self, params):
+        authorization_id = params.get('AUTHORIZATIONID')
+        authorization = self._get_nvp_transaction(authorization_id)
+        if authorization['status'] != 'Pending':
+            raise ProtocolError('10602', 'Authorization has already been completed')
+        authorization['status'] = 'Completed'
+        transaction_id = self.state.new_id(17)
+        self.state.nvp_transactions[transaction_id] = {
+            'action': 'Capture', 'amount': params.get('AMT'), 'currency': params.get('CURRENCYCODE'),
+            'status': 'Completed',
+        }
+        return {
+            'AUTHORIZATIONID': authorization_id,
+            'TRANSACTIONID': transaction_id,
+            'AMT': params.get('AMT'),
+            'CURRENCYCODE': params.get('CURRENCYCODE'),
+            'PAYMENTSTATUS': 'Completed',
+        }
+
+    def nvp_DoVoid(self, params):
+        authorization_id = params.get('AUTHORIZATIONID')
+        authorization = self._get_nvp_transaction(authorization_id)
+        if authorization['status'] != 'Pending':
+            raise ProtocolError('10602', 'Authorization has already been completed')
+        authorization['status'] = 'Voided'
+        return {'AUTHORIZATIONID': authorization_id}
+
+    def nvp_RefundTransaction(self, params):
+        transaction = self._get_nvp_transaction(params.get('TRANSACTIONID'))
+        if transaction['status'] != 'Completed':
+            raise ProtocolError('10009', 'The transaction cannot be refunded')
+        transaction['status'] = 'Refunded'
+        amount = params.get('AMT') or transaction['amount']
+        return {
+            'REFUNDTRANSACTIONID': self.state.new_id(17),
+            'GROSSREFUNDAMT': amount,
+            'TOTALREFUNDEDAMOUNT': amount,
+            'CURRENCYCODE': params.get('CURRENCYCODE') or transaction['currency'],
+            'REFUNDSTATUS': 'Instant',
+        }
+
+    # Payflow Pro
+
+    def handle_payflow(self):
+        # Payflow payloads aren't URL encoded
+        params = dict(pair.split('=', 1) for pair in self._read_body().split('&') if '=' in pair)
+        failure = self._delay(PAYFLOW)
+        if failure == 'http':
+            return self._send(503, 'Service unavailable')
+        try:
+            if failure == 'api':
+                raise ProtocolError('12', 'Declined')
+            trxtype = params.get('TRXTYPE')
+            with self.state.lock:
+                if trxtype in ('A', 'S'):
+                    response = self.payflow_payment(params)
+                elif trxtype in ('D', 'V', 'C'):
+                    response = self.payflow_follow_up(trxtype, params)
+                else:
+                    raise ProtocolError('3', 'Invalid transaction type')
+            response.update({'RESULT': '0', 'RESPMSG': 'Approved'})
+        except ProtocolError as e:
+            response = {'RESULT': e.code, 'RESPMSG': e.message}
+        response.setdefault('PNREF', self.state.new_id(11, 'V'))
+        self._send(200, urlencode(response), 'text/namevalue')
+
+    def payflow_payment(self, params):
+        pnref = self.state.new_id(11, 'V')
+        self.state.payflow_transactions[pnref] = {
+            'trxtype': params['TRXTYPE'], 'amount': params.get('AMT'), 'settled': params['TRXTYPE'] == 'S',
+            'voided': False,
+        }
+        response = {'PNREF': pnref, 'AUTHCODE': self.state.new_id(6), 'AVSADDR': 'Y', 'AVSZIP': 'Y'}
+        if 'CVV2' in params:
+            response['CVV2MATCH'] = 'Y'
+        return response
+
+    def payflow_follow_up(self, trxtype, params):
+        original = self.state.payflow_transactions.get(params.get('ORIGID'))
+        if original is None or original['voided']:
+            raise ProtocolError('19', 'Original transaction ID not found')
+        if trxtype == 'D':
+            if original['trxtype'] != 'A' or original['settled']:
+                raise ProtocolError('111', 'Capture error. Only authorization transactions can be captured')
+            original['settled'] = True
+        elif trxtype == 'V':
+            original['voided'] = True
+        elif not original['settled']:
+            raise ProtocolError('105', 'Credit error. Make sure you have not already credited this transaction')
+        pnref = self.state.new_id(11, 'V')
+        self.state.payflow_transactions[pnref] = {
+            'trxtype': trxtype, 'amount': params.get('AMT') or original['amount'], 'settled': trxtype != 'V',
+            'voided': False,
+        }
+        return {'PNREF': pnref}
+
+    # OAuth and Orders v2 (Checkout)
+
+    def _send_json(self, status, data=None):
+        body = json.dumps(data) if data is not None else ''
+        self._send(status, body, 'application/json')
+
+    def _send_orders_error(self, status, name, message, issue=None):
+        error = {'name': name, 'message': message, 'debug_id': self.state.new_id(13).lower()}
+        if issue:
+            error['details'] = [{'issue': issue, 'description': message}]
+        self._send_json(status, error)
+
+    def handle_oauth(self):
+        self._read_body()
+        failure = self._delay(ORDERS)
+        if failure is not None:
+            return self._send_orders_error(503 if failure == 'http' else 500, 'INTERNAL_SERVER_ERROR',
+                                           'An internal server error occurred.')
+        if not self.headers.get('Authorization', '').startswith('Basic '):
+            return self._send_json(401, {
+                'error': 'invalid_client', 'error_description': 'Client Authentication failed'})
+        token = self.state.new_id(64)
+        with self.state.lock:
+            self.state.access_tokens.add(token)
+        self._send_json(200, {
+            'scope': 'https://uri.paypal.com/services/payments/payment',
+            'access_token': token,
+            'token_type': 'Bearer',
+            'app_id': 'APP-STUB',
+            'expires_in': 32400,
+            'nonce': self.state.new_id(20),
+        })
+
+    def handle_orders(self, verb, path):
+        body = self._read_body()
+        failure = self._delay(ORDERS)
+        if failure is not None:
+            return self._send_orders_error(503 if failure == 'http' else 500, 'INTERNAL_SERVER_ERROR',
+                                           'An internal server error occurred.')
+        authorization = self.headers.get('Authorization', '')
+        if authorization[len('Bearer '):] not in self.state.access_tokens:
+            return self._send_orders_error(401, 'AUTHENTICATION_FAILURE', 'Authentication failed due to invalid '
+                                           'authentication credentials or a missing Authorization header.')
+        for route_verb, pattern, name in self.ORDERS_ROUTES:
+            match = pattern.match(path)
+            if match and route_verb == verb:
+                break
+        else:
+            return self._send_orders_error(404, 'RESOURCE_NOT_FOUND', 'The specified resource does not exist.')
+        try:
+            data = json.loads(body) if body else {}
+            with self.state.lock:
+                status, response = getattr(self, 'orders_%s' % name)(data, **match.groupdict())
+        except ProtocolError as e:
+            name = 'RESOURCE_NOT_FOUND' if e.status == 404 else 'UNPROCESSABLE_ENTITY'
+            return self._send_orders_error(e.status, name, e.message, e.code)
+        self._send_json(status, response)
+
+    def _base_url(self):
+        return 'http://%s' % self.headers.get('Host', '%s:%s' % self.server.server_address[:2])
+
+    def _get_order(self, order_id):
+        order = self.state.orders.get(order_id)
+        if order is None:
+            raise ProtocolError('INVALID_RESOURCE_ID', 'Specified resource ID does not exist.', status=404)
+        return order
+
+    def _order_representation(self, order):
+        links = [{'href': '%s/v2/checkout/orders/%s' % (self._base_url(), order['id']), 'rel': 'self',
+                  'method': 'GET'}]
+        if order['status'] == 'CREATED':
+            links.append({'href': '%s/checkoutnow?token=%s' % (self._base_url(), order['id']), 'rel': 'approve',
+                          'method': 'GET'})
+        representation = {
+            'id': order['id'],
+            'intent': order['intent'],
+            'status': order['status'],
+            'purchase_units': order['purchase_units'],
+            'create_time': order['create_time'],
+            'links': links,
+        }
+        if order['payer'] is not None:
+            representation['payer'] = order['payer']
+        return representation
+
+    def orders_create_order(self, data):
+        order_id = self.state.new_id(17)
+        purchase_units = data.get('purchase_units') or [{}]
+        for unit in purchase_units:
+            unit.setdefault('reference_id', 'default')
+        self.state.orders[order_id] = {
+            'id': order_id,
+            'intent': data.get('intent', 'CAPTURE'),
+            'status': 'CREATED',
+            'purchase_units': purchase_units,
+            'application_context': data.get('application_context', {}),
+            'create_time': _timestamp(),
+            'payer': None,
+        }
+        return 201, self._order_representation(self.state.orders[order_id])
+
+    def approve_order(self, order_id):
+        failure = self._delay(ORDERS)
+        if failure is not None:
+            return self._send_page_error(failure)
+        with self.state.lock:
+            order = self.state.orders.get(order_id)
+            if order is None:
+                return self._send(404, 'Unknown token')
+            if order['status'] == 'CREATED':
+                order['status'] = 'APPROVED'
+                order['payer'] = {
+                    'name': {'given_name': 'Sam', 'surname': 'Buyer'},
+                    'email_address': 'buyer@example.com',
+                    'payer_id': self.state.new_id(13),
+                    'address': {'country_code': DEFAULT_SHIPPING_ADDRESS['country']},
+                }
+                address = DEFAULT_SHIPPING_ADDRESS
+                order['purchase_units'][0].setdefault('shipping', {
+                    'name': {'full_name': address['name']},
+                    'address': {
+                        'address_line_1': address['line1'],
+                        'admin_area_2': address['city'],
+                        'admin_area_1': address['state'],
+                        'postal_code': address['postcode'],
+                        'country_code': address['country'],
+                    },
+                })
+        return_url = order['application_context'].get('return_url', '/')
+        self._redirect(_add_query(return_url, token=order_id, PayerID=order['payer']['payer_id']))
+
+    def orders_get_order(self, data, id):
+        return 200, self._order_representation(self._get_order(id))
+
+    def _check_approved(self, order, intent):
+        if order['status'] != 'APPROVED':
+            raise ProtocolError('ORDER_NOT_APPROVED', 'Payer has not yet approved the Order for payment.')
+        if order['intent'] != intent:
+            raise ProtocolError('ACTION_DOES_NOT_MATCH_INTENT', 'Order was created with an intent of %s.'
+                                % order['intent'])
+
+    def orders_authorize_order(self, data, id):
+        order = self._get_order(id)
+        self._check_approved(order, 'AUTHORIZE')
+        authorization_id = self.state.new_id(17)
+        self.state.authorizations[authorization_id] = {'order': id, 'status': 'CREATED'}
+        order['status'] = 'COMPLETED'
+        order['purchase_units'][0]['payments'] = {'authorizations': [{
+            'id': authorization_id,
+            'status': 'CREATED',
+            'amount': order['purchase_units'][0].get('amount'),
+        }]}
+        return 201, self._order_representation(order)
+
+    def orders_capture_order(self, data, id):
+        order = self._get_order(id)
+        self._check_approved(order, 'CAPTURE')
+        capture_id = self.state.new_id(17)
+        self.state.captures[capture_id] = {'order': id, 'status': 'COMPLETED'}
+        order['status'] = 'COMPLETED'
+        order['purchase_units'][0]['payments'] = {'captures': [{
+            'id': capture_id,
+            'status': 'COMPLETED',
+            'amount': order['purchase_units'][0].get('amount'),
+        }]}
+        return 201, self._order_representation(order)
+
+    def _get_authorization(self, authorization_id):
+        authorization = self.state.authorizations.get(authorization_id)
+        if authorization is None:
+            raise ProtocolError('INVALID_RESOURCE_ID', 'Specified resource ID does not exist.', status=404)
+        if authorization['status'] != 'CREATED':
+            raise ProtocolError('AUTHORIZATION_ALREADY_CAPTURED', 'Authorization has already been captured.')
+        return authorization
+
+    def orders_capture_authorization(self, data, id):
+        self._get_authorization(id)['status'] = 'CAPTURED'
+        capture_id = self.state.new_id(17)
+        self.state.captures[capture_id] = {'authorization': id, 'status': 'COMPLETED'}
+        return 201, {'id': capture_id, 'status': 'COMPLETED'}
+
+    def orders_void_authorization(self, data, id):
+        self._get_authorization(id)['status'] = 'VOIDED'
+        return 204, None
+
+    def orders_refund_capture(self, data, id):
+        capture = self.state.captures.get(id)
+        if capture is None:
+            raise ProtocolError('INVALID_RESOURCE_ID', 'Specified resource ID does not exist.', status=404)
+        if capture['status'] != 'COMPLETED':
+            raise ProtocolError('CAPTURE_FULLY_REFUNDED', 'The capture has already been fully refunded.')
+        capture['status'] = 'REFUNDED'
+        return 201, {'id': self.state.new_id(17), 'status': 'COMPLETED'}
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        'addrport', nargs='?', default=DEFAULT_ADDRESS, help="Address to listen on (default %s)" % DEFAULT_ADDRESS)
+    parser.add_argument(
+        '--latency', action='append', metavar='[API=]DISTRIBUTION',
+        help="Response time distribution in milliseconds, eg normal:120,30, for all APIs or one of %s. "
+             "Can be repeated." % ', '.join(APIS))
+    parser.add_argument(
+        '--error-rate', type=float, default=0.0, help="Fraction of requests answered with an API error")
+    parser.add_argument(
+        '--http-error-rate', type=float, default=0.0, help="Fraction of requests answered with an HTTP 503")
+    parser.add_argument('--seed', type=int, help="Random seed, for reproducible runs")
+
+
+def create_server(addrport=DEFAULT_ADDRESS, latency=None, error_rate=0.0, http_error_rate=0.0, seed=None,
+                  verbose=False, **kwargs):
+    """
+    Create a server from the command line options.  Raise ValueError if they
+    aren't valid.
+    """
+    host, _, port = addrport.rpartition(':')
+    if not port.isdigit():
+        raise ValueError("'%s' is not a valid address and port" % addrport)
+    for rate in (error_rate, http_error_rate):
+        if not 0 <= rate <= 1:
+            raise ValueError("Error rates must be between 0 and 1")
+    return StubServer((host or '127.0.0.1', int(port)), parse_latencies(latency), error_rate, http_error_rate,
+                      seed, verbose)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a stub of the PayPal endpoints")
+    add_arguments(parser)
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log every request")
+    options = parser.parse_args(argv)
+    try:
+        server = create_server(**vars(options))
+    except ValueError as e:
+        parser.error(str(e))
+    for name, value in server.get_settings().items():
+        print('%s = %r' % (name, value))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
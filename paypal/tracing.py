@@ -0,0 +1,102 @@
+"""
+Optional OpenTelemetry tracing of the checkout flow.
+
+When the ``opentelemetry-api`` package is installed, spans are created around
+the facade functions, each call made to PayPal, audit row saves, frozen basket
+reloads and shipping method resolution.  They are exported by whichever tracer
+provider the project configures; without the package everything here is a
+no-op and ``traced`` leaves functions undecorated.
+"""
+import asyncio
+import functools
+
+try:
+    from opentelemetry import context, trace
+except ImportError:
+    context = trace = None
+
+_tracer = trace.get_tracer('paypal') if trace is not None else None
+
+
+def enabled():
+    """
+    Whether OpenTelemetry is installed and a tracer provider has been set.
+    """
+    return trace is not None and not isinstance(trace.get_tracer_provider(), trace.ProxyTracerProvider)
+
+
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def span(name, **attributes):
+    """
+    Return a context manager running its block in a new span, which records
+    any exception raised.
+    """
+    if _tracer is None:
+        return NULL_SPAN
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def traced(name=None):
+    """
+    Decorator running a function or coroutine function in a span named after
+    it (or ``name``).
+    """
+    def decorator(func):
+        if _tracer is None:
+            return func
+        span_name = name or '%s.%s' % (func.__module__, func.__qualname__)
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _tracer.start_as_current_span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _tracer.start_as_current_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ClientSpan:
+    """
+    Span of a call made to PayPal, made current until it is ended so that
+    spans started meanwhile (eg the audit save) are its children.
+    """
+
+    def __init__(self, name, attributes):
+        self.span = _tracer.start_span(name, kind=trace.SpanKind.CLIENT, attributes=attributes)
+        self._token = context.attach(trace.set_span_in_context(self.span))
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.span.set_attribute(key, value)
+
+    def end(self, exception=None):
+        if exception is not None:
+            self.span.record_exception(exception)
+            self.span.set_status(trace.Status(trace.StatusCode.ERROR, str(exception)))
+        context.detach(self._token)
+        self.span.end()
+
+
+def start_client_span(name, **attributes):
+    if not enabled():
+        return None
+    return ClientSpan(name, attributes)
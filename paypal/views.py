@@ -0,0 +1,14 @@
+from django.conf import settings
+
+from paypal import gateway
+
+
+class CheckoutDeadlineMixin:
+    """
+    Limit the time all the calls to PayPal made while handling a request may
+    take to PAYPAL_CHECKOUT_DEADLINE seconds (see paypal.gateway.deadline).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with gateway.deadline(getattr(settings, 'PAYPAL_CHECKOUT_DEADLINE', None)):
+            return super().dispatch(request, *args, **kwargs)
@@ -297,6 +297,14 @@ OSCAR_DASHBOARD_NAVIGATION.append(
                 'label': _('Express Checkout transactions'),
                 'url_name': 'express_checkout_dashboard:paypal-transaction-list',
             },
+            {
+                'label': _('PayFlow response times'),
+                'url_name': 'payflow_dashboard:paypal-payflow-response-times',
+            },
+            {
+                'label': _('Express response times'),
+                'url_name': 'express_dashboard:paypal-express-response-times',
+            },
         ]
     })
 
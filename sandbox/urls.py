@@ -16,6 +16,7 @@ urlpatterns = [
 urlpatterns += i18n_patterns(
     # PayPal Express integration...
     path('checkout/paypal/', include('paypal.express_checkout.urls')),
+    path('checkout/paypal-express/', include('paypal.express.urls')),
     # Dashboard views for Payflow Pro
     path('dashboard/paypal/payflow/', apps.get_app_config("payflow_dashboard").urls),
     # Dashboard views for Express
@@ -23,7 +23,11 @@ setup(
         'django-localflavor'
     ],
     extras_require={
-        'oscar': ['django-oscar>=2.0,<2.2']
+        'oscar': ['django-oscar>=2.0,<2.2'],
+        'async': ['httpx>=0.18', 'asgiref>=3.2'],
+        'prometheus': ['prometheus_client>=0.7'],
+        'statsd': ['statsd>=3.3'],
+        'tracing': ['opentelemetry-api>=1.0'],
     },
     # See http://pypi.python.org/pypi?%3Aaction=list_classifiers
     classifiers=[
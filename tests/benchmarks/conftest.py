@@ -0,0 +1,120 @@
+"""
+Benchmarks of the hot paths of the integrations.
+
+These are not collected by the normal test run.  Run them with
+pytest-benchmark installed::
+
+    make benchmark
+
+Besides the wall time measured by pytest-benchmark, each benchmark records
+the peak memory allocated (in KiB) and the number of queries made by one
+extra run in its ``extra_info``, which ``--benchmark-json`` exports and
+``--benchmark-compare`` keeps alongside the timings.
+"""
+import datetime
+import threading
+import tracemalloc
+from decimal import Decimal as D
+from types import SimpleNamespace
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from paypal import gateway, stub
+
+
+def _profile(func, args, count_queries):
+    """
+    Run ``func`` once, returning the peak memory it allocated and the number
+    of queries it made.
+    """
+    tracemalloc.start()
+    try:
+        if count_queries:
+            with CaptureQueriesContext(connection) as queries:
+                func(*args)
+            num_queries = len(queries)
+        else:
+            func(*args)
+            num_queries = 0
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak, num_queries
+
+
+@pytest.fixture
+def measure(request, benchmark):
+    """
+    Benchmark ``func(*args)``, where ``setup`` (if given) returns fresh args
+    for each round, and record its allocations and queries.  Fails if more
+    than ``max_queries`` queries are made.
+    """
+    count_queries = request.node.get_closest_marker('django_db') is not None
+
+    def measure(func, *args, setup=None, rounds=50, max_queries=None):
+        if setup is None:
+            result = benchmark(func, *args)
+            peak, num_queries = _profile(func, args, count_queries)
+        else:
+            result = benchmark.pedantic(func, setup=lambda: (setup(), {}), rounds=rounds)
+            peak, num_queries = _profile(func, setup(), count_queries)
+        benchmark.extra_info['peak_memory_kib'] = round(peak / 1024.0, 1)
+        benchmark.extra_info['queries'] = num_queries
+        if max_queries is not None:
+            assert num_queries <= max_queries
+        return result
+    return measure
+
+
+@pytest.fixture(scope='session')
+def stub_server():
+    server = stub.StubServer(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub_settings(stub_server, settings):
+    for name, value in stub_server.get_settings().items():
+        setattr(settings, name, value)
+    yield stub_server
+    gateway.reset_session()
+
+
+# Modification time of the benchmark products
+DATE_UPDATED = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _create_basket(num_lines, price=D('9.99')):
+    """
+    Return a basket-like object with ``num_lines`` lines, each for a product
+    with an HTML description, without touching the database.
+    """
+    lines = []
+    for index in range(num_lines):
+        product = SimpleNamespace(
+            pk=index + 1,
+            date_updated=DATE_UPDATED,
+            upc='UPC%06d' % index,
+            description='<p>A <strong>very</strong> nice product, number %d.</p>' % index,
+            is_shipping_required=True,
+            get_title=lambda index=index: 'Product %d' % index)
+        lines.append(SimpleNamespace(product=product, unit_price_incl_tax=price, quantity=2))
+    return SimpleNamespace(
+        id=1,
+        currency='GBP',
+        total_incl_tax=price * 2 * num_lines,
+        all_lines=lambda: lines,
+        offer_discounts=[],
+        voucher_discounts=[],
+        shipping_discounts=[])
+
+
+@pytest.fixture
+def create_basket():
+    return _create_basket
@@ -0,0 +1,72 @@
+from decimal import Decimal as D
+from urllib.parse import urlencode
+
+import pytest
+from oscar.apps.shipping.methods import FixedPrice, Free
+
+from paypal.express import gateway
+from paypal.express.models import ExpressTransaction
+from paypal.express_checkout.gateway import INTENT_CAPTURE, PaymentProcessor
+
+pytest.importorskip('pytest_benchmark')
+
+BASKET_SIZES = [1, 10, 100, 500]
+
+
+def get_details_response(num_lines):
+    params = {
+        'TOKEN': 'EC-6469953681606921P',
+        'ACK': 'Success',
+        'CORRELATIONID': '50a8d895e928f',
+        'VERSION': '119',
+        'PAYERID': 'JBZVJWHGK56WQ',
+        'PAYMENTREQUEST_0_AMT': '%.2f' % (num_lines * 9.99),
+        'PAYMENTREQUEST_0_CURRENCYCODE': 'GBP',
+        'PAYMENTREQUEST_0_SHIPTONAME': 'Barry Barrington',
+        'PAYMENTREQUEST_0_SHIPTOSTREET': '1 Main Street',
+        'PAYMENTREQUEST_0_SHIPTOCITY': 'London',
+        'PAYMENTREQUEST_0_SHIPTOZIP': 'N1 1AA',
+        'PAYMENTREQUEST_0_SHIPTOCOUNTRYCODE': 'GB',
+    }
+    for index in range(num_lines):
+        params.update({
+            'L_PAYMENTREQUEST_0_NAME%d' % index: 'Product %d' % index,
+            'L_PAYMENTREQUEST_0_NUMBER%d' % index: 'UPC%06d' % index,
+            'L_PAYMENTREQUEST_0_QTY%d' % index: '1',
+            'L_PAYMENTREQUEST_0_AMT%d' % index: '9.99',
+        })
+    return urlencode(params)
+
+
+@pytest.mark.parametrize('num_lines', BASKET_SIZES)
+def test_set_txn_params(measure, create_basket, num_lines):
+    basket = create_basket(num_lines)
+    methods = [Free(), FixedPrice(D('5.00'), D('6.00'))]
+    params = measure(
+        gateway._get_set_txn_params, basket, methods, 'GBP', 'http://example.com/success',
+        'http://example.com/cancel', 'http://example.com/update')
+    assert 'L_PAYMENTREQUEST_0_NAME%d' % (num_lines - 1) in params
+
+
+@pytest.mark.parametrize('num_lines', BASKET_SIZES)
+def test_response_parsing(measure, num_lines):
+    raw_response = get_details_response(num_lines)
+
+    def parse(txn):
+        # The first access parses the response, later ones hit the cache
+        txn.context
+        for key in ('ACK', 'PAYERID', 'PAYMENTREQUEST_0_AMT', 'PAYMENTREQUEST_0_SHIPTOCOUNTRYCODE'):
+            txn.value(key)
+        return txn.indexed_values('PAYMENTREQUEST_0_')
+
+    lines = measure(parse, setup=lambda: (ExpressTransaction(raw_response=raw_response),))
+    assert len(lines) == num_lines
+
+
+@pytest.mark.parametrize('num_lines', BASKET_SIZES)
+def test_order_create_request_body(measure, create_basket, num_lines):
+    basket = create_basket(num_lines)
+    body = measure(
+        PaymentProcessor().build_order_create_request_body, basket, 'GBP', 'http://example.com/success',
+        'http://example.com/cancel', basket.total_incl_tax, None, None, INTENT_CAPTURE)
+    assert len(body['purchase_units'][0]['items']) == num_lines
@@ -0,0 +1,32 @@
+import itertools
+from decimal import Decimal as D
+
+import pytest
+
+from paypal.payflow import codes
+from paypal.payflow.models import PayflowTransaction
+
+pytest.importorskip('pytest_benchmark')
+
+RAW_REQUEST = (
+    'PARTNER=PayPal&VENDOR=oscar&USER=oscar&PWD=secret123&TRXTYPE=A&TENDER=C&COMMENT1=1234'
+    '&ACCT=4111111111111111&CVV2=123&EXPDATE=1230&AMT=10.00&CURRENCY=GBP&')
+RAW_RESPONSE = (
+    'RESULT=0&PNREF=V19A3D27B61E&RESPMSG=Approved&AUTHCODE=010010&AVSADDR=X&AVSZIP=X&CVV2MATCH=Y'
+    '&IAVS=X&PPREF=ZPPGDBCJXQ2NH8Z6')
+
+
+@pytest.mark.django_db
+def test_payflow_transaction_save(measure):
+    pnrefs = ('V19A3D%06d' % index for index in itertools.count())
+
+    def create_txn():
+        return (PayflowTransaction(
+            comment1='1234', trxtype=codes.AUTHORIZATION, tender=codes.BANKCARD, amount=D('10.00'),
+            pnref=next(pnrefs), result='0', raw_request=RAW_REQUEST, raw_response=RAW_RESPONSE,
+            response_time=120.0),)
+
+    measure(PayflowTransaction.save, setup=create_txn, max_queries=1)
+    txn = PayflowTransaction.objects.first()
+    assert 'secret123' not in txn.raw_request
+    assert '4111111111111111' not in txn.raw_request
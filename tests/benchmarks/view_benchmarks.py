@@ -0,0 +1,57 @@
+from decimal import Decimal as D
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+import requests
+from django.core.management import call_command
+from django.test import RequestFactory
+from django.urls import reverse
+from oscar.apps.shipping.methods import FixedPrice, Free
+from oscar.core.loading import get_class, get_model
+from oscar.test.factories import create_product
+
+from paypal.express import gateway
+from paypal.express.views import ShippingOptionsView
+
+pytest.importorskip('pytest_benchmark')
+
+Basket = get_model('basket', 'Basket')
+Selector = get_class('partner.strategy', 'Selector')
+
+
+@pytest.mark.parametrize('num_methods', [1, 5, 20])
+def test_shipping_options_response(measure, create_basket, num_methods):
+    view = ShippingOptionsView()
+    view.request = RequestFactory().post('/', {'CURRENCYCODE': 'GBP'})
+    methods = [Free()] + [FixedPrice(D(index), D(index) * D('1.2')) for index in range(1, num_methods)]
+    response = measure(view.render_to_response, methods, create_basket(1))
+    assert response.status_code == 200
+
+
+@pytest.fixture
+def paypal_token(stub_settings):
+    """
+    Return the query string PayPal redirects the buyer back with, once they
+    have approved the transaction of a frozen basket, and the basket's id.
+    """
+    call_command('loaddata', 'countries.json', verbosity=0)
+    basket = Basket.objects.create()
+    basket.strategy = Selector().strategy()
+    basket.add_product(create_product(price=D('10.00'), num_in_stock=10))
+    basket.freeze()
+    url = gateway.set_txn(
+        basket, [Free()], 'GBP', 'http://testserver/success', 'http://testserver/cancel')
+    response = requests.get(url, allow_redirects=False)
+    return urlsplit(response.headers['Location']).query, basket.id
+
+
+@pytest.mark.django_db
+def test_success_response_preview(measure, client, paypal_token):
+    query, basket_id = paypal_token
+    url = '%s?%s' % (reverse('paypal-success-response', kwargs={'basket_id': basket_id}), query)
+
+    # The first request warms up the caches and the connection to the stub
+    assert client.get(url).status_code == 200
+    response = measure(client.get, url, max_queries=20)
+    assert response.status_code == 200
+    assert response.context['payer_id'] == dict(parse_qsl(query))['PayerID']
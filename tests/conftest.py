@@ -1,8 +1,20 @@
 import os
 
 import django
+import pytest
+from django.core.cache import caches
 
 
 def pytest_configure(config):
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
     django.setup()
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Idempotency records and circuit breaker state are kept in the cache
+    for cache in caches.all():
+        cache.clear()
+    # Countries rolled back at the end of a test don't send post_delete
+    from paypal import addresses
+    addresses.clear_countries()
@@ -0,0 +1,56 @@
+from django.test import TestCase, override_settings
+from oscar.core.loading import get_model
+
+from paypal import addresses
+
+Country = get_model('address', 'Country')
+
+
+class CountryTableTests(TestCase):
+    fixtures = ['countries.json']
+
+    def test_countries_are_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual('GB', addresses.get_country('GB').pk)
+            self.assertEqual('GB', addresses.get_country('gb').iso_3166_1_a2)
+            with self.assertRaises(Country.DoesNotExist):
+                addresses.get_country('XX')
+            with self.assertRaises(Country.DoesNotExist):
+                addresses.get_country(None)
+
+    def test_saving_a_country_refreshes_the_table(self):
+        addresses.get_country('GB')
+        Country.objects.create(iso_3166_1_a2='XX', name='Nowhere', printable_name='Nowhere')
+        self.assertEqual('Nowhere', addresses.get_country('XX').name)
+
+    def test_deleting_a_country_refreshes_the_table(self):
+        addresses.get_country('GB')
+        Country.objects.filter(iso_3166_1_a2='GB').get().delete()
+        with self.assertRaises(Country.DoesNotExist):
+            addresses.get_country('GB')
+
+    def test_table_expires(self):
+        addresses.get_country('GB')
+        with override_settings(PAYPAL_COUNTRY_TABLE_TTL=-1):
+            with self.assertNumQueries(1):
+                addresses.get_country('GB')
+
+    def test_instances_are_not_shared(self):
+        country = addresses.get_country('GB')
+        country.name = 'Changed'
+        self.assertNotEqual('Changed', addresses.get_country('GB').name)
+
+
+class NormalizeStateTests(TestCase):
+
+    def test_us_states_become_codes(self):
+        self.assertEqual('CA', addresses.normalize_state('US', 'California'))
+        self.assertEqual('NY', addresses.normalize_state('US', ' new   york '))
+        self.assertEqual('TX', addresses.normalize_state('US', 'tx'))
+
+    def test_unknown_states_are_kept(self):
+        self.assertEqual('Nowhere', addresses.normalize_state('US', 'Nowhere'))
+        self.assertEqual('', addresses.normalize_state('US', ''))
+
+    def test_other_countries_are_kept(self):
+        self.assertEqual('California', addresses.normalize_state('GB', 'California'))
@@ -0,0 +1,84 @@
+import datetime
+import json
+
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from paypal import analytics
+from paypal.express.dashboard.views import ResponseTimeView
+from paypal.express.models import ExpressTransaction
+from paypal.models import ResponseTimeRollup
+from paypal.payflow.models import PayflowTransaction
+
+
+class ResponseTimeStatsTests(TestCase):
+
+    def setUp(self):
+        # 100 calls taking 1 to 100ms, every tenth one failing
+        for i in range(1, 101):
+            ExpressTransaction.objects.create(
+                method='SetExpressCheckout', ack='Failure' if i % 10 == 0 else 'Success',
+                raw_request='', raw_response='', response_time=i)
+        ExpressTransaction.objects.create(
+            method='DoExpressCheckoutPayment', ack='Success', raw_request='', raw_response='', response_time=400)
+        self.end = timezone.now() + datetime.timedelta(minutes=1)
+        self.start = self.end - datetime.timedelta(days=1)
+
+    def get_stats(self, **kwargs):
+        stats = analytics.get_response_time_stats(analytics.EXPRESS, self.start, self.end, **kwargs)
+        return {row['method']: row for row in stats}
+
+    def test_stats_per_method(self):
+        stats = self.get_stats(period=analytics.DAY)
+        set_txn = stats['SetExpressCheckout']
+        self.assertEqual(100, set_txn['count'])
+        self.assertEqual(0.1, set_txn['error_rate'])
+        self.assertAlmostEqual(50.5, set_txn['mean'])
+        self.assertAlmostEqual(50, set_txn['p50'], delta=5)
+        self.assertAlmostEqual(90, set_txn['p90'], delta=10)
+        self.assertEqual(1, stats['DoExpressCheckoutPayment']['count'])
+        self.assertAlmostEqual(400, stats['DoExpressCheckoutPayment']['p99'], delta=5)
+
+    def test_rollups_give_the_same_stats(self):
+        analytics.update_rollups(analytics.EXPRESS, until=self.end)
+        self.assertEqual(self.get_stats(period=analytics.DAY), self.get_stats(period=analytics.DAY, use_rollups=True))
+
+    def test_rollups_are_updated_incrementally(self):
+        analytics.update_rollups(analytics.EXPRESS, until=self.end)
+        ExpressTransaction.objects.create(
+            method='DoExpressCheckoutPayment', ack='Success', raw_request='', raw_response='', response_time=10)
+        analytics.update_rollups(analytics.EXPRESS, until=self.end)
+        stats = self.get_stats(period=analytics.DAY, use_rollups=True)
+        self.assertEqual(2, stats['DoExpressCheckoutPayment']['count'])
+        self.assertEqual(2, ResponseTimeRollup.objects.count())
+
+    def test_json_endpoint(self):
+        request = RequestFactory().get('/', {'format': 'json', 'period': 'day'})
+        response = ResponseTimeView.as_view()(request)
+        stats = json.loads(response.content.decode('utf-8'))['stats']
+        self.assertEqual({'SetExpressCheckout', 'DoExpressCheckoutPayment'}, {row['method'] for row in stats})
+
+
+class PayflowResponseTimeStatsTests(TestCase):
+
+    def test_transactions_under_fraud_review_are_not_errors(self):
+        for pnref, result in (('V19A3D27B61E', '0'), ('V19A3D27B61F', '126'), ('V19A3D27B61G', '12')):
+            PayflowTransaction.objects.create(
+                comment1='1234', trxtype='A', pnref=pnref, result=result, raw_request='', raw_response='',
+                response_time=100)
+        end = timezone.now() + datetime.timedelta(minutes=1)
+        stats = analytics.get_response_time_stats(
+            analytics.PAYFLOW, end - datetime.timedelta(days=1), end, period=analytics.DAY)
+        self.assertEqual(3, stats[0]['count'])
+        self.assertAlmostEqual(1 / 3, stats[0]['error_rate'])
+
+
+class PercentileTests(TestCase):
+
+    def test_interpolates_within_bin(self):
+        histogram = [0] * (len(analytics.BIN_EDGES) + 1)
+        histogram[1] = 10  # 25-50ms
+        self.assertEqual(37.5, analytics.percentile(histogram, 0.5))
+
+    def test_empty_histogram(self):
+        self.assertIsNone(analytics.percentile([0] * (len(analytics.BIN_EDGES) + 1), 0.5))
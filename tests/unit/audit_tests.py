@@ -0,0 +1,187 @@
+import os
+import shutil
+import tempfile
+from decimal import Decimal as D
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+
+from paypal import audit
+from paypal.payflow import gateway
+from paypal.payflow.models import PayflowTransaction
+
+RESPONSE = {
+    'RESULT': '0',
+    'PNREF': 'V25A2BB645A7',
+    'RESPMSG': 'Approved',
+    'AUTHCODE': '525PNI',
+    '_raw_request': 'PWD=secret&ACCT=4111111111111111&CVV2=123&',
+    '_raw_response': '',
+    '_response_time': 1000
+}
+
+
+def authorize():
+    with patch('paypal.gateway.post', return_value=dict(RESPONSE)):
+        return gateway.authorize(
+            order_number='1234', card_number='4111111111111111', cvv='123', expiry_date='1214', amt=D('10.00'))
+
+
+def void(pnref='V25A2BB645A7'):
+    with patch('paypal.gateway.post', return_value=dict(RESPONSE, PNREF=pnref)):
+        return gateway.void(order_number='1234', pnref='V25A2BB645A7')
+
+
+# The flusher thread is disabled so that tests control when rows are written
+@patch('paypal.audit.AuditBuffer._ensure_flusher')
+class WriteBehindTests(TestCase):
+
+    def setUp(self):
+        buffer_patcher = patch('paypal.audit.buffer', audit.AuditBuffer())
+        self.buffer = buffer_patcher.start()
+        self.addCleanup(buffer_patcher.stop)
+
+    def test_rows_are_saved_immediately_by_default(self, _):
+        txn = void()
+        self.assertIsNotNone(txn.pk)
+        self.assertEqual(1, PayflowTransaction.objects.count())
+
+    @override_settings(PAYPAL_AUDIT_WRITE_BEHIND=True)
+    def test_rows_are_queued_until_flushed(self, _):
+        txn = void()
+        self.assertIsNone(txn.pk)
+        self.assertEqual(0, PayflowTransaction.objects.count())
+
+        self.assertEqual(1, audit.flush())
+        saved = PayflowTransaction.objects.get()
+        self.assertEqual('V25A2BB645A7', saved.pnref)
+        self.assertNotIn('secret', saved.raw_request)
+        self.assertNotIn('4111111111111111', saved.raw_request)
+
+    @override_settings(PAYPAL_AUDIT_WRITE_BEHIND=True)
+    def test_rows_looked_up_later_are_saved_immediately(self, _):
+        # Captures look the authorization up by order number
+        txn = authorize()
+        self.assertIsNotNone(txn.pk)
+        self.assertEqual([], self.buffer.pending)
+
+    @override_settings(PAYPAL_AUDIT_WRITE_BEHIND=True, PAYPAL_AUDIT_BATCH_SIZE=2)
+    def test_flusher_is_woken_when_batch_is_full(self, _):
+        void()
+        self.assertFalse(self.buffer.wakeup.is_set())
+        void()
+        self.assertTrue(self.buffer.wakeup.is_set())
+
+    @override_settings(PAYPAL_AUDIT_WRITE_BEHIND=True)
+    def test_rows_stay_queued_when_write_fails(self, _):
+        void()
+        with patch('paypal.audit._bulk_create', side_effect=OperationalError("Database unavailable")) as bulk_create:
+            self.assertEqual(0, audit.flush())
+        # The rows aren't tried one by one once the database is known to be down
+        self.assertEqual(2, bulk_create.call_count)
+        self.assertEqual({}, self.buffer.attempts)
+        self.assertEqual(1, audit.flush())
+
+    @override_settings(PAYPAL_AUDIT_WRITE_BEHIND=True, PAYPAL_AUDIT_MAX_ATTEMPTS=2)
+    def test_row_which_fails_is_dropped_after_max_attempts(self, _):
+        void()
+        void(pnref='V25A2BB645A8')
+        void(pnref='V25A2BB645A9')
+        # The second row clashes with the first one's audit_id
+        self.buffer.pending[1].audit_id = self.buffer.pending[0].audit_id
+
+        with self.assertLogs('paypal.audit', 'ERROR'):
+            self.assertEqual(2, audit.flush())
+        self.assertEqual(['V25A2BB645A7', 'V25A2BB645A9'],
+                         sorted(PayflowTransaction.objects.values_list('pnref', flat=True)))
+        self.assertEqual(1, len(self.buffer.pending))
+
+        with self.assertLogs('paypal.audit', 'ERROR') as logs:
+            self.assertEqual(0, audit.flush())
+        self.assertIn('Dropping PayPal audit row', logs.output[-1])
+        self.assertEqual([], self.buffer.pending)
+        self.assertEqual({}, self.buffer.attempts)
+        self.assertEqual(2, PayflowTransaction.objects.count())
+
+    @override_settings(PAYPAL_AUDIT_WRITE_BEHIND=True)
+    def test_immediate_saves_synchronously(self, _):
+        with audit.immediate():
+            txn = void()
+        self.assertIsNotNone(txn.pk)
+        self.assertTrue(audit.write_behind_enabled())
+
+
+@patch('paypal.audit.AuditBuffer._ensure_flusher')
+class SpoolTests(TestCase):
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+        buffer_patcher = patch('paypal.audit.buffer', audit.AuditBuffer())
+        self.buffer = buffer_patcher.start()
+        self.addCleanup(buffer_patcher.stop)
+        settings = self.settings(PAYPAL_AUDIT_WRITE_BEHIND=True, PAYPAL_AUDIT_SPOOL_DIR=self.spool_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def replay(self):
+        with patch('paypal.audit._process_is_running', return_value=False):
+            call_command('paypal_replay_audit_spool', stdout=open(os.devnull, 'w'))
+
+    def orphan_spool(self, pid=999999):
+        """
+        Move the spool to the name a crashed process would have left it under.
+        """
+        path = os.path.join(self.spool_dir, 'paypal-audit-%s-0123456789abcdef.jsonl' % pid)
+        os.rename(self.buffer.get_spool_path(), path)
+        self.buffer.pending = []
+        return path
+
+    def test_queued_rows_are_spooled_and_removed_on_flush(self, _):
+        void()
+        spool_path = self.buffer.get_spool_path()
+        with open(spool_path) as spool:
+            self.assertEqual(1, len(spool.readlines()))
+        audit.flush()
+        self.assertFalse(os.path.exists(spool_path))
+
+    def test_spool_of_dead_process_is_replayed(self, _):
+        void()
+        path = self.orphan_spool()
+        with open(path, 'a') as spool:
+            spool.write('[{"model": "payflow.payflowtrans')
+
+        self.replay()
+
+        self.assertEqual('V25A2BB645A7', PayflowTransaction.objects.get().pnref)
+        self.assertEqual([], os.listdir(self.spool_dir))
+
+    def test_spool_of_process_with_reused_pid_is_kept(self, _):
+        # A process which crashed had the PID this one now has
+        void()
+        path = self.orphan_spool(pid=os.getpid())
+        void(pnref='V25A2BB645A8')
+        audit.flush()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(1, PayflowTransaction.objects.count())
+
+        self.replay()
+        self.assertEqual(2, PayflowTransaction.objects.count())
+        self.assertEqual([], os.listdir(self.spool_dir))
+
+    def test_replay_skips_rows_already_written(self, _):
+        # The process died after writing its rows but before rewriting its
+        # spool
+        void()
+        void(pnref='V25A2BB645A8')
+        with open(self.buffer.get_spool_path()) as spool:
+            lines = spool.readlines()
+        audit.flush()
+        path = os.path.join(self.spool_dir, 'paypal-audit-999999-0123456789abcdef.jsonl')
+        with open(path, 'w') as spool:
+            spool.writelines(lines)
+
+        self.replay()
+        self.assertEqual(2, PayflowTransaction.objects.count())
@@ -0,0 +1,88 @@
+import io
+import threading
+import time
+from unittest.mock import patch
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from paypal import bulk
+
+
+class RunBulkOperationTests(TestCase):
+
+    def test_returns_a_result_per_reference(self):
+        with patch('paypal.express_checkout.facade.capture_order', side_effect=lambda token: token.upper()):
+            results = list(bulk.run_bulk_operation('express_checkout', 'capture', ['a', 'b', 'c'], max_workers=2))
+
+        self.assertEqual({'A', 'B', 'C'}, {result.result for result in results})
+        self.assertTrue(all(result.success for result in results))
+
+    def test_errors_are_reported_per_item(self):
+        def capture(token):
+            if token == 'bad':
+                raise ValueError("Order not found")
+            return token
+
+        with patch('paypal.express_checkout.facade.capture_order', side_effect=capture):
+            results = {
+                result.reference: result
+                for result in bulk.run_bulk_operation('express_checkout', 'capture', ['good', 'bad'])}
+
+        self.assertTrue(results['good'].success)
+        self.assertFalse(results['bad'].success)
+        self.assertEqual("Order not found", results['bad'].error)
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'max_running': 0}
+
+        def capture(token):
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+
+        with patch('paypal.express_checkout.facade.capture_order', side_effect=capture):
+            list(bulk.run_bulk_operation('express_checkout', 'capture', map(str, range(30)), max_workers=3))
+
+        self.assertEqual(3, state['max_running'])
+
+    def test_invalid_operation(self):
+        with self.assertRaises(ImproperlyConfigured):
+            list(bulk.run_bulk_operation('payflow', 'explode', ['1']))
+
+
+class RateLimiterTests(TestCase):
+
+    def test_calls_are_spaced(self):
+        limiter = bulk.RateLimiter(rate=100)
+        start_time = time.monotonic()
+        for __ in range(5):
+            limiter.wait()
+        self.assertTrue(time.monotonic() - start_time >= 0.04)
+
+
+class CommandTests(TestCase):
+
+    def test_report_is_written(self):
+        stdout = io.StringIO()
+        with patch('paypal.express_checkout.facade.refund_order', side_effect=lambda token: 'refunded'):
+            with patch('sys.stdin', io.StringIO('4MW805572N795704B\n\n')):
+                call_command(
+                    'paypal_bulk_operation', 'express_checkout', 'refund', stdout=stdout, stderr=io.StringIO())
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual('reference,success,result,error,duration', lines[0])
+        self.assertTrue(lines[1].startswith('4MW805572N795704B,1,refunded,,'))
+
+    def test_failures_raise_command_error(self):
+        with patch('paypal.express_checkout.facade.refund_order', side_effect=ValueError("Declined")):
+            with patch('sys.stdin', io.StringIO('4MW805572N795704B\n')):
+                with self.assertRaises(CommandError):
+                    call_command('paypal_bulk_operation', 'express_checkout', 'refund',
+                                 stdout=io.StringIO(), stderr=io.StringIO())
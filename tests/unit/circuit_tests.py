@@ -0,0 +1,128 @@
+from unittest import mock
+
+import requests
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from oscar.test.factories import create_product
+
+from paypal import circuit, exceptions, gateway
+
+
+def create_mock_response(status_code=200):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.text = 'ACK=Success'
+    return response
+
+
+@override_settings(
+    PAYPAL_CIRCUIT_BREAKER=True, PAYPAL_CIRCUIT_MINIMUM_CALLS=4, PAYPAL_CIRCUIT_FAILURE_RATE=0.5,
+    PAYPAL_CIRCUIT_SLOW_CALL_DURATION=1.0, PAYPAL_CIRCUIT_SLOW_CALL_RATE=0.5, PAYPAL_CIRCUIT_RESET_TIMEOUT=30)
+class CircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.now = 1000.0
+        patcher = mock.patch('paypal.circuit.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, *outcomes, duration=0.1):
+        breaker = circuit.get_breaker('express')
+        for success in outcomes:
+            breaker.record(success, duration)
+        return breaker
+
+    def test_breakers_are_disabled_by_default(self):
+        with self.settings(PAYPAL_CIRCUIT_BREAKER=False):
+            self.assertIsNone(circuit.get_breaker('express'))
+
+    def test_stays_closed_below_minimum_calls(self):
+        breaker = self.record(False, False, False)
+        self.assertEqual(circuit.CLOSED, breaker.get_state())
+
+    def test_stays_closed_below_failure_rate(self):
+        breaker = self.record(True, True, False, True, True)
+        self.assertEqual(circuit.CLOSED, breaker.get_state())
+
+    def test_opens_on_failure_rate(self):
+        breaker = self.record(True, False, True, False)
+        self.assertEqual(circuit.OPEN, breaker.get_state())
+        self.assertEqual(circuit.CLOSED, circuit.get_breaker('payflow').get_state())
+
+    def test_opens_on_slow_call_rate(self):
+        breaker = self.record(True, True, True, True, duration=2.0)
+        self.assertEqual(circuit.OPEN, breaker.get_state())
+
+    def test_counts_are_per_window(self):
+        self.record(False, False, True)
+        self.now += 60
+        breaker = self.record(False)
+        self.assertEqual(circuit.CLOSED, breaker.get_state())
+
+    def test_open_breaker_fails_fast(self):
+        self.record(False, False, False, False)
+        with mock.patch('requests.Session.post') as post:
+            with self.assertRaises(circuit.CircuitOpen):
+                gateway.post('http://example.com', {}, integration='express')
+        self.assertFalse(post.called)
+
+    def test_half_opens_after_reset_timeout(self):
+        breaker = self.record(False, False, False, False)
+        self.now += 30
+        self.assertEqual(circuit.HALF_OPEN, breaker.get_state())
+        self.assertTrue(breaker.before_call())
+        # A single probe at a time
+        with self.assertRaises(circuit.CircuitOpen):
+            breaker.before_call()
+
+    def test_successful_probe_closes(self):
+        self.record(False, False, False, False)
+        self.now += 30
+        with mock.patch('requests.Session.post', return_value=create_mock_response()):
+            gateway.post('http://example.com', {}, integration='express')
+        breaker = circuit.get_breaker('express')
+        self.assertEqual(circuit.CLOSED, breaker.get_state())
+        self.assertFalse(breaker.before_call())
+
+    def test_failed_probe_reopens(self):
+        self.record(False, False, False, False)
+        self.now += 30
+        with mock.patch('requests.Session.post', side_effect=requests.ConnectionError()):
+            with self.assertRaises(gateway.ConnectionFailed):
+                gateway.post('http://example.com', {}, integration='express')
+        breaker = circuit.get_breaker('express')
+        self.assertEqual(circuit.OPEN, breaker.get_state())
+        self.now += 30
+        self.assertTrue(breaker.before_call())
+
+    def test_server_errors_count_as_failures(self):
+        with mock.patch('requests.Session.post', return_value=create_mock_response(503)):
+            for __ in range(4):
+                with self.assertRaises(exceptions.PayPalError):
+                    gateway.post('http://example.com', {}, integration='express')
+        self.assertEqual(circuit.OPEN, circuit.get_breaker('express').get_state())
+
+    def test_redirect_view_returns_to_basket(self):
+        self.record(False, False, False, False)
+        product = create_product(num_in_stock=1)
+        self.client.post(reverse('basket:add', kwargs={'pk': product.pk}), {'quantity': 1})
+        with mock.patch('requests.Session.post') as post:
+            response = self.client.get(reverse('paypal-redirect'), follow=True)
+        self.assertFalse(post.called)
+        self.assertEqual(reverse('basket:summary'), response.redirect_chain[-1][0])
+        self.assertContains(response, "PayPal is currently unavailable")
+
+    def test_express_checkout_redirect_view_returns_to_basket(self):
+        breaker = circuit.get_breaker('express_checkout')
+        for __ in range(4):
+            breaker.record(False, 0.1)
+        product = create_product(num_in_stock=1)
+        self.client.post(reverse('basket:add', kwargs={'pk': product.pk}), {'quantity': 1})
+        with mock.patch('requests.Session.request') as request:
+            response = self.client.get(reverse('express-checkout-redirect'), follow=True)
+        self.assertFalse(request.called)
+        self.assertEqual(reverse('basket:summary'), response.redirect_chain[-1][0])
+        self.assertContains(response, "PayPal is currently unavailable")
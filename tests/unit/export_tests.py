@@ -0,0 +1,67 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from decimal import Decimal as D
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
+
+from paypal import export
+from paypal.express_checkout.dashboard.views import TransactionExportView
+from paypal.express_checkout.models import ExpressCheckoutTransaction as Transaction
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        for i, status in enumerate([Transaction.COMPLETED, Transaction.VOIDED, Transaction.COMPLETED]):
+            Transaction.objects.create(
+                order_id='ORDER%d' % i, amount=D('10.00') + i, currency='GBP', status=status,
+                intent=Transaction.CAPTURE)
+
+    def read_csv(self, chunks):
+        return list(csv.DictReader(io.StringIO(''.join(chunks))))
+
+    def test_csv_export(self):
+        rows = self.read_csv(export.iter_export('express_checkout'))
+        self.assertEqual(['ORDER0', 'ORDER1', 'ORDER2'], [row['order_id'] for row in rows])
+        self.assertEqual('11.00', rows[1]['amount'])
+        self.assertNotIn('address', rows[0])
+
+    def test_jsonl_export(self):
+        lines = ''.join(export.iter_export('express_checkout', export.JSONL)).splitlines()
+        self.assertEqual('ORDER0', json.loads(lines[0])['order_id'])
+        self.assertEqual(3, len(lines))
+
+    def test_filters(self):
+        rows = self.read_csv(export.iter_export('express_checkout', filters={'status': Transaction.COMPLETED}))
+        self.assertEqual(['ORDER0', 'ORDER2'], [row['order_id'] for row in rows])
+
+    def test_invalid_filters(self):
+        with self.assertRaises(ValidationError):
+            export.iter_export('express_checkout', filters={'amount_min': 'lots'})
+
+    def test_gzip(self):
+        data = b''.join(export.iter_export('express_checkout', gzip=True))
+        rows = self.read_csv([gzip.decompress(data).decode('utf-8')])
+        self.assertEqual(3, len(rows))
+
+    def test_view_streams_response(self):
+        request = RequestFactory().get('/', {'status': Transaction.VOIDED})
+        response = TransactionExportView.as_view()(request)
+        self.assertTrue(response.streaming)
+        self.assertIn('paypal-express-checkout-transactions.csv', response['Content-Disposition'])
+        rows = self.read_csv(chunk.decode('utf-8') for chunk in response.streaming_content)
+        self.assertEqual(['ORDER1'], [row['order_id'] for row in rows])
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'export.jsonl.gz')
+            call_command('paypal_export_transactions', 'express_checkout', '--format', 'jsonl', '--gzip',
+                         '--filter', 'amount_min=11', '--output', path)
+            with gzip.open(path, 'rt') as f:
+                self.assertEqual(['ORDER1', 'ORDER2'], [json.loads(line)['order_id'] for line in f])
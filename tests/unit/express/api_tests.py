@@ -1,7 +1,10 @@
 from decimal import Decimal as D
 from unittest.mock import Mock, patch
 
-from django.test import TestCase
+import httpx
+from asgiref.sync import async_to_sync
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
 from oscar.apps.shipping.methods import FixedPrice, Free
 
 from paypal import exceptions
@@ -45,7 +48,7 @@ class ErrorResponseTests(MockedResponseTestCase):
             '&L_LONGMESSAGE0=Security%20header%20is%20not%20valid&L_SEVERITYCODE0=Error')
         response = self.create_mock_response(response_body)
 
-        with patch('requests.post') as post:
+        with patch('requests.Session.post') as post:
             post.return_value = response
             with self.assertRaises(exceptions.PayPalError):
                 gateway.set_txn(self.basket, self.methods, 'GBP', 'http://localhost:8000/success',
@@ -54,7 +57,7 @@ class ErrorResponseTests(MockedResponseTestCase):
     def test_non_200_response_raises_exception(self):
         response = self.create_mock_response(body='', status_code=500)
 
-        with patch('requests.post') as post:
+        with patch('requests.Session.post') as post:
             post.return_value = response
             with self.assertRaises(exceptions.PayPalError):
                 gateway.set_txn(self.basket, self.methods, 'GBP', 'http://localhost:8000/success',
@@ -70,7 +73,7 @@ class SuccessResponseTests(MockedResponseTestCase):
             '&ACK=Success&VERSION=60%2e0&BUILD=2649250')
         response = self.create_mock_response(response_body)
 
-        with patch('requests.post') as post:
+        with patch('requests.Session.post') as post:
             post.return_value = response
             self.url = gateway.set_txn(self.basket, self.methods, 'GBP',
                                        'http://localhost:8000/success',
@@ -87,6 +90,22 @@ class SuccessResponseTests(MockedResponseTestCase):
         self.assertEqual('EC-6469953681606921P', txn.token)
 
 
+class DoExpressCheckoutResponseTests(MockedResponseTestCase):
+
+    def test_transaction_id_is_saved(self):
+        response_body = (
+            'TOKEN=EC%2d6469953681606921P&CORRELATIONID=50a8d895e928f&ACK=Success&VERSION=60%2e0'
+            '&PAYMENTINFO_0_TRANSACTIONID=8RD12345AB123456C&PAYMENTINFO_0_AMT=10%2e00'
+            '&PAYMENTINFO_0_CURRENCYCODE=GBP')
+
+        with patch('requests.Session.post') as post:
+            post.return_value = self.create_mock_response(response_body)
+            txn = gateway.do_txn('PAYERID', 'EC-6469953681606921P', D('10.00'), 'GBP')
+
+        self.assertEqual('8RD12345AB123456C', txn.transaction_id)
+        self.assertEqual('8RD12345AB123456C', txn.response_data['PAYMENTINFO_0_TRANSACTIONID'])
+
+
 class TestOrderTotal(TestCase):
 
     def test_includes_default_shipping_charge(self):
@@ -110,3 +129,79 @@ class TestOrderTotal(TestCase):
             with self.assertRaises(InvalidBasket):
                 gateway.set_txn(basket, shipping_methods, 'GBP',
                                 'http://example.com', 'http://example.com')
+
+
+class TestShippingAddress(TestCase):
+
+    def test_us_states_are_sent_as_codes(self):
+        address = Mock(state='California ', country=Mock(iso_3166_1_a2='US'))
+        with patch('paypal.express.gateway._fetch_response') as mock_fetch:
+            gateway.set_txn(create_mock_basket(), [Free()], 'GBP', 'http://example.com', 'http://example.com',
+                            shipping_method=Free(), shipping_address=address)
+            args, __ = mock_fetch.call_args
+        self.assertEqual('CA', args[1]['SHIPTOSTATE'])
+
+
+class SetTxnParamsTests(TestCase):
+
+    def get_params(self, basket=None, **kwargs):
+        return gateway._get_set_txn_params(
+            basket or create_mock_basket(), [Free()], 'GBP', 'http://example.com', 'http://example.com', **kwargs)
+
+    def test_settings_changes_are_picked_up(self):
+        self.assertEqual(1, self.get_params()['ALLOWNOTE'])
+        self.assertNotIn('BRANDNAME', self.get_params())
+        with override_settings(PAYPAL_ALLOW_NOTE=False, PAYPAL_BRAND_NAME='Oscar'):
+            params = self.get_params()
+            self.assertEqual(0, params['ALLOWNOTE'])
+            self.assertEqual('Oscar', params['BRANDNAME'])
+        self.assertNotIn('BRANDNAME', self.get_params())
+
+    def test_paypal_params_override_settings(self):
+        with override_settings(PAYPAL_LOCALE='XX', PAYPAL_BRAND_NAME='Oscar'):
+            with self.assertRaises(ImproperlyConfigured):
+                self.get_params()
+            params = self.get_params(paypal_params={'LOCALECODE': 'GB', 'BRANDNAME': None, 'ALLOWNOTE': False})
+        self.assertEqual('GB', params['LOCALECODE'])
+        self.assertNotIn('BRANDNAME', params)
+        self.assertEqual(0, params['ALLOWNOTE'])
+
+    def test_product_descriptions_are_formatted_once_per_modification(self):
+        product = Mock(pk=1, date_updated=1, description='<p>A long description</p>',
+                       upc='', is_shipping_required=True)
+        product.get_title.return_value = 'Product'
+        basket = create_mock_basket()
+        basket.all_lines.return_value = [Mock(product=product, unit_price_incl_tax=D('10.00'), quantity=1)]
+        with patch.dict(gateway._descriptions, clear=True), \
+                patch('paypal.express.gateway._format_description', side_effect=lambda desc: desc.upper()) as format:
+            self.assertEqual('<P>A LONG DESCRIPTION</P>', self.get_params(basket)['L_PAYMENTREQUEST_0_DESC0'])
+            self.get_params(basket)
+            self.assertEqual(1, format.call_count)
+            product.date_updated = 2
+            product.description = 'Changed'
+            self.assertEqual('CHANGED', self.get_params(basket)['L_PAYMENTREQUEST_0_DESC0'])
+
+
+class AsyncGatewayTests(MockedResponseTestCase):
+
+    def run_with_response(self, coroutine_function, body, *args, **kwargs):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, text=body)))
+        with patch('paypal.gateway.get_async_client', return_value=client):
+            return async_to_sync(coroutine_function)(*args, **kwargs)
+
+    def test_set_txn_returns_url(self):
+        url = self.run_with_response(
+            gateway.async_set_txn,
+            'TOKEN=EC%2d6469953681606921P&CORRELATIONID=50a8d895e928f&ACK=Success&VERSION=60%2e0',
+            self.basket, self.methods, 'GBP', 'http://localhost:8000/success', 'http://localhost:8000/error')
+        self.assertTrue(url.startswith('https://www.sandbox.paypal.com'))
+        self.assertTrue('EC-6469953681606921P' in url)
+
+    def test_error_response_raises_exception(self):
+        with self.assertRaises(exceptions.PayPalError):
+            self.run_with_response(
+                gateway.async_get_txn,
+                'CORRELATIONID=3bea2076bb9c3&ACK=Failure&L_ERRORCODE0=10002'
+                '&L_LONGMESSAGE0=Security%20header%20is%20not%20valid',
+                'EC-6469953681606921P')
+        self.assertEqual('10002', Transaction.objects.get().error_code)
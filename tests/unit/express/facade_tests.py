@@ -1,13 +1,18 @@
+import io
 from decimal import Decimal as D
 from unittest import TestCase
 from unittest.mock import Mock, patch
 from urllib.parse import parse_qs
 
 import pytest
+from django.core.cache import cache
+from django.core.management import call_command
 from oscar.apps.shipping.methods import Free
 from purl import URL
 
-from paypal.express.facade import fetch_transaction_details, get_paypal_url
+from paypal.express.facade import (
+    capture_authorization, fetch_transaction_details, get_paypal_url, recall_transaction_details, refund_transaction,
+    remember_transaction_details, void_authorization)
 from paypal.models import ExpressTransaction as Transaction
 
 
@@ -20,7 +25,7 @@ class MockedResponseTests(TestCase):
         response = Mock()
         response.text = self.response_body
         response.status_code = 200
-        with patch('requests.post') as post:
+        with patch('requests.Session.post') as post:
             post.return_value = response
             self.perform_action()
             self.mocked_post = post
@@ -171,3 +176,60 @@ class SuccessfulGetExpressCheckoutTests(MockedResponseTests):
         ]
         for k, v in values:
             self.assertEqual(v, ctx[k])
+
+    def test_remembered_details(self):
+        remember_transaction_details(self.token, 1, 'PAYER', self.txn)
+        txn = recall_transaction_details(self.token, 1, 'PAYER')
+        for field in ('method', 'token', 'ack', 'amount', 'currency', 'correlation_id'):
+            self.assertEqual(getattr(self.txn, field), getattr(txn, field))
+        self.assertEqual(self.txn.context, txn.context)
+        self.assertIsNone(recall_transaction_details(self.token, 2, 'PAYER'))
+
+    def test_tampered_details_are_ignored(self):
+        remember_transaction_details(self.token, 1, 'PAYER', self.txn)
+        other_token = 'EC-8P797793UC466090M'
+        remember_transaction_details(other_token, 1, 'PAYER', self.txn)
+        # Swap in the entry of another token
+        cache.set('paypal:express:details:1:%s' % self.token, cache.get('paypal:express:details:1:%s' % other_token))
+        self.assertIsNone(recall_transaction_details(self.token, 1, 'PAYER'))
+
+
+@pytest.mark.django_db
+class FollowUpOperationTests(TestCase):
+    token = 'EC-6469953681606921P'
+    raw_response = 'ACK=Success&PAYMENTINFO_0_TRANSACTIONID=8RD12345AB123456C&PAYMENTINFO_0_AMT=33%2e98'
+
+    def tearDown(self):
+        Transaction.objects.all().delete()
+
+    def create_txn(self, **kwargs):
+        return Transaction.objects.create(
+            token=self.token, method='DoExpressCheckoutPayment', ack='Success', amount=D('33.98'),
+            currency='GBP', raw_request='', raw_response=self.raw_response, response_time=0, **kwargs)
+
+    def test_transaction_id_is_read_from_column(self):
+        self.create_txn(transaction_id='8RD12345AB123456C')
+        with patch('paypal.express.facade.do_capture') as do_capture, \
+                patch('paypal.base.parse_qsl') as parse_qsl:
+            capture_authorization(self.token)
+        do_capture.assert_called_once_with('8RD12345AB123456C', D('33.98'), 'GBP', note=None)
+        self.assertFalse(parse_qsl.called)
+
+    def test_transaction_id_falls_back_to_raw_response(self):
+        self.create_txn()
+        with patch('paypal.express.facade.do_void') as do_void:
+            void_authorization(self.token)
+        do_void.assert_called_once_with('8RD12345AB123456C', note=None)
+
+    def test_partial_refund(self):
+        self.create_txn(transaction_id='8RD12345AB123456C')
+        with patch('paypal.express.facade.refund_txn') as refund_txn:
+            refund_transaction(self.token, D('10.00'), 'GBP')
+        refund_txn.assert_called_once_with('8RD12345AB123456C', True, D('10.00'), 'GBP')
+
+    def test_backfill_command(self):
+        txn = self.create_txn()
+        call_command('paypal_backfill_response_fields', batch_size=1, stdout=io.StringIO())
+        txn.refresh_from_db()
+        self.assertEqual('8RD12345AB123456C', txn.response_data['PAYMENTINFO_0_TRANSACTIONID'])
+        self.assertEqual('8RD12345AB123456C', txn.transaction_id)
@@ -1,4 +1,7 @@
+from decimal import Decimal as D
 from unittest import TestCase
+from unittest.mock import patch
+from urllib.parse import parse_qsl
 
 import pytest
 
@@ -27,3 +30,59 @@ class TransactionTests(TestCase):
                                          ack='SuccessWithWarning',
                                          response_time=0)
         self.assertTrue(txn.is_successful)
+
+
+class ResponseParsingTests(TestCase):
+
+    def test_response_is_parsed_once(self):
+        txn = Transaction(raw_response='AMT=6%2e99&ACK=Success')
+        with patch('paypal.base.parse_qsl', wraps=parse_qsl) as mock_parse:
+            txn.value('AMT')
+            txn.value('ACK')
+            txn.context
+        self.assertEqual(1, mock_parse.call_count)
+
+    def test_cache_is_invalidated_when_response_changes(self):
+        txn = Transaction(raw_response='ACK=Failure')
+        self.assertEqual('Failure', txn.value('ACK'))
+        txn.raw_response = 'ACK=Success'
+        self.assertEqual('Success', txn.value('ACK'))
+
+    def test_stored_response_data_is_read_without_parsing(self):
+        txn = Transaction(raw_response='AMT=6%2e99&ACK=Success', response_data={'AMT': '6.99', 'ACK': 'Success'})
+        with patch('paypal.base.parse_qsl', wraps=parse_qsl) as mock_parse:
+            self.assertEqual('Success', txn.value('ACK'))
+            self.assertEqual(D('6.99'), txn.decimal('AMT'))
+        self.assertEqual(0, mock_parse.call_count)
+
+    def test_missing_response_is_parsed_as_empty(self):
+        txn = Transaction(raw_response=None)
+        self.assertEqual({}, txn.context)
+        self.assertIsNone(txn.value('ACK'))
+
+    def test_decimal_values(self):
+        txn = Transaction(raw_response='AMT=6%2e99&CURRENCYCODE=GBP')
+        self.assertEqual(D('6.99'), txn.decimal('AMT'))
+        self.assertIsNone(txn.decimal('CURRENCYCODE'))
+        self.assertEqual(D('0.00'), txn.decimal('SHIPPINGAMT', D('0.00')))
+
+    def test_indexed_values(self):
+        txn = Transaction(raw_response=(
+            'ACK=Failure&L_ERRORCODE0=10001&L_LONGMESSAGE0=Internal%20Error'
+            '&L_ERRORCODE1=10002&L_LONGMESSAGE1=Security%20error'))
+        self.assertEqual([
+            {'ERRORCODE': '10001', 'LONGMESSAGE': 'Internal Error'},
+            {'ERRORCODE': '10002', 'LONGMESSAGE': 'Security error'},
+        ], txn.indexed_values())
+
+    def test_indexed_values_are_grouped_by_prefix(self):
+        txn = Transaction(raw_response=(
+            'ACK=SuccessWithWarning&L_ERRORCODE0=11607&L_SEVERITYCODE0=Warning'
+            '&L_PAYMENTREQUEST_0_NAME0=Book&L_PAYMENTREQUEST_0_AMT0=9%2e99'
+            '&L_PAYMENTREQUEST_0_NAME1=Pen&L_PAYMENTREQUEST_0_AMT1=1%2e50'))
+        self.assertEqual([{'ERRORCODE': '11607', 'SEVERITYCODE': 'Warning'}], txn.indexed_values())
+        self.assertEqual([
+            {'NAME': 'Book', 'AMT': '9.99'},
+            {'NAME': 'Pen', 'AMT': '1.50'},
+        ], txn.indexed_values('PAYMENTREQUEST_0_'))
+        self.assertEqual([], txn.indexed_values('PAYMENTREQUEST_1_'))
@@ -1,17 +1,27 @@
 # -*- coding: utf-8 -*-
 from decimal import Decimal as D
 from unittest.mock import Mock, patch
+from urllib.parse import parse_qsl
 
+import requests
+from django.db import connection
 from django.test import TestCase, override_settings
 from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.encoding import force_text
 from oscar.apps.basket.models import Basket
 from oscar.apps.order.models import Order
-from oscar.core.loading import get_classes
+from oscar.apps.shipping.methods import Free
+from oscar.core.loading import get_class, get_classes
 from oscar.test.factories import create_product
 from purl import URL
 
+from paypal.express import gateway
+from paypal.express.views import Repository
+from tests.shipping.methods import SecondClassRecorded
+
+Selector = get_class('partner.strategy', 'Selector')
 Partner, StockRecord = get_classes('partner.models', ('Partner',
                                                       'StockRecord'))
 
@@ -29,7 +39,7 @@ class MockedPayPalTests(TestCase):
 
     def setUp(self):
         self.client = Client()
-        with patch('requests.post') as post:
+        with patch('requests.Session.post') as post:
             self.patch_http_post(post)
             self.perform_action()
 
@@ -93,6 +103,24 @@ class EdgeCaseTests(MockedPayPalTests):
                         URL.from_string(response['Location']).path()
                     )
 
+    @override_settings(PAYPAL_CHECKOUT_DEADLINE=0)
+    def test_passed_deadline_redirects_to_basket(self):
+        url = reverse('paypal-redirect')
+        self.add_product_to_basket()
+        with patch('requests.Session.post') as post:
+            response = self.client.get(url, follow=True)
+        self.assertFalse(post.called)
+        self.assertEqual(reverse('basket:summary'), response.redirect_chain[-1][0])
+        self.assertContains(response, "PayPal is taking too long to respond")
+
+    def test_timeout_redirects_to_basket(self):
+        url = reverse('paypal-redirect')
+        self.add_product_to_basket()
+        with patch('requests.Session.post', side_effect=requests.ReadTimeout()):
+            response = self.client.get(url, follow=True)
+        self.assertEqual(reverse('basket:summary'), response.redirect_chain[-1][0])
+        self.assertContains(response, "Unable to communicate with PayPal - please try again later")
+
 
 class RedirectToPayPalBase(MockedPayPalTests):
     response_body = 'TOKEN=EC%2d8P797793UC466090M&TIMESTAMP=2012%2d04%2d16T11%3a50%3a38Z&CORRELATIONID=bdd6641577803' \
@@ -197,6 +225,15 @@ class PreviewOrderTests(MockedPayPalTests):
             self.assertTrue(k in self.response.context, "%s not in context" % k)
 
 
+class PreviewWithoutShippingChargeTests(MockedPayPalTests):
+    response_body = PreviewOrderTests.response_body.replace('&PAYMENTREQUEST_0_SHIPPINGAMT=0%2e00', '')
+    perform_action = PreviewOrderTests.perform_action
+
+    def test_redirects_to_basket(self):
+        self.assertEqual(reverse('basket:summary'), self.response.redirect_chain[-1][0])
+        self.assertContains(self.response, "A problem occurred communicating with PayPal")
+
+
 class SubmitOrderBase(MockedPayPalTests):
     get_response = ''
     do_response = ''
@@ -268,6 +305,54 @@ class SubmitOrderTests(SubmitOrderBase):
         self.assertEqual('line2', self.order.shipping_address.line2)
 
 
+class PreviewThenSubmitOrderTests(MockedPayPalTests):
+    get_response = SubmitOrderTests.get_response
+    do_response = SubmitOrderTests.do_response
+
+    def setUp(self):
+        super().setUp()
+        self.add_product_to_basket(price=D('6.99'))
+        self.basket = Basket.objects.all()[0]
+        self.basket.freeze()
+        self.methods = []
+
+    def side_effect(self, url, payload, **kwargs):
+        if 'GetExpressCheckoutDetails' in payload:
+            self.methods.append('GetExpressCheckoutDetails')
+            return self.get_mock_response(self.get_response)
+        elif 'DoExpressCheckoutPayment' in payload:
+            self.methods.append('DoExpressCheckoutPayment')
+            return self.get_mock_response(self.do_response)
+
+    def preview_and_submit(self, payer_id='12345'):
+        url = URL().path(reverse('paypal-success-response', kwargs={'basket_id': self.basket.id})) \
+            .query_param('PayerID', '12345') \
+            .query_param('token', 'EC-8P797793UC466090M')
+        with patch('requests.Session.post', side_effect=self.side_effect):
+            self.client.get(str(url))
+            self.client.post(
+                reverse('paypal-place-order', kwargs={'basket_id': self.basket.id}),
+                {'action': 'place_order', 'payer_id': payer_id, 'token': 'EC-8P797793UC466090M'})
+        return Order.objects.get()
+
+    def test_details_fetched_for_the_preview_are_reused(self):
+        order = self.preview_and_submit()
+        self.assertEqual(['GetExpressCheckoutDetails', 'DoExpressCheckoutPayment'], self.methods)
+        self.assertEqual('david._1332854868_per@gmail.com', order.guest_email)
+        self.assertEqual('line2', order.shipping_address.line2)
+
+    def test_details_are_fetched_again_for_another_payer(self):
+        self.preview_and_submit(payer_id='67890')
+        self.assertEqual(
+            ['GetExpressCheckoutDetails', 'GetExpressCheckoutDetails', 'DoExpressCheckoutPayment'], self.methods)
+
+    def test_details_are_fetched_again_once_expired(self):
+        with override_settings(PAYPAL_TRANSACTION_DETAILS_TTL=-1):
+            self.preview_and_submit()
+        self.assertEqual(
+            ['GetExpressCheckoutDetails', 'GetExpressCheckoutDetails', 'DoExpressCheckoutPayment'], self.methods)
+
+
 @override_settings(PAYPAL_BUYER_PAYS_ON_PAYPAL=True)
 class BuyerPaysOnPaypalResponseTests(SubmitOrderBase):
     get_response = 'TOKEN=EC%2d7F151994RW7618524&BILLINGAGREEMENTACCEPTEDSTATUS=0&' \
@@ -389,3 +474,61 @@ class SubmitOrderErrorsTests(MockedPayPalTests):
         self.assertEqual(error, "A problem occurred while processing payment for this "
                                 "order - no payment has been taken.  Please "
                                 "contact customer services if this problem persists")
+
+
+class ShippingOptionsTests(TestCase):
+    fixtures = ['countries.json']
+
+    def setUp(self):
+        product = create_product(price=D('10.00'), num_in_stock=1)
+        self.client.post(reverse('basket:add', kwargs={'pk': product.pk}), {'quantity': 1})
+        self.basket = Basket.objects.get()
+        self.basket.strategy = Selector().strategy()
+        self.url = reverse('paypal-shipping-options', kwargs={'basket_id': self.basket.id})
+        self.address = {'SHIPTOCOUNTRY': 'GB', 'SHIPTOSTATE': 'London', 'SHIPTOZIP': 'SW7 4TU', 'CURRENCYCODE': 'GBP'}
+
+    def set_txn(self):
+        with patch('paypal.express.gateway._fetch_response'):
+            gateway.set_txn(self.basket, [Free()], 'GBP', 'http://testserver/success',
+                            'http://testserver/cancel', update_url='http://testserver' + self.url)
+
+    def get_options(self, **data):
+        response = self.client.post(self.url, dict(self.address, **data))
+        return dict(parse_qsl(force_text(response.content)))
+
+    def test_returns_shipping_options(self):
+        options = self.get_options()
+        self.assertEqual('Royal Mail Signed For™ 2nd Class', options['L_SHIPPINGOPTIONNAME0'])
+        self.assertEqual('0.00', options['L_SHIPPINGOPTIONAMOUNT0'])
+        self.assertEqual('1', options['L_SHIPPINGOPTIONISDEFAULT0'])
+
+    def count_calculations(self, **data):
+        with patch.object(Repository, 'get_shipping_methods', autospec=True,
+                          return_value=[SecondClassRecorded()]) as get_shipping_methods:
+            with CaptureQueriesContext(connection) as queries:
+                self.get_options(**data)
+        country_queries = [query for query in queries if 'address_country' in query['sql']]
+        return get_shipping_methods.call_count, len(country_queries)
+
+    def test_repeated_destination_is_answered_from_the_cache(self):
+        self.set_txn()
+        self.assertEqual((1, 1), self.count_calculations())
+        self.assertEqual((0, 0), self.count_calculations(SHIPTOZIP='SW7 1AA'))
+        # Countries are cached too
+        self.assertEqual((1, 0), self.count_calculations(SHIPTOZIP='E1 6AN'))
+
+    def test_nothing_is_kept_without_set_txn(self):
+        self.get_options()
+        self.assertEqual(1, self.count_calculations()[0])
+
+    def test_new_set_txn_discards_the_quotes(self):
+        self.set_txn()
+        self.get_options()
+        self.set_txn()
+        self.assertEqual(1, self.count_calculations()[0])
+
+    def test_falls_back_to_set_txn_quotes_when_out_of_time(self):
+        self.set_txn()
+        with override_settings(PAYPAL_SHIPPING_QUOTE_BUDGET=-1):
+            options = self.get_options()
+        self.assertEqual('Free shipping', options['L_SHIPPINGOPTIONNAME0'])
@@ -1,10 +1,12 @@
 from decimal import Decimal as D
 from unittest.mock import patch
 
+from asgiref.sync import async_to_sync
+from django.core.signals import request_finished, request_started
 from django.test import TestCase
 from paypalhttp.http_response import construct_object
 
-from paypal.express_checkout.facade import refund_order
+from paypal.express_checkout.facade import async_refund_order, fetch_transaction_details, refund_order
 from paypal.express_checkout.models import ExpressCheckoutTransaction
 
 from .mocked_data import REFUND_ORDER_DATA_MINIMAL
@@ -26,7 +28,7 @@ class FacadeTests(TestCase):
         )
 
     def test_refund_order(self):
-        with patch('paypal.express_checkout.facade.PaymentProcessor.refund_order') as mocked_refund_order:
+        with patch('paypal.express_checkout.gateway.PaymentProcessor.refund_order') as mocked_refund_order:
             mocked_refund_order.return_value = construct_object('Result', REFUND_ORDER_DATA_MINIMAL)
 
             refund_order('4MW805572N795704B')
@@ -35,3 +37,46 @@ class FacadeTests(TestCase):
             assert self.txn.refund_id == '0SM71185A67927728'
 
             mocked_refund_order.assert_called_once_with('45315376249711632', D('0.99'), 'GBP')
+
+    def test_async_refund_order(self):
+        async def mocked_refund_order(*args):
+            return construct_object('Result', REFUND_ORDER_DATA_MINIMAL)
+
+        with patch('paypal.express_checkout.gateway.AsyncPaymentProcessor.refund_order') as mocked_refund:
+            mocked_refund.side_effect = mocked_refund_order
+
+            async_to_sync(async_refund_order)('4MW805572N795704B')
+
+            self.txn.refresh_from_db()
+            assert self.txn.refund_id == '0SM71185A67927728'
+
+            mocked_refund.assert_called_once_with('45315376249711632', D('0.99'), 'GBP')
+
+
+class IdentityMapTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        ExpressCheckoutTransaction.objects.create(
+            order_id='4MW805572N795704B',
+            payer_id='0000000000001',
+            amount=D('0.99'),
+            currency='GBP',
+            status=ExpressCheckoutTransaction.APPROVED,
+            intent=ExpressCheckoutTransaction.CAPTURE,
+        )
+
+    def test_transaction_is_loaded_once_per_request(self):
+        request_started.send(sender=self.__class__)
+        try:
+            with self.assertNumQueries(1):
+                first = fetch_transaction_details('4MW805572N795704B')
+                second = fetch_transaction_details('4MW805572N795704B')
+        finally:
+            request_finished.send(sender=self.__class__)
+        self.assertIs(first, second)
+
+    def test_transactions_are_not_cached_outside_requests(self):
+        with self.assertNumQueries(2):
+            fetch_transaction_details('4MW805572N795704B')
+            fetch_transaction_details('4MW805572N795704B')
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import httpx
+from django.test import TestCase
+from paypalhttp.http_error import HttpError
+
+from paypal.express_checkout.gateway import AsyncPaymentProcessor, PaymentProcessor, get_payment_processor
+
+from .mocked_data import GET_ORDER_RESULT_DATA
+
+
+def create_mock_response(data):
+    response = Mock()
+    response.status_code = 200
+    response.text = json.dumps(data)
+    response.headers = {'Content-Type': 'application/json'}
+    return response
+
+
+class PayPalClientTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token_requests = 0
+        self.processor = PaymentProcessor()
+
+    def fake_request(self, method, url, **kwargs):
+        if url.endswith('/v1/oauth2/token'):
+            self.token_requests += 1
+            return create_mock_response({
+                'access_token': 'A21AAF', 'expires_in': 32400, 'token_type': 'Bearer'})
+        assert kwargs['headers']['Authorization'] == 'Bearer A21AAF'
+        return create_mock_response(GET_ORDER_RESULT_DATA)
+
+    def test_access_token_is_reused(self):
+        with patch('requests.Session.request', side_effect=self.fake_request):
+            self.processor.get_order('4MW805572N795704B')
+            self.processor.get_order('4MW805572N795704B')
+
+        assert self.token_requests == 1
+
+    def test_access_token_is_refreshed_before_expiry(self):
+        with patch('requests.Session.request', side_effect=self.fake_request):
+            self.processor.get_order('4MW805572N795704B')
+            self.processor.client._access_token.created_at = time.time() - 32400 + 30
+            self.processor.get_order('4MW805572N795704B')
+
+        assert self.token_requests == 2
+
+    def test_access_token_is_requested_once_under_concurrency(self):
+        with patch('requests.Session.request', side_effect=self.fake_request):
+            threads = [
+                threading.Thread(target=self.processor.get_order, args=('4MW805572N795704B',))
+                for __ in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert self.token_requests == 1
+
+    @patch('paypal.gateway.time.sleep')
+    def test_get_order_is_retried(self, sleep):
+        responses = [Mock(status_code=503, text='', headers={})]
+
+        def fake_request(method, url, **kwargs):
+            if responses and not url.endswith('/v1/oauth2/token'):
+                return responses.pop()
+            return self.fake_request(method, url, **kwargs)
+
+        with patch('requests.Session.request', side_effect=fake_request) as request:
+            result = self.processor.get_order('4MW805572N795704B')
+
+        assert result.id == '4MW805572N795704B'
+        assert request.call_count == 3
+        assert sleep.call_count == 1
+
+    def test_capture_is_not_retried(self):
+        def fake_request(method, url, **kwargs):
+            if url.endswith('/v1/oauth2/token'):
+                return self.fake_request(method, url, **kwargs)
+            return Mock(status_code=503, text='', headers={})
+
+        with patch('requests.Session.request', side_effect=fake_request) as request:
+            with self.assertRaises(HttpError):
+                self.processor.capture_order('4MW805572N795704B', 'CAPTURE')
+
+        assert request.call_count == 2
+        assert request.call_args[1]['timeout'] == (5.0, 30.0)
+
+
+class PaymentProcessorRegistryTests(TestCase):
+
+    def test_processor_is_shared(self):
+        assert get_payment_processor() is get_payment_processor()
+
+    def test_processor_depends_on_credentials(self):
+        processor = get_payment_processor()
+        with self.settings(PAYPAL_CLIENT_ID='another-client'):
+            assert get_payment_processor() is not processor
+
+
+class AsyncPaymentProcessorTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token_requests = 0
+        self.processor = AsyncPaymentProcessor()
+
+    def run_in_new_loop(self, coroutine):
+        # Like asyncio.run(), which needs Python 3.7
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def handle_request(self, request):
+        if request.url.path == '/v1/oauth2/token':
+            self.token_requests += 1
+            return httpx.Response(200, json={
+                'access_token': 'A21AAF', 'expires_in': 32400, 'token_type': 'Bearer'})
+        assert request.headers['Authorization'] == 'Bearer A21AAF'
+        return httpx.Response(200, json=GET_ORDER_RESULT_DATA)
+
+    def test_get_order(self):
+        async def get_orders():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle_request))
+            with patch('paypal.gateway.get_async_client', return_value=client):
+                return await asyncio.gather(*[
+                    self.processor.get_order('4MW805572N795704B') for __ in range(5)])
+
+        results = self.run_in_new_loop(get_orders())
+
+        assert [result.id for result in results] == ['4MW805572N795704B'] * 5
+        assert self.token_requests == 1
+
+    def test_token_can_be_refreshed_in_another_event_loop(self):
+        async def handle_request(request):
+            # Let the other coroutines queue up on the token lock
+            await asyncio.sleep(0)
+            return self.handle_request(request)
+
+        async def get_orders():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handle_request))
+            with patch('paypal.gateway.get_async_client', return_value=client):
+                return await asyncio.gather(*[
+                    self.processor.get_order('4MW805572N795704B') for __ in range(5)])
+
+        # The processor is shared by the process, eg by each request's loop
+        # under async_to_sync
+        self.run_in_new_loop(get_orders())
+        self.processor.client._access_token.created_at = time.time() - 32400
+        self.run_in_new_loop(get_orders())
+
+        assert self.token_requests == 2
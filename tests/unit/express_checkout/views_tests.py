@@ -12,6 +12,7 @@ from paypalhttp.http_error import HttpError
 from paypalhttp.http_response import construct_object
 
 from paypal.express_checkout.models import ExpressCheckoutTransaction
+from paypal.gateway import DeadlineExceeded, get_time_left
 from tests.shipping.methods import SecondClassRecorded
 
 from .mocked_data import CAPTURE_ORDER_RESULT_DATA_MINIMAL, CREATE_ORDER_RESULT_DATA_MINIMAL, GET_ORDER_RESULT_DATA
@@ -84,6 +85,57 @@ class RedirectToPayPalTests(BasketMixin, TestCase):
             response = self.client.get(self.url)
             assert reverse('basket:summary') == response.url
 
+    @override_settings(PAYPAL_CHECKOUT_DEADLINE=5)
+    def test_deadline_applies_to_the_calls_made(self):
+        def create_order(*args, **kwargs):
+            assert 0 < get_time_left() <= 5
+            raise DeadlineExceeded()
+
+        with patch('paypal.express_checkout.gateway.PaymentProcessor.create_order', side_effect=create_order):
+            self.add_product_to_basket()
+            response = self.client.get(self.url)
+            assert reverse('basket:summary') == response.url
+        assert get_time_left() is None
+
+
+class RetryCheckoutTests(BasketMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Like PayPal, answer a repeated request ID with the order it created
+        self.orders = {}
+        patcher = patch('paypal.express_checkout.gateway.PayPalClient.execute', side_effect=self.execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def execute(self, request):
+        request_id = request.headers['PayPal-Request-Id']
+        if request_id not in self.orders:
+            order_id = 'ORDER%d' % (len(self.orders) + 1)
+            data = dict(CREATE_ORDER_RESULT_DATA_MINIMAL, id=order_id, links=[
+                {'href': 'https://www.sandbox.paypal.com/checkoutnow?token=%s' % order_id, 'rel': 'approve'}])
+            self.orders[request_id] = construct_object('Result', data)
+        return Mock(result=self.orders[request_id])
+
+    def redirect(self):
+        return self.client.get(reverse('express-checkout-redirect')).url
+
+    def test_checkout_after_cancel_creates_a_new_order(self):
+        self.add_product_to_basket()
+        assert self.redirect().endswith('token=ORDER1')
+        basket = Basket.objects.get()
+        self.client.get(reverse('express-checkout-cancel-response', kwargs={'basket_id': basket.id}))
+
+        assert self.redirect().endswith('token=ORDER2')
+        assert 2 == ExpressCheckoutTransaction.objects.count()
+
+    def test_repeated_redirect_reuses_the_order(self):
+        self.add_product_to_basket()
+        assert self.redirect().endswith('token=ORDER1')
+        Basket.objects.update(status=Basket.OPEN)
+        assert self.redirect().endswith('token=ORDER1')
+        assert 1 == ExpressCheckoutTransaction.objects.count()
+
 
 class PreviewOrderTests(BasketMixin, TestCase):
     fixtures = ['countries.json']
@@ -1,7 +1,14 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest import mock
 
+import httpx
+import requests
+from asgiref.sync import async_to_sync
 from django.test import TestCase
 
+from paypal import exceptions, gateway
 from paypal.gateway import post
 
 # Fixtures
@@ -11,7 +18,7 @@ ERROR_RESPONSE = 'RESULT=126&PNREF=V25A2BB645A7&RESPMSG=Under review by Fraud Se
 class TestErrorResponse(TestCase):
 
     def setUp(self):
-        with mock.patch('requests.post') as mock_post:
+        with mock.patch('requests.Session.post') as mock_post:
             response = mock.Mock()
             response.status_code = 200
             response.text = ERROR_RESPONSE
@@ -38,3 +45,195 @@ class TestErrorResponse(TestCase):
                     '_response_time']
         for key in expected:
             self.assertTrue(key in self.pairs)
+
+
+class TestAsyncPost(TestCase):
+
+    def test_returns_same_pairs_as_post(self):
+        client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, text=ERROR_RESPONSE)))
+        with mock.patch('paypal.gateway.get_async_client', return_value=client):
+            pairs = async_to_sync(gateway.async_post)('http://example.com', {'METHOD': 'DoVoid'})
+        self.assertEqual('V25A2BB645A7', pairs['PNREF'])
+        self.assertEqual('METHOD=DoVoid', pairs['_raw_request'])
+        self.assertEqual(ERROR_RESPONSE, pairs['_raw_response'])
+        self.assertTrue('_response_time' in pairs)
+
+    def test_non_200_response_raises_exception(self):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(500)))
+        with mock.patch('paypal.gateway.get_async_client', return_value=client):
+            with self.assertRaises(exceptions.PayPalError):
+                async_to_sync(gateway.async_post)('http://example.com', {})
+
+
+def create_mock_response(status_code=200, text='ACK=Success'):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.text = text
+    return response
+
+
+@mock.patch('paypal.gateway.time.sleep')
+class TestTimeoutsAndRetries(TestCase):
+
+    def test_requests_have_default_timeouts(self, sleep):
+        with mock.patch('requests.Session.post', return_value=create_mock_response()) as mock_post:
+            post('http://example.com', {})
+        self.assertEqual(gateway.DEFAULT_TIMEOUT, mock_post.call_args[1]['timeout'])
+
+    def test_timeouts_can_be_set_per_method(self, sleep):
+        with self.settings(PAYPAL_HTTP_TIMEOUT=10, PAYPAL_HTTP_TIMEOUTS={'DoVoid': (1, 2)}):
+            self.assertEqual((1, 2), gateway.get_timeout('DoVoid'))
+            self.assertEqual((10, 10), gateway.get_timeout('DoCapture'))
+
+    def test_idempotent_methods_are_retried(self, sleep):
+        responses = [requests.ConnectionError(), create_mock_response(503), create_mock_response()]
+        with mock.patch('requests.Session.post', side_effect=responses) as mock_post:
+            pairs = post('http://example.com', {}, method='GetExpressCheckoutDetails')
+        self.assertEqual('Success', pairs['ACK'])
+        self.assertEqual(3, mock_post.call_count)
+        self.assertEqual(2, sleep.call_count)
+
+    def test_retries_are_bounded(self, sleep):
+        with self.settings(PAYPAL_HTTP_RETRIES=1):
+            with mock.patch('requests.Session.post', side_effect=requests.Timeout()) as mock_post:
+                with self.assertRaises(gateway.ConnectionFailed):
+                    post('http://example.com', {}, method='GetExpressCheckoutDetails')
+        self.assertEqual(2, mock_post.call_count)
+
+    def test_other_methods_are_not_retried(self, sleep):
+        with mock.patch('requests.Session.post', side_effect=requests.ConnectionError()) as mock_post:
+            with self.assertRaises(gateway.ConnectionFailed):
+                post('http://example.com', {}, method='DoExpressCheckoutPayment')
+        self.assertEqual(1, mock_post.call_count)
+
+    def test_connection_errors_are_raised_as_paypal_errors(self, sleep):
+        error = requests.ReadTimeout()
+        with mock.patch('requests.Session.post', side_effect=error):
+            with self.assertRaises(exceptions.PayPalError) as cm:
+                post('http://example.com', {}, method='SetExpressCheckout')
+        self.assertIsInstance(cm.exception, gateway.ConnectionFailed)
+        self.assertIs(error, cm.exception.__cause__)
+
+    def test_async_transport_errors_are_raised_as_paypal_errors(self, sleep):
+        def handle_request(request):
+            raise httpx.ConnectError("Connection refused", request=request)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handle_request))
+        with mock.patch('paypal.gateway.get_async_client', return_value=client):
+            with self.assertRaises(gateway.ConnectionFailed) as cm:
+                async_to_sync(gateway.async_post)('http://example.com', {}, method='SetExpressCheckout')
+        self.assertIsInstance(cm.exception.__cause__, httpx.ConnectError)
+
+    def test_backoff_is_jittered_and_capped(self, sleep):
+        with self.settings(PAYPAL_HTTP_RETRY_BACKOFF=1, PAYPAL_HTTP_RETRY_BACKOFF_MAX=3):
+            with mock.patch('paypal.gateway.random.uniform', side_effect=lambda a, b: b) as uniform:
+                delays = [gateway.get_backoff(attempt) for attempt in range(4)]
+        self.assertEqual([1, 2, 3, 3], delays)
+        self.assertEqual(0, uniform.call_args[0][0])
+
+    def test_async_idempotent_methods_are_retried(self, sleep):
+        responses = [httpx.Response(502), httpx.Response(200, text='ACK=Success')]
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: responses.pop(0)))
+
+        async def no_sleep(delay):
+            pass
+
+        with mock.patch('paypal.gateway.get_async_client', return_value=client), \
+                mock.patch('paypal.gateway.asyncio.sleep', new=no_sleep):
+            pairs = async_to_sync(gateway.async_post)(
+                'http://example.com', {}, method='GetExpressCheckoutDetails')
+        self.assertEqual('Success', pairs['ACK'])
+        self.assertEqual([], responses)
+
+
+class TestDeadline(TestCase):
+
+    def test_timeouts_are_shortened_to_the_time_left(self):
+        with mock.patch('paypal.gateway.time.monotonic', return_value=100.0):
+            with gateway.deadline(3):
+                self.assertEqual((3, 3), gateway.get_timeout())
+                with gateway.deadline(10):
+                    # A nested deadline can't extend the enclosing one
+                    self.assertEqual((3, 3), gateway.get_timeout())
+            self.assertEqual(gateway.DEFAULT_TIMEOUT, gateway.get_timeout())
+
+    def test_calls_fail_once_the_deadline_has_passed(self):
+        with mock.patch('paypal.gateway.time.monotonic', side_effect=[100.0, 101.0]):
+            with gateway.deadline(1):
+                with self.assertRaises(gateway.DeadlineExceeded):
+                    post('http://example.com', {})
+
+    def test_no_retry_past_the_deadline(self):
+        with gateway.deadline(0.5), self.settings(PAYPAL_HTTP_RETRY_BACKOFF=10, PAYPAL_HTTP_RETRY_BACKOFF_MAX=10), \
+                mock.patch('paypal.gateway.random.uniform', return_value=5), \
+                mock.patch('requests.Session.post', side_effect=requests.ConnectionError()) as mock_post:
+            with self.assertRaises(gateway.ConnectionFailed):
+                post('http://example.com', {}, method='GetExpressCheckoutDetails')
+        self.assertEqual(1, mock_post.call_count)
+
+
+class TestPooledSession(TestCase):
+
+    def tearDown(self):
+        gateway.reset_session()
+
+    def test_session_is_shared(self):
+        self.assertIs(gateway.get_session(), gateway.get_session())
+
+    def test_session_is_rebuilt_when_settings_change(self):
+        session = gateway.get_session()
+        with self.settings(PAYPAL_HTTP_POOL_MAXSIZE=2):
+            self.assertIsNot(session, gateway.get_session())
+
+    def test_async_clients_are_closed_when_settings_change(self):
+        async def get_client():
+            return gateway.get_async_client()
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        client = loop.run_until_complete(get_client())
+        with self.settings(PAYPAL_HTTP_POOL_MAXSIZE=2):
+            self.assertTrue(client.is_closed)
+            self.assertIsNot(client, loop.run_until_complete(get_client()))
+
+    def test_host_pool_sizes_are_applied(self):
+        with self.settings(PAYPAL_HTTP_HOST_POOL_MAXSIZE={'https://api-3t.paypal.com': 25}):
+            adapter = gateway.get_session().get_adapter('https://api-3t.paypal.com/nvp')
+            self.assertEqual(25, adapter._pool_maxsize)
+            adapter = gateway.get_session().get_adapter('https://payflowpro.paypal.com')
+            self.assertEqual(10, adapter._pool_maxsize)
+
+    def test_connections_are_reused(self):
+        server = HTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:%s/nvp' % server.server_port
+            for __ in range(3):
+                post(url, {'METHOD': 'GetExpressCheckoutDetails'})
+            stats = gateway.get_pool_stats()
+        finally:
+            gateway.reset_session()
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        self.assertEqual(
+            {'requests': 3, 'hits': 2, 'misses': 1},
+            stats['http://127.0.0.1:%s' % server.server_port])
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = b'ACK=Success'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
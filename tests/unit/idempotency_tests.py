@@ -0,0 +1,172 @@
+import datetime
+from decimal import Decimal as D
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase
+from oscar.apps.payment import exceptions as payment_exceptions
+from oscar.apps.payment.models import Bankcard
+
+from paypal import idempotency
+from paypal.express import facade as express_facade
+from paypal.express_checkout.gateway import INTENT_CAPTURE, PaymentProcessor
+from paypal.payflow import facade as payflow_facade
+
+
+class RunOnceTests(TestCase):
+
+    def test_keys_are_stable_uuids(self):
+        key = idempotency.get_key(1, 'EC-123', 'DoExpressCheckoutPayment')
+        self.assertEqual(key, idempotency.get_key(1, 'EC-123', 'DoExpressCheckoutPayment'))
+        self.assertEqual(36, len(key))
+        self.assertNotEqual(key, idempotency.get_key(2, 'EC-123', 'DoExpressCheckoutPayment'))
+        self.assertNotEqual(key, idempotency.get_key(1, 'EC-123', 'DoCapture'))
+        self.assertNotEqual(key, idempotency.get_key(1, 'EC-123', 'DoExpressCheckoutPayment', D('10.00')))
+
+    def test_repeats_return_the_stored_result(self):
+        func = mock.Mock(return_value=SimpleNamespace(ok=True))
+        first = idempotency.run_once('key', lambda result: result.ok, func, 1, a=2)
+        second = idempotency.run_once('key', lambda result: result.ok, func, 1, a=2)
+        func.assert_called_once_with(1, a=2)
+        self.assertEqual(first, second)
+
+    def test_failed_calls_can_be_retried(self):
+        func = mock.Mock(side_effect=[SimpleNamespace(ok=False), SimpleNamespace(ok=True)])
+        self.assertFalse(idempotency.run_once('key', lambda result: result.ok, func).ok)
+        self.assertTrue(idempotency.run_once('key', lambda result: result.ok, func).ok)
+        self.assertEqual(2, func.call_count)
+
+    def test_exceptions_release_the_key(self):
+        func = mock.Mock(side_effect=[ValueError(), SimpleNamespace(ok=True)])
+        with self.assertRaises(ValueError):
+            idempotency.run_once('key', lambda result: result.ok, func)
+        self.assertTrue(idempotency.run_once('key', lambda result: result.ok, func).ok)
+
+    def test_concurrent_call_is_refused(self):
+        def func():
+            return idempotency.run_once('key', lambda result: True, mock.Mock())
+
+        with self.assertRaises(idempotency.OperationInProgress):
+            idempotency.run_once('key', lambda result: True, func)
+
+    def test_unstorable_result_is_returned(self):
+        result = mock.Mock()
+        with self.assertLogs('paypal.idempotency'):
+            self.assertIs(result, idempotency.run_once('key', lambda result: True, lambda: result))
+
+
+class ExpressDeduplicationTests(TestCase):
+
+    def test_repeated_confirmation_calls_paypal_once(self):
+        txn = SimpleNamespace(is_successful=True, token='EC-123')
+        with mock.patch('paypal.express.facade.do_txn', return_value=txn) as do_txn:
+            for __ in range(2):
+                result = express_facade.confirm_transaction('PAYER', 'EC-123', D('10.00'), 'GBP', basket_id=1)
+        self.assertEqual(1, do_txn.call_count)
+        self.assertEqual('EC-123', result.token)
+
+    def test_other_tokens_are_confirmed(self):
+        txn = SimpleNamespace(is_successful=True)
+        with mock.patch('paypal.express.facade.do_txn', return_value=txn) as do_txn:
+            express_facade.confirm_transaction('PAYER', 'EC-123', D('10.00'), 'GBP', basket_id=1)
+            express_facade.confirm_transaction('PAYER', 'EC-456', D('10.00'), 'GBP', basket_id=1)
+        self.assertEqual(2, do_txn.call_count)
+
+    def test_repeated_refund_of_an_amount_calls_paypal_once(self):
+        checkout_txn = SimpleNamespace(amount=D('10.00'), transaction_id='4CJ23957JN469504C')
+        txn = SimpleNamespace(is_successful=True)
+        with mock.patch('paypal.express.facade._get_checkout_transaction', return_value=checkout_txn), \
+                mock.patch('paypal.express.facade.refund_txn', return_value=txn) as refund_txn:
+            express_facade.refund_transaction('EC-123', D('4.00'), 'GBP')
+            express_facade.refund_transaction('EC-123', D('4.00'), 'GBP')
+            express_facade.refund_transaction('EC-123', D('6.00'), 'GBP')
+        self.assertEqual(2, refund_txn.call_count)
+        refund_txn.assert_called_with('4CJ23957JN469504C', True, D('6.00'), 'GBP')
+
+
+class PayflowDeduplicationTests(TestCase):
+
+    def setUp(self):
+        self.card = Bankcard(number='4111111111111111', name='John Doe', expiry_date=datetime.date(2030, 8, 1))
+
+    def test_repeated_authorization_calls_paypal_once(self):
+        txn = SimpleNamespace(is_approved=True, pnref='A10A6AE9E6C0')
+        with mock.patch('paypal.payflow.gateway.authorize', return_value=txn) as authorize:
+            for __ in range(2):
+                payflow_facade.authorize('100001', D('10.00'), self.card)
+        self.assertEqual(1, authorize.call_count)
+
+    def test_declined_authorization_can_be_retried(self):
+        declined = SimpleNamespace(is_approved=False, respmsg='Declined')
+        approved = SimpleNamespace(is_approved=True)
+        with mock.patch('paypal.payflow.gateway.authorize', side_effect=[declined, approved]) as authorize:
+            with self.assertRaises(payment_exceptions.UnableToTakePayment):
+                payflow_facade.authorize('100001', D('10.00'), self.card)
+            payflow_facade.authorize('100001', D('10.00'), self.card)
+        self.assertEqual(2, authorize.call_count)
+
+    def test_other_amounts_are_authorized(self):
+        txn = SimpleNamespace(is_approved=True)
+        with mock.patch('paypal.payflow.gateway.authorize', return_value=txn) as authorize:
+            payflow_facade.authorize('100001', D('10.00'), self.card)
+            payflow_facade.authorize('100001', D('12.00'), self.card)
+        self.assertEqual(2, authorize.call_count)
+
+    def test_repeated_credit_of_an_amount_calls_paypal_once(self):
+        txn = SimpleNamespace(is_approved=True)
+        with mock.patch('paypal.payflow.gateway.credit', return_value=txn) as credit:
+            payflow_facade.credit('100001', 'A10A6AE9E6C0', D('4.00'))
+            payflow_facade.credit('100001', 'A10A6AE9E6C0', D('4.00'))
+            payflow_facade.credit('100001', 'A10A6AE9E6C0', D('6.00'))
+        self.assertEqual(2, credit.call_count)
+
+    def test_repeated_reference_transaction_of_an_amount_calls_paypal_once(self):
+        txn = SimpleNamespace(is_approved=True)
+        with mock.patch('paypal.payflow.gateway.reference_transaction', return_value=txn) as reference_transaction:
+            payflow_facade.referenced_sale('100001', 'A10A6AE9E6C0', D('4.00'))
+            payflow_facade.referenced_sale('100001', 'A10A6AE9E6C0', D('4.00'))
+            payflow_facade.referenced_sale('100001', 'A10A6AE9E6C0', D('6.00'))
+        self.assertEqual(2, reference_transaction.call_count)
+
+    def test_delayed_captures_of_other_amounts_are_made(self):
+        txn = SimpleNamespace(is_approved=True)
+        with mock.patch('paypal.payflow.gateway.delayed_capture', return_value=txn) as delayed_capture:
+            payflow_facade.delayed_capture('100001', 'A10A6AE9E6C0', D('4.00'))
+            payflow_facade.delayed_capture('100001', 'A10A6AE9E6C0', D('4.00'))
+            payflow_facade.delayed_capture('100001', 'A10A6AE9E6C0', D('6.00'))
+        self.assertEqual(2, delayed_capture.call_count)
+
+
+class OrdersRequestIdTests(TestCase):
+
+    def setUp(self):
+        self.processor = PaymentProcessor()
+
+    def test_capture_sends_a_stable_request_id(self):
+        first = self.processor.get_capture_order_request('4MW805572N795704B', INTENT_CAPTURE)
+        second = self.processor.get_capture_order_request('4MW805572N795704B', INTENT_CAPTURE)
+        self.assertEqual(first.headers['PayPal-Request-Id'], second.headers['PayPal-Request-Id'])
+        other = self.processor.get_capture_order_request('5O190127TN364715T', INTENT_CAPTURE)
+        self.assertNotEqual(first.headers['PayPal-Request-Id'], other.headers['PayPal-Request-Id'])
+
+    def test_authorize_and_refund_send_request_ids(self):
+        authorize = self.processor.get_authorize_order_request('4MW805572N795704B')
+        refund = self.processor.get_refund_order_request('3C679366HH908993F', D('10.00'), 'GBP')
+        self.assertIn('PayPal-Request-Id', authorize.headers)
+        other_refund = self.processor.get_refund_order_request('3C679366HH908993F', D('5.00'), 'GBP')
+        self.assertNotEqual(refund.headers['PayPal-Request-Id'], other_refund.headers['PayPal-Request-Id'])
+
+    def test_created_order_request_id_depends_on_basket_contents(self):
+        body = {'intent': INTENT_CAPTURE, 'purchase_units': [{'amount': {'value': '10.00'}}]}
+        request_id = self.processor.get_create_order_request(body, basket_id=1).headers['PayPal-Request-Id']
+        self.assertEqual(
+            request_id, self.processor.get_create_order_request(dict(body), basket_id=1).headers['PayPal-Request-Id'])
+        body['purchase_units'][0]['amount']['value'] = '12.00'
+        self.assertNotEqual(
+            request_id, self.processor.get_create_order_request(body, basket_id=1).headers['PayPal-Request-Id'])
+
+    def test_created_order_request_id_depends_on_attempt(self):
+        body = {'intent': INTENT_CAPTURE, 'purchase_units': [{'amount': {'value': '10.00'}}]}
+        first = self.processor.get_create_order_request(body, basket_id=1, attempt='a').headers['PayPal-Request-Id']
+        second = self.processor.get_create_order_request(body, basket_id=1, attempt='b').headers['PayPal-Request-Id']
+        self.assertNotEqual(first, second)
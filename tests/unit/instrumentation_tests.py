@@ -0,0 +1,162 @@
+import datetime
+from decimal import Decimal as D
+from unittest import mock, skipUnless
+
+import requests
+from django.test import TestCase
+
+from paypal import exceptions, gateway, instrumentation, signals
+from paypal.express import gateway as express_gateway
+from paypal.metrics import prometheus, statsd
+from paypal.payflow import gateway as payflow_gateway
+
+try:
+    from prometheus_client import CollectorRegistry
+except ImportError:
+    CollectorRegistry = None
+
+SUCCESS_RESPONSE = (
+    'TOKEN=EC%2d6469953681606921P&TIMESTAMP=2012%2d03%2d26T17%3a19%3a38Z&CORRELATIONID=50a8d895e928f'
+    '&ACK=Success&VERSION=60%2e0&BUILD=2649250')
+FAILURE_RESPONSE = (
+    'TIMESTAMP=2012%2d03%2d26T16%3a33%3a09Z&CORRELATIONID=3bea2076bb9c3&ACK=Failure&VERSION=0%2e000000'
+    '&BUILD=2649250&L_ERRORCODE0=10002&L_LONGMESSAGE0=Security%20header%20is%20not%20valid')
+
+
+def create_mock_response(body, status_code=200):
+    response = mock.Mock()
+    response.text = body
+    response.content = body.encode()
+    response.status_code = status_code
+    response.elapsed = datetime.timedelta(milliseconds=120)
+    return response
+
+
+class SignalTestCase(TestCase):
+
+    def setUp(self):
+        self.received = []
+        for signal in (signals.gateway_request_started, signals.gateway_response_received,
+                       signals.gateway_request_failed):
+            signal.connect(self.receiver)
+            self.addCleanup(signal.disconnect, self.receiver)
+
+    def receiver(self, signal, sender, **kwargs):
+        self.received.append((signal, sender, kwargs))
+
+
+class NoListenerTests(TestCase):
+
+    def test_calls_get_the_null_recorder(self):
+        self.assertIs(instrumentation.NULL_CALL, instrumentation.start_call('express', 'DoVoid', 'https://x/nvp'))
+
+
+class ExpressSignalTests(SignalTestCase):
+
+    def void(self, response):
+        with mock.patch('requests.Session.post', return_value=response):
+            return express_gateway.do_void('4CJ23957JN469504C')
+
+    def test_successful_call_sends_started_and_received(self):
+        self.void(create_mock_response(SUCCESS_RESPONSE))
+
+        (started, sender, kwargs), (received, _, response_kwargs) = self.received
+        self.assertIs(signals.gateway_request_started, started)
+        self.assertEqual('express', sender)
+        self.assertEqual({'method': 'DoVoid', 'host': 'api-3t.sandbox.paypal.com'}, kwargs)
+
+        self.assertIs(signals.gateway_response_received, received)
+        self.assertEqual(200, response_kwargs['status'])
+        self.assertTrue(response_kwargs['success'])
+        self.assertEqual(len(SUCCESS_RESPONSE), response_kwargs['response_bytes'])
+        self.assertGreater(response_kwargs['request_bytes'], 0)
+        self.assertEqual(
+            {'http', 'server', 'parse', 'save', 'total'}, set(response_kwargs['timings']))
+        self.assertEqual(120, response_kwargs['timings']['server'])
+
+    def test_declined_call_is_received_without_success(self):
+        with self.assertRaises(exceptions.PayPalError):
+            self.void(create_mock_response(FAILURE_RESPONSE))
+        signal, _, kwargs = self.received[-1]
+        self.assertIs(signals.gateway_response_received, signal)
+        self.assertFalse(kwargs['success'])
+
+    def test_http_error_sends_failed(self):
+        with self.assertRaises(exceptions.PayPalError):
+            self.void(create_mock_response('', status_code=500))
+        signal, _, kwargs = self.received[-1]
+        self.assertIs(signals.gateway_request_failed, signal)
+        self.assertEqual(500, kwargs['status'])
+        self.assertIsInstance(kwargs['exception'], exceptions.PayPalError)
+
+    def test_save_error_sends_failed(self):
+        with mock.patch('paypal.audit.save', side_effect=Exception("Database unavailable")):
+            with self.assertRaises(Exception):
+                self.void(create_mock_response(SUCCESS_RESPONSE))
+        signals_sent = [signal for signal, _, _ in self.received]
+        self.assertEqual([signals.gateway_request_started, signals.gateway_request_failed], signals_sent)
+
+    def test_connection_error_sends_failed(self):
+        with mock.patch('requests.Session.post', side_effect=requests.ConnectionError):
+            with self.assertRaises(gateway.ConnectionFailed):
+                express_gateway.do_void('4CJ23957JN469504C')
+        signal, _, kwargs = self.received[-1]
+        self.assertIs(signals.gateway_request_failed, signal)
+        self.assertIsNone(kwargs['status'])
+        self.assertIn('total', kwargs['timings'])
+
+
+class PayflowSignalTests(SignalTestCase):
+
+    def test_method_is_the_transaction_type(self):
+        response = create_mock_response('RESULT=0&PNREF=V19A3D27B61E&RESPMSG=Approved')
+        with mock.patch('requests.Session.post', return_value=response):
+            payflow_gateway.void('1234', 'V19A3D27B61E')
+        _, sender, kwargs = self.received[-1]
+        self.assertEqual('payflow', sender)
+        self.assertEqual('V', kwargs['method'])
+        self.assertTrue(kwargs['success'])
+
+    def test_request_size_is_in_bytes(self):
+        response = create_mock_response('RESULT=0&PNREF=V19A3D27B61E&RESPMSG=Approved')
+        with mock.patch('requests.Session.post', return_value=response) as post:
+            payflow_gateway.void('Zoë-1234', 'V19A3D27B61E')
+        payload = post.call_args[0][1]
+        self.assertEqual(len(payload) + 1, self.received[-1][2]['request_bytes'])
+
+
+class StatsdAdapterTests(TestCase):
+
+    def test_records_timings_and_outcome(self):
+        client = mock.Mock()
+        statsd.connect(client)
+        self.addCleanup(statsd.disconnect)
+        response = create_mock_response('RESULT=12&PNREF=V19A3D27B61E&RESPMSG=Declined')
+        with mock.patch('requests.Session.post', return_value=response):
+            payflow_gateway.credit('1234', 'V19A3D27B61E', D('10.00'))
+
+        client.incr.assert_called_once_with('payflow.C.declined')
+        timers = [args[0] for args, kwargs in client.timing.call_args_list]
+        self.assertIn('payflow.C.server', timers)
+        self.assertIn('payflow.C.total', timers)
+
+
+@skipUnless(CollectorRegistry, "prometheus_client is not installed")
+class PrometheusAdapterTests(TestCase):
+
+    def test_metrics_are_created_in_each_registry(self):
+        registry, other_registry = CollectorRegistry(), CollectorRegistry()
+        self.assertIs(prometheus.get_metrics(registry), prometheus.get_metrics(registry))
+        self.assertIsNot(prometheus.get_metrics(registry), prometheus.get_metrics(other_registry))
+
+    def test_records_outcome_in_the_connected_registry(self):
+        registry = CollectorRegistry()
+        prometheus.connect(registry)
+        self.addCleanup(prometheus.disconnect)
+        response = create_mock_response('RESULT=12&PNREF=V19A3D27B61E&RESPMSG=Declined')
+        with mock.patch('requests.Session.post', return_value=response):
+            payflow_gateway.credit('1234', 'V19A3D27B61E', D('10.00'))
+
+        labels = {'integration': 'payflow', 'method': 'C', 'host': 'pilot-payflowpro.paypal.com',
+                  'outcome': 'declined'}
+        self.assertEqual(1, registry.get_sample_value('paypal_gateway_requests_total', labels))
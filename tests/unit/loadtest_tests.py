@@ -0,0 +1,64 @@
+import threading
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from oscar.apps.order.models import Order
+from oscar.test.factories import create_product
+
+from paypal import gateway, loadtest, stub
+
+
+class LoadTestTests(TransactionTestCase):
+    # The virtual users' threads have database connections of their own, so
+    # the data has to be committed.  There is a single user, as SQLite's
+    # in-memory test database doesn't take concurrent writes.
+    fixtures = ['countries.json']
+
+    def setUp(self):
+        self.product = create_product(num_in_stock=100)
+        self.server = stub.StubServer(('127.0.0.1', 0))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        settings = self.settings(**self.server.get_settings())
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(gateway.reset_session)
+
+    def run_load(self, flow):
+        return loadtest.LoadTest(flow, self.product, self.server.url, users=1, checkouts=3).run()
+
+    def assert_all_completed(self, results, steps=loadtest.STEPS):
+        self.assertEqual(3, results['completed'])
+        for step in steps:
+            summary = results['steps'][step]
+            self.assertEqual(3, summary['count'], step)
+            self.assertEqual(0, summary['errors'], step)
+            self.assertGreater(summary['p99'], 0)
+        self.assertEqual(3, Order.objects.count())
+
+    def test_express_checkouts(self):
+        self.assert_all_completed(self.run_load(loadtest.EXPRESS))
+
+    def test_express_checkout_checkouts(self):
+        self.assert_all_completed(self.run_load(loadtest.EXPRESS_CHECKOUT))
+
+    def test_buyer_pays_on_paypal(self):
+        with self.settings(PAYPAL_BUYER_PAYS_ON_PAYPAL=True):
+            results = self.run_load(loadtest.EXPRESS)
+        self.assert_all_completed(results, steps=loadtest.STEPS[:-1])
+        self.assertEqual(0, results['steps']['place_order']['count'])
+
+    def test_failed_step_ends_checkout(self):
+        self.server.error_rate = 1.0
+        results = self.run_load(loadtest.EXPRESS)
+        self.assertEqual(0, results['completed'])
+        self.assertEqual(3, results['steps']['redirect']['errors'])
+        self.assertEqual(0, results['steps']['paypal']['count'])
+
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            'paypal_load_test', users=1, checkouts=1, product=self.product.pk, stub_url=self.server.url, stdout=out)
+        self.assertIn("1 of 1 express checkouts completed by 1 users", out.getvalue())
@@ -0,0 +1,63 @@
+from decimal import Decimal as D
+from urllib.parse import parse_qs
+
+from django.test import RequestFactory, TestCase, override_settings
+
+from paypal.payflow import codes
+from paypal.payflow.dashboard.views import TransactionListView
+from paypal.payflow.models import PayflowTransaction
+
+
+@override_settings(PAYPAL_DASHBOARD_PAGE_SIZE=2)
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.txns = [
+            PayflowTransaction.objects.create(
+                comment1=str(100000 + i), trxtype=codes.SALE if i % 2 else codes.AUTHORIZATION,
+                amount=D('10.00') * (i + 1), pnref='V%d' % i, respmsg='Approved', result='0',
+                raw_request='', raw_response='', response_time=0)
+            for i in range(5)]
+        self.newest_first = sorted(self.txns, key=lambda txn: (txn.date_created, txn.pk), reverse=True)
+
+    def get_context(self, url):
+        view = TransactionListView()
+        view.setup(RequestFactory().get(url))
+        view.object_list = view.get_queryset()
+        return view.get_context_data()
+
+    def test_pages_can_be_walked_both_ways(self):
+        pages = []
+        ctx = self.get_context('/')
+        self.assertIsNone(ctx['previous_url'])
+        pages.append(ctx['transactions'])
+        while ctx['next_url']:
+            ctx = self.get_context('/' + ctx['next_url'])
+            pages.append(ctx['transactions'])
+
+        self.assertEqual([2, 2, 1], [len(page) for page in pages])
+        self.assertEqual(self.newest_first, [txn for page in pages for txn in page])
+
+        ctx = self.get_context('/' + ctx['previous_url'])
+        self.assertEqual(pages[1], ctx['transactions'])
+        self.assertIsNotNone(ctx['previous_url'])
+        ctx = self.get_context('/' + ctx['previous_url'])
+        self.assertEqual(pages[0], ctx['transactions'])
+        self.assertIsNone(ctx['previous_url'])
+
+    def test_filters_are_kept_in_page_links(self):
+        ctx = self.get_context('/?trxtype=%s' % codes.AUTHORIZATION)
+        self.assertTrue(all(txn.trxtype == codes.AUTHORIZATION for txn in ctx['transactions']))
+        self.assertEqual([codes.AUTHORIZATION], parse_qs(ctx['next_url'][1:])['trxtype'])
+
+    def test_amount_range(self):
+        ctx = self.get_context('/?amount_min=20&amount_max=30')
+        self.assertEqual({D('20.00'), D('30.00')}, {txn.amount for txn in ctx['transactions']})
+
+    def test_raw_fields_are_not_loaded(self):
+        ctx = self.get_context('/')
+        self.assertIn('raw_response', ctx['transactions'][0].get_deferred_fields())
+
+    def test_invalid_cursor_shows_first_page(self):
+        ctx = self.get_context('/?after=invalid')
+        self.assertEqual(self.newest_first[:2], ctx['transactions'])
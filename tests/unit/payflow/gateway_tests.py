@@ -1,6 +1,9 @@
 from decimal import Decimal as D
 from unittest import mock
+from unittest.mock import patch
 
+import httpx
+from asgiref.sync import async_to_sync
 from django.test import TestCase
 
 from paypal.payflow import gateway
@@ -84,3 +87,14 @@ class TestReferenceTransaction(TestCase):
             gateway.reference_transaction(order_number='12345',
                                           pnref='111222',
                                           amt=D('12.23'))
+
+
+class TestAsyncTransactions(TestCase):
+
+    def test_void_returns_a_txn_instance(self):
+        body = 'RESULT=0&PNREF=V19A2B9D6B2C&RESPMSG=Approved'
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, text=body)))
+        with patch('paypal.gateway.get_async_client', return_value=client):
+            txn = async_to_sync(gateway.async_void)(order_number='1234', pnref='V19A2B9D6B2B')
+        self.assertTrue(txn.is_approved)
+        self.assertEqual('V19A2B9D6B2C', txn.pnref)
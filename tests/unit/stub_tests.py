@@ -0,0 +1,136 @@
+import threading
+from decimal import Decimal as D
+from unittest.mock import Mock
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from django.test import TestCase
+from oscar.apps.shipping.methods import Free
+
+from paypal import exceptions, gateway, stub
+from paypal.express import gateway as express_gateway
+from paypal.express_checkout.gateway import INTENT_CAPTURE, PaymentProcessor
+from paypal.payflow import gateway as payflow_gateway
+
+
+def create_mock_basket(amt=D('10.00')):
+    basket = Mock()
+    basket.total_incl_tax = amt
+    basket.all_lines = Mock(return_value=[])
+    basket.offer_discounts = []
+    basket.voucher_discounts = []
+    basket.shipping_discounts = []
+    return basket
+
+
+class StubServerTestCase(TestCase):
+    server_options = {}
+
+    def setUp(self):
+        self.server = stub.StubServer(('127.0.0.1', 0), **self.server_options)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        settings = self.settings(**self.server.get_settings())
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Connections to the previous test's server can't be reused
+        self.addCleanup(gateway.reset_session)
+
+    def approve(self, url):
+        """
+        Follow a checkout URL and return the query of the return URL PayPal
+        redirects to.
+        """
+        response = requests.get(url, allow_redirects=False)
+        self.assertEqual(302, response.status_code)
+        return dict(parse_qsl(urlsplit(response.headers['Location']).query))
+
+
+class ExpressStubTests(StubServerTestCase):
+
+    def test_token_lifecycle(self):
+        url = express_gateway.set_txn(
+            create_mock_basket(), [Free()], 'GBP', 'http://localhost:8000/success', 'http://localhost:8000/error')
+        query = self.approve(url)
+
+        details = express_gateway.get_txn(query['token'])
+        self.assertEqual(query['PayerID'], details.value('PAYERID'))
+        self.assertEqual(D('10.00'), details.amount)
+
+        txn = express_gateway.do_txn(query['PayerID'], query['token'], details.amount, 'GBP')
+        self.assertTrue(txn.transaction_id)
+        refund = express_gateway.refund_txn(txn.transaction_id)
+        self.assertTrue(refund.value('REFUNDTRANSACTIONID'))
+
+        # A token can only be paid once
+        with self.assertRaises(exceptions.PayPalError):
+            express_gateway.do_txn(query['PayerID'], query['token'], details.amount, 'GBP')
+
+    def test_unapproved_token_cannot_be_paid(self):
+        url = express_gateway.set_txn(
+            create_mock_basket(), [Free()], 'GBP', 'http://localhost:8000/success', 'http://localhost:8000/error')
+        token = dict(parse_qsl(urlsplit(url).query))['token']
+        with self.assertRaises(exceptions.PayPalError):
+            express_gateway.do_txn('ABCDEF', token, D('10.00'), 'GBP')
+
+
+class PayflowStubTests(StubServerTestCase):
+
+    def test_authorization_can_only_be_captured_once(self):
+        txn = payflow_gateway.authorize('1234', '4111111111111111', '123', '1230', D('10.00'))
+        self.assertTrue(txn.is_approved)
+        capture = payflow_gateway.delayed_capture('1234', txn.pnref)
+        self.assertTrue(capture.is_approved)
+        self.assertFalse(payflow_gateway.delayed_capture('1234', txn.pnref).is_approved)
+        self.assertTrue(payflow_gateway.credit('1234', capture.pnref).is_approved)
+
+
+class OrdersStubTests(StubServerTestCase):
+
+    def test_order_lifecycle(self):
+        processor = PaymentProcessor()
+        result = processor.create_order(
+            create_mock_basket(), 'GBP', 'http://localhost:8000/success', 'http://localhost:8000/cancel',
+            D('10.00'), intent=INTENT_CAPTURE)
+        approve_url = [link.href for link in result.links if link.rel == 'approve'][0]
+        query = self.approve(approve_url)
+        self.assertEqual(result.id, query['token'])
+
+        order = processor.get_order(result.id)
+        self.assertEqual(query['PayerID'], order.payer.payer_id)
+        self.assertEqual('GB', order.purchase_units[0].shipping.address.country_code)
+
+        capture = processor.capture_order(result.id, INTENT_CAPTURE)
+        capture_id = capture.purchase_units[0].payments.captures[0].id
+        self.assertEqual('COMPLETED', processor.refund_order(capture_id, D('10.00'), 'GBP').status)
+
+
+class ErrorInjectionTests(StubServerTestCase):
+    server_options = {'error_rate': 1.0}
+
+    def test_api_errors_are_returned(self):
+        with self.assertRaises(exceptions.PayPalError):
+            express_gateway.set_txn(
+                create_mock_basket(), [Free()], 'GBP', 'http://localhost:8000/success',
+                'http://localhost:8000/error')
+        self.assertFalse(payflow_gateway.void('1234', 'V19A3D27B61E').is_approved)
+
+    def test_approval_pages_return_errors(self):
+        for path in ('/webscr', '/checkoutnow'):
+            response = requests.get(self.server.url + path, params={'token': 'EC-0123456789'}, allow_redirects=False)
+            self.assertEqual(500, response.status_code)
+
+
+class LatencyTests(TestCase):
+
+    def test_latencies_can_be_set_per_api(self):
+        latencies = stub.parse_latencies(['fixed:100', 'payflow=uniform:200,300'])
+        self.assertEqual(0.1, latencies[stub.NVP].sample(None))
+        self.assertTrue(0.2 <= latencies[stub.PAYFLOW].sample(stub.random.Random()) <= 0.3)
+
+    def test_invalid_specs_raise_value_error(self):
+        for spec in ('gamma:1', 'normal:1', 'fixed:x', 'paypal=fixed:1'):
+            with self.assertRaises(ValueError):
+                stub.parse_latencies([spec])
@@ -0,0 +1,64 @@
+import datetime
+from unittest import mock, skipUnless
+
+import requests
+from django.test import TestCase
+
+from paypal import gateway, tracing
+from paypal.express import facade
+
+try:
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from opentelemetry.trace import StatusCode
+except ImportError:
+    TracerProvider = None
+
+DETAILS_RESPONSE = (
+    'TOKEN=EC%2d6469953681606921P&CORRELATIONID=50a8d895e928f&ACK=Success&VERSION=60%2e0'
+    '&PAYMENTREQUEST_0_AMT=10%2e00&PAYMENTREQUEST_0_CURRENCYCODE=GBP')
+
+
+@skipUnless(TracerProvider, "OpenTelemetry SDK is not installed")
+class TracingTests(TestCase):
+
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+        # Tracing is enabled for these tests only, rather than by setting the
+        # global tracer provider
+        for patcher in (mock.patch.object(tracing, '_tracer', provider.get_tracer('paypal')),
+                        mock.patch.object(tracing, 'enabled', return_value=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_spans(self):
+        return {span.name: span for span in self.exporter.get_finished_spans()}
+
+    def test_facade_call_is_traced(self):
+        response = mock.Mock(
+            text=DETAILS_RESPONSE, content=DETAILS_RESPONSE.encode(), status_code=200,
+            elapsed=datetime.timedelta(milliseconds=80), headers={'Paypal-Debug-Id': '50a8d895e928f'})
+        with mock.patch('requests.Session.post', return_value=response):
+            facade.fetch_transaction_details('EC-6469953681606921P')
+
+        spans = self.get_spans()
+        facade_span = spans['paypal.express.facade.fetch_transaction_details']
+        call_span = spans['paypal.express GetExpressCheckoutDetails']
+        save_span = spans['paypal.audit.save']
+        self.assertEqual(facade_span.context.span_id, call_span.parent.span_id)
+        self.assertEqual(call_span.context.span_id, save_span.parent.span_id)
+        self.assertEqual(200, call_span.attributes['http.status_code'])
+        self.assertEqual('50a8d895e928f', call_span.attributes['paypal.debug_id'])
+        self.assertTrue(call_span.attributes['paypal.success'])
+
+    def test_failed_call_records_the_exception(self):
+        with mock.patch('requests.Session.post', side_effect=requests.ConnectionError):
+            with self.assertRaises(gateway.ConnectionFailed):
+                facade.fetch_transaction_details('EC-6469953681606921P')
+
+        call_span = self.get_spans()['paypal.express GetExpressCheckoutDetails']
+        self.assertEqual(StatusCode.ERROR, call_span.status.status_code)
+        self.assertEqual('exception', call_span.events[0].name)